@@ -1,13 +1,21 @@
 import config
+import cassette
 import database
 import scraper
 import llm_processor
+import llm_cache
+import llm_usage
+import metrics
+import http_store
+import document_ledger
+import exporters
+import run_checkpoint
 import ui
 import worker
 import logging
 import asyncio
-import aiohttp
-from itertools import chain
+import os
+import time
 
 def setup_main_logging():
     """Configura il logger per il processo principale."""
@@ -18,69 +26,245 @@ def setup_main_logging():
         filemode='w'
     )
 
-async def run_scraping_mode():
-    """Orchestra l'intero processo di scraping asincrono."""
+async def run_scraping_mode(resume=False):
+    """
+    Orchestra l'intero processo di scraping asincrono. Con `resume` riprende l'ultima scansione interrotta
+    con le stesse province e opzioni, saltando le pagine e gli articoli già completati.
+    """
     logger = logging.getLogger()
-    
-    provinces_to_scan = ui.get_provinces_to_scan()
-    if not provinces_to_scan: return
 
-    max_pages = ui.get_max_pages_to_scan()
-    print(f"\nAvvio della ricerca per le province selezionate (max {max_pages} pagine)...")
+    if resume:
+        checkpoint = run_checkpoint.find_interrupted_run()
+        if checkpoint is None:
+            print("\nNessuna scansione interrotta da riprendere.")
+            return
+        provinces_to_scan, max_pages, incremental = checkpoint.provinces, checkpoint.max_pages, checkpoint.incremental
+        print(f"\nRipresa della scansione del {time.strftime('%d/%m/%Y %H:%M', time.localtime(checkpoint.started_at))} "
+              f"({', '.join(provinces_to_scan)}, max {max_pages} pagine): {checkpoint.unfinished_count()} articoli da completare.")
+    else:
+        provinces_to_scan = ui.get_provinces_to_scan()
+        if not provinces_to_scan: return
 
-    models = config.setup_gemini()
-    if not models: return
+        max_pages = ui.get_max_pages_to_scan()
+        incremental = ui.ask_yes_no("Scansione incrementale (salta gli articoli già analizzati nelle scansioni precedenti)?", default=True)
+        print(f"\nAvvio della ricerca per le province selezionate (max {max_pages} pagine)...")
 
-    db_conn = database.create_connection()
-    if not db_conn: return
-
-    # --- FASE 1: Raccolta Parallela di tutti i link degli articoli ---
-    all_pages_to_scan = []
-    for page_num in range(1, max_pages + 1):
-        for provincia in provinces_to_scan:
-            base_url = config.SITES_CONFIG[provincia]['url']
-            current_url = f"{base_url.rstrip('/')}/page/{page_num}/" if page_num > 1 else base_url
-            all_pages_to_scan.append((current_url, provincia))
-    
-    LINK_COLLECTION_CONCURRENCY = 10
-    link_semaphore = asyncio.Semaphore(LINK_COLLECTION_CONCURRENCY)
-    
-    print(f"\n--- FASE 1: Raccolta link da {len(all_pages_to_scan)} pagine (max {LINK_COLLECTION_CONCURRENCY} parallele) ---")
-    
-    async with aiohttp.ClientSession() as session:
-        link_collection_tasks = [worker.fetch_and_extract_links_worker(link_semaphore, session, models, url, prov, logger) for url, prov in all_pages_to_scan]
-        results_of_link_collection = await asyncio.gather(*link_collection_tasks)
-
-    processed_urls = set()
-    all_article_tasks = []
-    for task_result in results_of_link_collection:
-        for url, prov in task_result:
-            if url not in processed_urls:
-                processed_urls.add(url)
-                all_article_tasks.append((url, prov))
-    
-    if not all_article_tasks:
-        print("\nNessun nuovo articolo da analizzare trovato.")
+    cassette_mode = cassette.configure_from_env()
+    if cassette_mode == cassette.MODE_RECORD:
+        print(f"Registrazione di risposte HTTP e Gemini nella cassetta {os.getenv(cassette.RECORD_ENV_VAR)}.")
+    elif cassette_mode == cassette.MODE_REPLAY:
+        print(f"Riproduzione dalla cassetta {os.getenv(cassette.REPLAY_ENV_VAR)}: nessuna richiesta di rete né chiamata a Gemini.")
+    models = cassette.wrap_models(config.setup_gemini)
+    if not models:
+        cassette.close()
         return
-        
-    # --- FASE 2: Esecuzione parallela controllata da semaforo ---
-    ARTICLE_ANALYSIS_CONCURRENCY = 50
+    if not resume:
+        checkpoint = run_checkpoint.start_run(provinces_to_scan, max_pages, incremental)
+    llm_usage.start_run(checkpoint.run_id)
+
+    # La connessione è usata dal writer della pipeline in un thread separato.
+    db_conn = database.create_connection(check_same_thread=False)
+    if not db_conn:
+        cassette.close()
+        return
+    http_store.reset_run_status()
+    document_ledger.reset_stats()
+    llm_cache.reset_stats()
+    metrics.reset()
+
+    known_urls_by_province = {}
+    for provincia in provinces_to_scan:
+        known_urls_by_province[provincia] = database.get_known_article_urls(db_conn, provincia) if incremental else set()
+
+    # --- PIPELINE: pagine elenco -> coda articoli -> analisi -> coda risultati -> database ---
+    # Le code sono limitate: se l'analisi o la scrittura rallentano, i produttori si fermano (backpressure).
+    LINK_COLLECTION_CONCURRENCY = config.LINK_COLLECTION_CONCURRENCY
+    ARTICLE_ANALYSIS_CONCURRENCY = config.ARTICLE_ANALYSIS_CONCURRENCY
+    ARTICLE_QUEUE_SIZE = ARTICLE_ANALYSIS_CONCURRENCY * 2
+    RESULT_QUEUE_SIZE = ARTICLE_ANALYSIS_CONCURRENCY * 2
+
+    link_semaphore = asyncio.Semaphore(LINK_COLLECTION_CONCURRENCY)
     analysis_semaphore = asyncio.Semaphore(ARTICLE_ANALYSIS_CONCURRENCY)
-    
-    print(f"\n--- FASE 2: Inizio Analisi di {len(all_article_tasks)} Articoli (max {ARTICLE_ANALYSIS_CONCURRENCY} in parallelo) ---")
-    
-    async with aiohttp.ClientSession() as session:
-        worker_tasks = [worker.process_single_article_worker(analysis_semaphore, session, models, url, prov, logger) for url, prov in all_article_tasks]
-        results_from_workers = await asyncio.gather(*worker_tasks)
-    
-    all_results = list(chain.from_iterable(results_from_workers))
-    print(f"\nRaccolti {len(all_results)} risultati totali.")
-    logger.info(f"Raccolti {len(all_results)} risultati totali.")
+    article_queue = asyncio.Queue(maxsize=ARTICLE_QUEUE_SIZE)
+    result_queue = asyncio.Queue(maxsize=RESULT_QUEUE_SIZE)
+    scheduled_urls = set()
 
-    for data in all_results:
-        database.insert_interpello(db_conn, data)
+    print(f"\n--- Scansione di {len(provinces_to_scan)} province: raccolta link (max {LINK_COLLECTION_CONCURRENCY} pagine parallele) "
+          f"e analisi articoli (max {ARTICLE_ANALYSIS_CONCURRENCY} in parallelo) in pipeline ---")
+
+    try:
+        async with scraper.create_session() as session:
+            metrics_task = asyncio.create_task(metrics.periodic_export({'article_queue': article_queue, 'result_queue': result_queue}, logger))
+            writer_task = asyncio.create_task(worker.database_writer_consumer(db_conn, result_queue, logger, checkpoint))
+            consumer_tasks = [
+                asyncio.create_task(worker.article_analysis_consumer(analysis_semaphore, session, models, article_queue, result_queue, logger, checkpoint))
+                for _ in range(ARTICLE_ANALYSIS_CONCURRENCY)
+            ]
+
+            async def crawl_and_analyse():
+                queued_counts = await asyncio.gather(*[
+                    worker.crawl_province_worker(link_semaphore, session, models, prov, max_pages, known_urls_by_province[prov], scheduled_urls, article_queue, logger, checkpoint)
+                    for prov in provinces_to_scan
+                ])
+                total = sum(queued_counts)
+                print(f"\nRaccolta link completata: {total} nuovi articoli accodati per l'analisi.")
+                logger.info(f"Raccolta link completata: {total} nuovi articoli accodati per l'analisi.")
+
+                for _ in consumer_tasks:
+                    await article_queue.put(None)
+                await asyncio.gather(*consumer_tasks)
+                await result_queue.put(None)
+                return total
+
+            producers_task = asyncio.create_task(crawl_and_analyse())
+            try:
+                # Si sorveglia anche il writer: se termina con un errore, i consumatori bloccati sulla coda dei
+                # risultati piena resterebbero in attesa fino alla fine della raccolta. Il suo errore ferma tutto.
+                await asyncio.wait([producers_task, writer_task], return_when=asyncio.FIRST_EXCEPTION)
+                if writer_task.done() and not producers_task.done():
+                    writer_task.result()
+                    raise RuntimeError("Il salvataggio nel database si è interrotto prima della fine della scansione.")
+                total_articles = producers_task.result()
+                write_totals = await writer_task
+            except BaseException:
+                for task in consumer_tasks + [producers_task, writer_task, metrics_task]:
+                    task.cancel()
+                await llm_processor.shutdown_batcher()
+                llm_usage.flush()
+                metrics.export()
+                # Anche una registrazione interrotta resta utilizzabile per le richieste già fatte.
+                cassette.close()
+                raise
+            metrics_task.cancel()
+            await llm_processor.shutdown_batcher()
+    finally:
+        db_conn.close()
+
+    if total_articles == 0:
+        print("\nNessun nuovo articolo da analizzare trovato.")
+    write_summary = (f"Salvataggio: {write_totals['inserted']} nuovi interpelli, {write_totals['duplicates']} duplicati ignorati, "
+                     f"{write_totals['rejected']} scartati.")
+    print(f"\n{write_summary}")
+    logger.info(write_summary)
+
+    failed = checkpoint.failed_count()
+    if failed:
+        print(f"{failed} articoli non sono stati analizzati dopo {run_checkpoint.MAX_ARTICLE_ATTEMPTS} tentativi: "
+              f"saranno ritentati dalla prossima scansione.")
+        logger.warning(f"{failed} articoli falliti definitivamente in questa scansione.")
+    unfinished = checkpoint.unfinished_count()
+    if unfinished:
+        # Articoli non analizzati o non salvati (es. quota esaurita): la scansione resta riprendibile.
+        print(f"{unfinished} articoli non sono stati completati: la scansione può essere ripresa dal menu principale.")
+        logger.info(f"{unfinished} articoli non completati: checkpoint della scansione conservato.")
+    elif llm_usage.budget_exhausted():
+        # Con il budget esaurito la paginazione può essersi fermata prima del previsto.
+        logger.info("Budget LLM esaurito: checkpoint della scansione conservato.")
+    else:
+        checkpoint.finish()
+
+    json_path, prom_path = metrics.export()
+    stage_metrics = metrics.snapshot()['stages']
+    if stage_metrics:
+        print("\nTempi per fase (ordinati per tempo totale):")
+        for stage, m in sorted(stage_metrics.items(), key=lambda item: -item[1]['sum_seconds']):
+            stage_line = (f"  {stage}: {m['count']} esecuzioni, totale {m['sum_seconds']:.1f}s, p50 {m['p50_seconds']:.2f}s, "
+                          f"p95 {m['p95_seconds']:.2f}s, {m['errors']} errori")
+            print(stage_line)
+            logger.info(stage_line)
+        print(f"Metriche esportate in {json_path} e {prom_path}.")
+
+    llm_usage.flush()
+    usage_summary = llm_usage.get_summary()
+    total_usage = usage_summary['total']
+    if total_usage:
+        token_summary = (f"Consumo LLM: {total_usage['calls']} chiamate, {total_usage['input_tokens']} token di input, "
+                         f"{total_usage['output_tokens']} di output, costo stimato ${total_usage['cost_usd']:.2f}.")
+        print(f"\n{token_summary}")
+        logger.info(token_summary)
+        for group, label in [('model', "modello"), ('phase', "fase"), ('provincia', "provincia"), ('prompt', "prompt")]:
+            for name, entry in sorted(usage_summary[group].items(), key=lambda item: -item[1]['cost_usd']):
+                line = (f"  {label} {name or 'non attribuita'}: {entry['calls']} chiamate, "
+                        f"{entry['input_tokens'] + entry['output_tokens']} token, ${entry['cost_usd']:.2f}, "
+                        f"latenza media {entry['latency'] / entry['calls']:.1f}s")
+                if group != 'prompt':
+                    print(line)
+                logger.info(line)
+    if usage_summary['budget_reached']:
+        budget_message = "Budget LLM raggiunto: la scansione è stata fermata e può essere ripresa dal menu principale."
+        print(budget_message)
+        logger.warning(budget_message)
+
+    cache_stats = llm_cache.get_stats()
+    cache_summary = (f"Cache LLM: {cache_stats['hits']} hit, {cache_stats['misses']} miss "
+                     f"({cache_stats['hit_rate']:.0%}), {cache_stats['stores']} nuove risposte salvate.")
+    print(cache_summary)
+    logger.info(cache_summary)
+
+    for model_key, status in llm_processor.get_rate_limit_status().items():
+        rate_summary = (f"Quota Gemini ({model_key}): {status['calls']} chiamate, {status['tokens_used']} token, "
+                        f"{status['waits']} attese ({status['wait_seconds']:.0f}s), {status['quota_errors']} errori di quota.")
+        print(rate_summary)
+        logger.info(rate_summary)
+
+    batch_stats = llm_processor.get_batch_stats()
+    if batch_stats['batches']:
+        batch_summary = f"Analisi a lotti: {batch_stats['batched_docs']} pagine analizzate in {batch_stats['batches']} richieste."
+        print(batch_summary)
+        logger.info(batch_summary)
+
+    cascade_stats = llm_processor.get_cascade_stats()
+    if cascade_stats['documents']:
+        saved = cascade_stats['seconds_saved']
+        saved_text = f"{saved:.0f}s di chiamate risparmiati (stima)" if saved is not None else "risparmio non stimabile senza estrazioni potenti"
+        cascade_summary = (f"Cascata di estrazione: {cascade_stats['accepted']} documenti su {cascade_stats['documents']} accettati dal modello veloce, "
+                           f"{cascade_stats['escalated']} passati al modello potente ({cascade_stats['escalation_rate']:.0%}); {saved_text}.")
+        print(cascade_summary)
+        logger.info(cascade_summary)
+
+    for prompt_name, stats in sorted(llm_processor.get_parse_stats().items()):
+        failure_rate = stats['parse_failures'] / stats['calls'] if stats['calls'] else 0
+        parse_summary = (f"Risposte {prompt_name}: {stats['calls']} analizzate, {stats['parse_failures']} non JSON "
+                         f"({failure_rate:.0%}), {stats['json_repairs']} JSON corretti, {stats['field_repairs']} campi corretti, "
+                         f"{stats['repair_failures']} correzioni non riuscite.")
+        print(parse_summary)
+        logger.info(parse_summary)
+
+    pool_stats = scraper.get_pool_stats()
+    pool_summary = (f"Pool HTTP: {pool_stats['requests']} richieste, {pool_stats['new_connections']} nuove connessioni, "
+                    f"{pool_stats['reused_connections']} riutilizzate ({pool_stats['reuse_rate']:.0%}).")
+    print(pool_summary)
+    logger.info(pool_summary)
+    for host, counts in sorted(pool_stats['per_host'].items(), key=lambda item: str(item[0])):
+        logger.info(f"Pool HTTP {host}: {counts['requests']} richieste, {counts['new_connections']} nuove connessioni, "
+                    f"{counts['reused_connections']} riutilizzate.")
+
+    ledger_stats = document_ledger.get_stats()
+    ledger_summary = (f"Documenti: {ledger_stats['extracted']} elaborati con l'LLM, "
+                      f"{ledger_stats['reused']} riconosciuti come già elaborati e riutilizzati, "
+                      f"{ledger_stats['not_modified']} non riscaricati perché invariati.")
+    print(ledger_summary)
+    logger.info(ledger_summary)
+
+    http_summary = http_store.get_run_summary()
+    fetch_summary = (f"Risorse HTTP: {http_summary['new']} nuove, {http_summary['changed']} modificate, "
+                     f"{http_summary['unchanged']} invariate rispetto alla scansione precedente.")
+    print(fetch_summary)
+    logger.info(fetch_summary)
+
+    if cassette.is_active():
+        cassette_stats = cassette.get_stats()
+        was_replaying = cassette.is_replaying()
+        saved_path = cassette.close()
+        if was_replaying:
+            cassette_summary = (f"Cassetta: {cassette_stats['http_replayed']} risposte HTTP e {cassette_stats['llm_replayed']} "
+                                f"risposte Gemini riprodotte, {cassette_stats['misses']} richieste non presenti.")
+        else:
+            cassette_summary = (f"Cassetta salvata in {saved_path}: {cassette_stats['http_recorded']} risposte HTTP "
+                                f"e {cassette_stats['llm_recorded']} risposte Gemini registrate.")
+        print(cassette_summary)
+        logger.info(cassette_summary)
 
-    db_conn.close()
     print("\nProcesso di scraping e analisi completato!")
     logger.info("\nProcesso di scraping e analisi completato!")
 
@@ -92,15 +276,19 @@ def run_database_mode():
         return
     
     print("\nRecupero tutti gli interpelli salvati (ordinati per Provincia)...")
-    last_displayed_rows = database.get_all_interpelli(db_conn)
-    ui.print_results(last_displayed_rows)
+    current_view = database.InterpelliPager(db_conn)
+    ui.print_results(current_view)
 
     while True:
         print("\n--- Menu Filtri ---")
         print(" 1: Filtra per Classe di Concorso (singola)")
         print(" 2: Filtra per Ore (minimo)")
         print(" 3: Mostra tutti gli interpelli")
-        print(" 4: Esporta questa vista in PDF")
+        print(" 4: Esporta questa vista (PDF, CSV o JSONL)")
+        print(" 5: Filtra per Provincia")
+        print(" 6: Filtra per Data di Fine Incarico (intervallo)")
+        print(" 7: Mostra solo gli interpelli ancora aperti")
+        print(" 8: Cerca per testo (scuola, città, indirizzo, tipo di cattedra)")
         print(" 0: Torna al menu principale")
         
         choice = input("Scegli un'opzione: ")
@@ -122,9 +310,9 @@ def run_database_mode():
                 if 1 <= cdc_choice <= len(classi):
                     selected_cdc = classi[cdc_choice - 1]
                     filters = {'classe_di_concorso': selected_cdc}
-                    last_displayed_rows = database.get_interpelli_by_filter(db_conn, filters)
+                    current_view = database.InterpelliPager(db_conn, filters=filters)
                     print(f"\n--- Risultati Filtrati per CDC: {selected_cdc} ---")
-                    ui.print_results(last_displayed_rows)
+                    ui.print_results(current_view)
                 else:
                     print("Scelta non valida.")
             except (ValueError, IndexError):
@@ -136,9 +324,9 @@ def run_database_mode():
                 min_ore = int(ore_str)
                 if min_ore > 0:
                     filters = {'min_ore': min_ore}
-                    last_displayed_rows = database.get_interpelli_by_filter(db_conn, filters)
+                    current_view = database.InterpelliPager(db_conn, filters=filters)
                     print(f"\n--- Risultati Filtrati per Ore >= {min_ore} ---")
-                    ui.print_results(last_displayed_rows)
+                    ui.print_results(current_view)
                 else:
                     print("Inserisci un numero positivo.")
             except ValueError:
@@ -146,11 +334,68 @@ def run_database_mode():
 
         elif choice == '3':
             print("\nRecupero tutti gli interpelli salvati...")
-            last_displayed_rows = database.get_all_interpelli(db_conn)
-            ui.print_results(last_displayed_rows)
+            current_view = database.InterpelliPager(db_conn)
+            ui.print_results(current_view)
 
         elif choice == '4':
-            ui.export_to_pdf(last_displayed_rows)
+            export_format = ui.ask_export_format()
+            if export_format:
+                exporters.export_view(current_view, export_format)
+
+        elif choice == '5':
+            province = database.get_unique_province(db_conn)
+            if not province:
+                print("Nessuna provincia trovata nel database per filtrare.")
+                continue
+
+            print("\n--- Seleziona Provincia ---")
+            for i, provincia in enumerate(province, 1):
+                print(f"{i:2}: {provincia}")
+            print("---------------------------")
+
+            try:
+                prov_choice = int(input("Inserisci il numero della provincia da filtrare: "))
+                if 1 <= prov_choice <= len(province):
+                    selected_provincia = province[prov_choice - 1]
+                    current_view = database.InterpelliPager(db_conn, filters={'provincia': selected_provincia})
+                    print(f"\n--- Risultati Filtrati per Provincia: {selected_provincia} ---")
+                    ui.print_results(current_view)
+                else:
+                    print("Scelta non valida.")
+            except ValueError:
+                print("Input non valido.")
+
+        elif choice == '6':
+            filters = {}
+            for key, label in [('data_fine_da', "Data di fine dal"), ('data_fine_a', "Data di fine al")]:
+                value = input(f"\n{label} (GG/MM/AAAA, vuoto per nessun limite): ").strip()
+                if not value:
+                    continue
+                iso_date = database.to_iso_date(value)
+                if iso_date is None:
+                    print(f"Data non valida: {value}")
+                    filters = None
+                    break
+                filters[key] = iso_date
+            if filters is None:
+                continue
+            current_view = database.InterpelliPager(db_conn, filters=filters)
+            print(f"\n--- Risultati Filtrati per Data di Fine: {filters.get('data_fine_da', 'inizio')} - {filters.get('data_fine_a', 'fine')} ---")
+            ui.print_results(current_view)
+
+        elif choice == '7':
+            current_view = database.InterpelliPager(db_conn, filters={'ancora_aperti': True})
+            print("\n--- Interpelli Ancora Aperti ---")
+            ui.print_results(current_view)
+
+        elif choice == '8':
+            text = input("\nTesto da cercare (anche inizi di parola, es. 'liceo monz'): ").strip()
+            if not database.build_fts_query(text):
+                print("Inserisci almeno una parola.")
+                continue
+            current_view = database.InterpelliPager(db_conn, search_text=text)
+            print(f"\n--- Risultati della Ricerca: {text} (ordinati per pertinenza) ---")
+            ui.print_results(current_view)
 
         elif choice == '0':
             break
@@ -162,11 +407,20 @@ def run_database_mode():
 def main():
     setup_main_logging()
     database.setup_database()
+    if config.ARCHIVE_EXPIRED_INTERPELLI:
+        db_conn = database.create_connection()
+        if db_conn:
+            archived = database.archive_expired_interpelli(db_conn)
+            db_conn.close()
+            if archived:
+                print(f"{archived} interpelli scaduti spostati nella tabella di archivio.")
 
     while True:
         print("\n--- AInterpelli: Menu Principale ---")
         print(" 1: Interroga il Database Esistente")
         print(" 2: Avvia Scansione e Scraping Nuovi Interpelli")
+        if run_checkpoint.find_interrupted_run() is not None:
+            print(" 3: Riprendi la Scansione Interrotta")
         print(" 9: Cancella Intero Database")
         print(" 0: Esci")
         choice = input("Scegli un'opzione: ")
@@ -177,12 +431,20 @@ def main():
             try:
                 asyncio.run(run_scraping_mode())
             except KeyboardInterrupt:
-                print("\nEsecuzione interrotta dall'utente.")
+                print("\nEsecuzione interrotta dall'utente: la scansione potrà essere ripresa (opzione 3).")
+        elif choice == '3':
+            try:
+                asyncio.run(run_scraping_mode(resume=True))
+            except KeyboardInterrupt:
+                print("\nEsecuzione interrotta dall'utente: la scansione potrà essere ripresa.")
         elif choice == '9':
             print("\nATTENZIONE: Stai per cancellare l'intero database degli interpelli.")
             confirm = input("Sei assolutamente sicuro? Digita 'SI' in maiuscolo per confermare: ")
             if confirm == "SI":
                 print("Cancellazione del database in corso...")
+                document_ledger.close()
+                run_checkpoint.close()
+                llm_usage.close()
                 if database.delete_database_file():
                     print("Database cancellato con successo.")
                     database.setup_database()
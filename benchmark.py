@@ -0,0 +1,413 @@
+import argparse
+import asyncio
+import contextlib
+import json
+import logging
+import os
+import random
+import re
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+# Benchmark offline della pipeline di scansione: un server HTTP locale simula i siti UST (pagine elenco in stile
+# WordPress, articoli, PDF e pagine di conferma di Google Drive) e un modello finto sostituisce Gemini, con latenza
+# e tasso di errore configurabili. `run_scraping_mode` viene eseguita senza interazione per ogni livello di
+# concorrenza richiesto, ognuno in un processo separato, e vengono riportati articoli/s, documenti/s,
+# latenze p50/p95 e picco di memoria.
+#
+# Uso: python benchmark.py --concurrency 10,25,50 --articles 200
+
+try:
+    import resource
+except ImportError:
+    # Su Windows il picco di memoria non è disponibile.
+    resource = None
+
+ARTICLES_PER_PAGE = 10
+SCHOOL_NAMES = ["IC Manzoni", "IIS Galilei", "Liceo Volta", "IC Don Milani", "ITIS Fermi", "IPSIA Marconi",
+                "Liceo Foscolo", "IC Montessori", "ITC Einaudi", "Liceo Carducci"]
+SUBJECTS = ["A022 - Italiano, storia, geografia", "A028 Matematica e scienze", "A-12 Discipline letterarie",
+            "AB25 Lingua inglese", "ADMM sostegno", "A-26 Matematica", "B-17 Laboratori di scienze meccaniche"]
+CITIES = ["Bergamo", "Treviglio", "Seriate", "Dalmine", "Lovere", "Clusone"]
+
+
+# --- SITO SINTETICO ---
+
+class SyntheticSite:
+    """Genera in modo deterministico (dato il seme) province, articoli e documenti del sito simulato."""
+
+    def __init__(self, provinces, articles_per_province, pdf_ratio, drive_ratio, scanned_ratio, shared_pdf_ratio, seed):
+        rng = random.Random(seed)
+        self.provinces = provinces
+        self.articles = {}
+        self.documents = {}
+        shared_documents = []
+        for provincia in provinces:
+            for i in range(articles_per_province):
+                slug = f"{provincia.lower()}/2025/09/interpello-{i}/"
+                record = {
+                    'nome_scuola': f"{rng.choice(SCHOOL_NAMES)} {provincia} {i}",
+                    'indirizzo': f"Via Roma {rng.randint(1, 200)}",
+                    'citta': rng.choice(CITIES),
+                    'data_fine_incarico': f"{rng.randint(1, 28):02d}/06/2026",
+                    'materia': rng.choice(SUBJECTS),
+                    'numero_di_ore': rng.choice([6, 9, 12, 18]),
+                    'tipo_cattedra': rng.choice(["Cattedra interna", "Spezzone", "COE"]),
+                }
+                kind = rng.random()
+                if kind < pdf_ratio:
+                    if shared_documents and rng.random() < shared_pdf_ratio:
+                        doc_name = rng.choice(shared_documents)
+                    else:
+                        doc_name = f"doc-{provincia.lower()}-{i}"
+                        self.documents[doc_name] = (record, rng.random() < scanned_ratio)
+                        shared_documents.append(doc_name)
+                    self.articles[slug] = ('pdf', doc_name, record)
+                elif kind < pdf_ratio + drive_ratio:
+                    doc_name = f"drive-{provincia.lower()}-{i}"
+                    self.documents[doc_name] = (record, rng.random() < scanned_ratio)
+                    self.articles[slug] = ('drive', doc_name, record)
+                else:
+                    self.articles[slug] = ('inline', None, record)
+
+    def article_slugs(self, provincia):
+        prefix = f"{provincia.lower()}/"
+        return [slug for slug in self.articles if slug.startswith(prefix)]
+
+
+def _page(title, body):
+    """Pagina in stile WordPress, con il rumore (menu, script, footer) che html_reducer deve eliminare."""
+    return f"""<!DOCTYPE html><html lang="it"><head><title>{title}</title>
+<script>window.dataLayer=[];function gtag(){{dataLayer.push(arguments)}}</script>
+<style>body{{font-family:sans-serif}} .menu li{{display:inline}}</style></head>
+<body><header id="masthead"><nav class="menu"><ul>{''.join(f'<li><a href="/voce-{i}/">Voce di menu {i}</a></li>' for i in range(25))}</ul></nav></header>
+<main id="main"><article class="post">{body}</article></main>
+<aside class="widget-area"><h3>Articoli recenti</h3><p>Contenuto della barra laterale</p></aside>
+<footer id="colophon">Ufficio Scolastico Territoriale - Via dei Mille 1 - PEC e contatti</footer></body></html>"""
+
+
+def _record_text(record):
+    return (f"Scuola: {record['nome_scuola']}. Indirizzo: {record['indirizzo']}, {record['citta']}. "
+            f"Classe di concorso: {record['materia']}. Ore settimanali: {record['numero_di_ore']}. "
+            f"Fino al {record['data_fine_incarico']}. Tipo: {record['tipo_cattedra']}.")
+
+
+def make_pdf(record, scanned):
+    """
+    PDF minimale a una pagina. Con `scanned` la pagina non ha testo estraibile e i dati sono solo in un commento,
+    leggibile dal modello finto ma non da pypdf: simula un documento scansionato.
+    """
+    text = _record_text(record)
+    lines = [text[i:i + 80] for i in range(0, len(text), 80)] + ["Si invitano i docenti interessati a inviare la candidatura."] * 3
+    if scanned:
+        stream = "0.9 g 50 50 500 700 re f"
+    else:
+        escaped = [line.replace('\\', '\\\\').replace('(', '\\(').replace(')', '\\)') for line in lines]
+        stream = "BT /F1 11 Tf 50 780 Td 14 TL " + " ".join(f"({line}) Tj T*" for line in escaped) + " ET"
+    objects = [
+        "<< /Type /Catalog /Pages 2 0 R >>",
+        "<< /Type /Pages /Kids [3 0 R] /Count 1 >>",
+        "<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] /Resources << /Font << /F1 5 0 R >> >> /Contents 4 0 R >>",
+        f"<< /Length {len(stream.encode('latin-1'))} >>\nstream\n{stream}\nendstream",
+        "<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica /Encoding /WinAnsiEncoding >>",
+    ]
+    out = "%PDF-1.4\n" + f"% DATI: {json.dumps(record, ensure_ascii=True)}\n"
+    offsets = []
+    for number, body in enumerate(objects, 1):
+        offsets.append(len(out.encode('latin-1')))
+        out += f"{number} 0 obj\n{body}\nendobj\n"
+    xref_offset = len(out.encode('latin-1'))
+    out += f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n" + "".join(f"{offset:010d} 00000 n \n" for offset in offsets)
+    out += f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref_offset}\n%%EOF\n"
+    return out.encode('latin-1')
+
+
+def build_app(site):
+    from aiohttp import web
+
+    async def listing(request):
+        provincia = request.match_info['provincia']
+        page_num = int(request.match_info.get('page', 1))
+        slugs = site.article_slugs(provincia)
+        page_slugs = slugs[(page_num - 1) * ARTICLES_PER_PAGE:page_num * ARTICLES_PER_PAGE]
+        if not page_slugs:
+            return web.Response(status=404, text=_page("Pagina non trovata", "<p>Nessun contenuto.</p>"), content_type='text/html')
+        items = "".join(f'<h2 class="entry-title"><a href="/{slug}">Interpello per supplenza n. {slug.split("-")[-1].strip("/")}</a></h2>'
+                        f'<div class="entry-summary"><p>Avviso pubblicato dalla scuola.</p></div>' for slug in page_slugs)
+        pagination = f'<nav class="pagination"><a class="next" href="/{provincia.lower()}/page/{page_num + 1}/">Successivi</a></nav>'
+        return web.Response(text=_page(f"Interpelli {provincia}", items + pagination), content_type='text/html')
+
+    async def article(request):
+        kind, doc_name, record = site.articles.get(request.match_info['slug'], (None, None, None))
+        if kind is None:
+            raise web.HTTPNotFound()
+        if kind == 'pdf':
+            body = f'<h1>Interpello</h1><p>Si pubblica l\'avviso in allegato.</p><p><a href="/wp-content/uploads/2025/09/{doc_name}.pdf">Scarica l\'avviso</a></p>'
+        elif kind == 'drive':
+            body = f'<h1>Interpello</h1><p>Avviso disponibile su <a href="https://drive.google.com/file/d/{doc_name}/view">Google Drive</a>.</p>'
+        else:
+            body = f"<h1>Interpello</h1><p>{_record_text(record)}</p>"
+        return web.Response(text=_page("Interpello", body), content_type='text/html')
+
+    async def document(request):
+        entry = site.documents.get(request.match_info['name'])
+        if entry is None:
+            raise web.HTTPNotFound()
+        return web.Response(body=make_pdf(*entry), content_type='application/pdf')
+
+    async def drive(request):
+        file_id = request.query.get('id', '')
+        if file_id not in site.documents:
+            raise web.HTTPNotFound()
+        if request.query.get('confirm'):
+            return web.Response(body=make_pdf(*site.documents[file_id]), content_type='application/pdf')
+        confirm_url = f"{request.scheme}://{request.host}/uc?export=download&confirm=t&id={file_id}"
+        return web.Response(text=f'<html><body><p>Impossibile eseguire la scansione antivirus.</p>'
+                                 f'<a id="uc-download-link" href="{confirm_url}">Scarica comunque</a></body></html>',
+                            content_type='text/html')
+
+    app = web.Application()
+    app.router.add_get('/uc', drive)
+    app.router.add_get('/wp-content/uploads/2025/09/{name}.pdf', document)
+    app.router.add_get('/{provincia}/', listing)
+    app.router.add_get('/{provincia}/page/{page}/', listing)
+    app.router.add_get('/{slug:.+/\\d{4}/\\d{2}/.+}', article)
+    return app
+
+
+# --- MODELLO FINTO ---
+
+class _Usage:
+    def __init__(self, prompt_tokens, output_tokens):
+        self.prompt_token_count = prompt_tokens
+        self.candidates_token_count = output_tokens
+        self.total_token_count = prompt_tokens + output_tokens
+
+
+class _Response:
+    def __init__(self, text, prompt_tokens):
+        self.text = text
+        self.usage_metadata = _Usage(prompt_tokens, len(text) // 4)
+
+
+class FakeModel:
+    """
+    Sostituto di `genai.GenerativeModel` con `generate_content_async`: riconosce il prompt di llm_processor
+    e risponde con JSON plausibile ricavato dal contenuto, dopo una latenza casuale attorno a `latency` secondi.
+    Con probabilità `error_rate` la chiamata fallisce con un errore generico, con `quota_error_rate` con un 429.
+    """
+
+    def __init__(self, model_name, latency, error_rate=0.0, quota_error_rate=0.0, seed=0):
+        self.model_name = model_name
+        self.latency = latency
+        self.error_rate = error_rate
+        self.quota_error_rate = quota_error_rate
+        self._rng = random.Random(seed)
+        self.calls = 0
+
+    async def generate_content_async(self, contents, **kwargs):
+        import llm_processor
+        self.calls += 1
+        text_parts = [part if isinstance(part, str) else part.get('data', b'').decode('latin-1') for part in contents]
+        prompt_tokens = sum(len(part) for part in text_parts) // 4
+        await asyncio.sleep(self._rng.lognormvariate(0, 0.5) * self.latency)
+        roll = self._rng.random()
+        if roll < self.quota_error_rate:
+            raise RuntimeError("429 RESOURCE_EXHAUSTED: simulated quota error")
+        if roll < self.quota_error_rate + self.error_rate:
+            raise RuntimeError("500 simulated model error")
+
+        prompt, payload = text_parts[0], "\n".join(text_parts[1:])
+        if "pagina di elenco" in prompt:
+            result = {"article_links": re.findall(r'href="([^"]*/\d{4}/\d{2}/[^"]+)"', payload)}
+        elif "Riceverai PIÙ pagine" in prompt:
+            result = {"results": [dict(self._universal(body), id=doc_id)
+                                  for doc_id, body in re.findall(r'=== DOCUMENTO (\S+) \| URL di base: \S+ ===\n(.*?)(?==== DOCUMENTO|\Z)', payload, re.S)]}
+        elif "trovare le informazioni di un interpello" in prompt:
+            result = self._universal(payload)
+        elif prompt == llm_processor.DATA_EXTRACTION_PROMPT:
+            record = self._record(payload)
+            result = [record] if record else []
+        elif "Nel dato di un interpello" in prompt:
+            result = {"value": None}
+        else:
+            # Richiesta di correzione del JSON: il testo ricevuto è restituito così com'è.
+            return _Response(payload, prompt_tokens)
+        return _Response(json.dumps(result, ensure_ascii=False), prompt_tokens)
+
+    def _universal(self, html):
+        links = re.findall(r'href="([^"]+)"', html)
+        file_links = [link for link in links if link.lower().endswith('.pdf')]
+        gdrive_links = [link for link in links if 'drive.google.com' in link]
+        extracted = None if file_links or gdrive_links else self._record(html)
+        return {"file_links": file_links, "gdrive_links": gdrive_links, "portal_links": [], "extracted_data": extracted}
+
+    def _record(self, text):
+        match = re.search(r'% DATI: (\{.*\})', text)
+        if match:
+            return json.loads(match.group(1))
+        text = " ".join(text.split())
+        fields = re.search(r'Scuola: (.+?)\. Indirizzo: (.+?), (.+?)\. Classe di concorso: (.+?)\. '
+                           r'Ore settimanali: (\d+)\. Fino al (\S+?)\. Tipo: (.+?)\.', text)
+        if not fields:
+            return None
+        keys = ['nome_scuola', 'indirizzo', 'citta', 'materia', 'numero_di_ore', 'data_fine_incarico', 'tipo_cattedra']
+        return dict(zip(keys, fields.groups()))
+
+
+# --- ESECUZIONE DI UNA CONFIGURAZIONE ---
+
+async def _run_once(args, workdir):
+    import ainterpelli
+    import config
+    import database
+    import metrics
+    import scraper
+    import ui
+    from aiohttp import web
+
+    provinces = [f"Provincia{i + 1}" for i in range(args.provinces)]
+    site = SyntheticSite(provinces, args.articles, args.pdf_ratio, args.drive_ratio, args.scanned_ratio, args.shared_pdf_ratio, args.seed)
+    runner = web.AppRunner(build_app(site))
+    await runner.setup()
+    server = web.TCPSite(runner, '127.0.0.1', 0)
+    await server.start()
+    port = server._server.sockets[0].getsockname()[1]
+    base_url = f"http://127.0.0.1:{port}"
+
+    max_pages = -(-args.articles // ARTICLES_PER_PAGE) + 1
+    config.SITES_CONFIG = {provincia: {'url': f"{base_url}/{provincia.lower()}/"} for provincia in provinces}
+    config.LINK_COLLECTION_CONCURRENCY = args.link_concurrency
+    config.ARTICLE_ANALYSIS_CONCURRENCY = args.analysis_concurrency
+    config.METRICS_DIR = os.path.join(workdir, 'metrics')
+    if not args.keep_rate_limits:
+        config.GEMINI_RATE_LIMITS = {key: {'rpm': 10 ** 9, 'tpm': 10 ** 12} for key in config.GEMINI_RATE_LIMITS}
+    scraper.GOOGLE_DRIVE_DOWNLOAD_URL = base_url + "/uc?export=download&id={file_id}"
+    models = {
+        'fast': FakeModel('fake-fast', args.fast_latency, args.error_rate, args.quota_error_rate, seed=args.seed),
+        'powerful': FakeModel('fake-powerful', args.powerful_latency, args.error_rate, args.quota_error_rate, seed=args.seed + 1),
+    }
+    config.setup_gemini = lambda: models
+    ui.get_provinces_to_scan = lambda: provinces
+    ui.get_max_pages_to_scan = lambda: max_pages
+    ui.ask_yes_no = lambda question, default=True: default
+
+    database.setup_database()
+    start = time.perf_counter()
+    try:
+        with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+            await ainterpelli.run_scraping_mode()
+    finally:
+        await runner.cleanup()
+    elapsed = time.perf_counter() - start
+
+    stages = metrics.snapshot()['stages']
+    article_stage = stages.get('article', {})
+    extraction_stage = stages.get('extraction', {})
+    documents = stages.get('download', {}).get('count', 0)
+    peak_rss_mb = None
+    if resource is not None:
+        # ru_maxrss è in KB su Linux e in byte su macOS.
+        divisor = 1024 * 1024 if sys.platform == 'darwin' else 1024
+        peak_rss_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / divisor
+    return {
+        'analysis_concurrency': args.analysis_concurrency,
+        'link_concurrency': args.link_concurrency,
+        'articles': article_stage.get('count', 0),
+        'article_errors': article_stage.get('errors', 0),
+        'documents': documents,
+        'seconds': elapsed,
+        'articles_per_second': article_stage.get('count', 0) / elapsed if elapsed else None,
+        'documents_per_second': documents / elapsed if elapsed else None,
+        'article_p50_seconds': article_stage.get('p50_seconds'),
+        'article_p95_seconds': article_stage.get('p95_seconds'),
+        'extraction_p50_seconds': extraction_stage.get('p50_seconds'),
+        'extraction_p95_seconds': extraction_stage.get('p95_seconds'),
+        'llm_calls': {key: model.calls for key, model in models.items()},
+        'peak_rss_mb': peak_rss_mb,
+        'stages': stages,
+    }
+
+
+def run_single(args):
+    """Eseguita nel processo figlio: una configurazione in una cartella temporanea, risultato in JSON su file."""
+    os.environ['AINTERPELLI_NO_LLM_CACHE'] = '1'
+    # I moduli leggono classi_concorso.json dalla cartella corrente all'import: si importano prima del chdir.
+    import ainterpelli  # noqa: F401
+    workdir = tempfile.mkdtemp(prefix='ainterpelli-bench-')
+    os.chdir(workdir)
+    logging.basicConfig(level=logging.WARNING, filename=os.path.join(workdir, 'benchmark.log'))
+    try:
+        result = asyncio.run(_run_once(args, workdir))
+    finally:
+        os.chdir(os.path.dirname(os.path.abspath(__file__)))
+        shutil.rmtree(workdir, ignore_errors=True)
+    with open(args.result_file, 'w', encoding='utf-8') as f:
+        json.dump(result, f)
+
+
+def _format(value, pattern):
+    return pattern.format(value) if value is not None else "n/d"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark offline della pipeline di scansione di AInterpelli.")
+    parser.add_argument('--concurrency', default="10,25,50", help="livelli di ARTICLE_ANALYSIS_CONCURRENCY da provare, separati da virgole")
+    parser.add_argument('--link-concurrency', type=int, default=10)
+    parser.add_argument('--provinces', type=int, default=2)
+    parser.add_argument('--articles', type=int, default=100, help="articoli per provincia")
+    parser.add_argument('--pdf-ratio', type=float, default=0.5)
+    parser.add_argument('--drive-ratio', type=float, default=0.2)
+    parser.add_argument('--scanned-ratio', type=float, default=0.2, help="quota di PDF senza strato di testo")
+    parser.add_argument('--shared-pdf-ratio', type=float, default=0.1, help="quota di articoli che rimandano a un PDF già pubblicato")
+    parser.add_argument('--fast-latency', type=float, default=0.05, help="latenza media del modello veloce (s)")
+    parser.add_argument('--powerful-latency', type=float, default=0.25, help="latenza media del modello potente (s)")
+    parser.add_argument('--error-rate', type=float, default=0.0)
+    parser.add_argument('--quota-error-rate', type=float, default=0.0)
+    parser.add_argument('--keep-rate-limits', action='store_true', help="applica i limiti RPM/TPM di config invece di disattivarli")
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--output', help="file JSON in cui salvare i risultati completi")
+    parser.add_argument('--analysis-concurrency', type=int, help=argparse.SUPPRESS)
+    parser.add_argument('--result-file', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.result_file:
+        run_single(args)
+        return
+
+    results = []
+    for level in [int(value) for value in args.concurrency.split(',') if value.strip()]:
+        with tempfile.NamedTemporaryFile(suffix='.json', delete=False) as tmp:
+            result_file = tmp.name
+        child_args = [a for a in sys.argv[1:]] + ['--analysis-concurrency', str(level), '--result-file', result_file]
+        print(f"Concorrenza {level}: esecuzione in corso...")
+        # Ogni configurazione gira in un processo nuovo: stato dei moduli e picco di memoria non si sommano.
+        completed = subprocess.run([sys.executable, os.path.abspath(__file__)] + child_args, cwd=os.path.dirname(os.path.abspath(__file__)))
+        try:
+            if completed.returncode != 0:
+                print(f"Concorrenza {level}: esecuzione fallita (codice {completed.returncode}).")
+                continue
+            with open(result_file, encoding='utf-8') as f:
+                results.append(json.load(f))
+        finally:
+            os.remove(result_file)
+
+    print(f"\n{'conc.':>6} {'articoli':>9} {'errori':>7} {'documenti':>10} {'tempo s':>8} {'art/s':>7} {'doc/s':>7} "
+          f"{'p50 art':>8} {'p95 art':>8} {'p50 estr':>9} {'p95 estr':>9} {'RSS MB':>7}")
+    for r in results:
+        print(f"{r['analysis_concurrency']:>6} {r['articles']:>9} {r['article_errors']:>7} {r['documents']:>10} {r['seconds']:>8.1f} "
+              f"{_format(r['articles_per_second'], '{:.1f}'):>7} {_format(r['documents_per_second'], '{:.1f}'):>7} "
+              f"{_format(r['article_p50_seconds'], '{:.2f}'):>8} {_format(r['article_p95_seconds'], '{:.2f}'):>8} "
+              f"{_format(r['extraction_p50_seconds'], '{:.2f}'):>9} {_format(r['extraction_p95_seconds'], '{:.2f}'):>9} "
+              f"{_format(r['peak_rss_mb'], '{:.0f}'):>7}")
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
+        print(f"\nRisultati completi salvati in {args.output}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,374 @@
+import asyncio
+import hashlib
+import json
+import os
+import time
+import zipfile
+from types import SimpleNamespace
+import aiohttp
+from dotenv import load_dotenv
+from multidict import CIMultiDict, CIMultiDictProxy
+from yarl import URL
+
+# Registrazione e riproduzione di una scansione reale. In registrazione ogni risposta HTTP di `scraper` e ogni risposta
+# di Gemini vengono salvate in una "cassetta" (archivio zip compresso: un indice JSON più i corpi indirizzati per
+# contenuto, così lo stesso PDF è salvato una sola volta). In riproduzione la pipeline gira interamente dalla cassetta,
+# senza rete e senza consumare token: le risposte arrivano sempre nello stesso ordine e con lo stesso contenuto.
+#
+# Attivazione: AINTERPELLI_CASSETTE_RECORD=percorso.zip oppure AINTERPELLI_CASSETTE_REPLAY=percorso.zip
+# (anche nel file .env), oppure `configure(mode, path)`.
+
+RECORD_ENV_VAR = "AINTERPELLI_CASSETTE_RECORD"
+REPLAY_ENV_VAR = "AINTERPELLI_CASSETTE_REPLAY"
+FORMAT_VERSION = 1
+
+MODE_RECORD = 'record'
+MODE_REPLAY = 'replay'
+
+# Header conservati per ogni risposta: sono gli unici letti da scraper.
+KEPT_HEADERS = ('Content-Type', 'ETag', 'Last-Modified')
+
+_mode = None
+_path = None
+_index = None
+_bodies = {}
+_archive = None
+_positions = {}
+_uploads = {}
+_stats = {'http_recorded': 0, 'llm_recorded': 0, 'http_replayed': 0, 'llm_replayed': 0, 'misses': 0}
+
+
+class CassetteMiss(LookupError):
+    """La richiesta non è presente nella cassetta in riproduzione."""
+
+
+def configure(mode, path):
+    """Attiva la registrazione (MODE_RECORD) o la riproduzione (MODE_REPLAY) sulla cassetta `path`."""
+    global _mode, _path, _index, _archive
+    close()
+    _mode, _path = mode, path
+    _positions.clear()
+    _uploads.clear()
+    _bodies.clear()
+    for key in _stats:
+        _stats[key] = 0
+    if mode == MODE_REPLAY:
+        _archive = zipfile.ZipFile(path)
+        _index = json.loads(_archive.read('index.json'))
+        if _index.get('version') != FORMAT_VERSION:
+            raise ValueError(f"Versione della cassetta {path} non supportata: {_index.get('version')}")
+    else:
+        _index = {'version': FORMAT_VERSION, 'created_at': time.time(), 'models': {}, 'http': {}, 'llm': {}, 'batch': {}}
+
+
+def configure_from_env():
+    """Attiva la cassetta indicata dalle variabili d'ambiente, se presente. Restituisce la modalità attiva o None."""
+    load_dotenv()
+    record_path = os.getenv(RECORD_ENV_VAR, "").strip()
+    replay_path = os.getenv(REPLAY_ENV_VAR, "").strip()
+    if record_path and replay_path:
+        raise ValueError(f"Impostare solo una tra {RECORD_ENV_VAR} e {REPLAY_ENV_VAR}")
+    if replay_path:
+        configure(MODE_REPLAY, replay_path)
+    elif record_path:
+        configure(MODE_RECORD, record_path)
+    return _mode
+
+
+def is_active():
+    return _mode is not None
+
+
+def is_recording():
+    return _mode == MODE_RECORD
+
+
+def is_replaying():
+    return _mode == MODE_REPLAY
+
+
+def _hash(data):
+    if isinstance(data, str):
+        data = data.encode('utf-8')
+    return hashlib.sha256(data).hexdigest()
+
+
+def _next_entry(section, key):
+    """Prossima risposta registrata per `key`; oltre l'ultima viene ripetuta l'ultima."""
+    entries = _index[section].get(key)
+    if not entries:
+        _stats['misses'] += 1
+        raise CassetteMiss(f"Nessuna risposta registrata nella cassetta per {key}")
+    position = _positions.get((section, key), 0)
+    _positions[(section, key)] = position + 1
+    return entries[min(position, len(entries) - 1)]
+
+
+def _store_body(body):
+    body_hash = _hash(body)
+    _bodies.setdefault(body_hash, body)
+    return body_hash
+
+
+def _load_body(body_hash):
+    return _archive.read(f'bodies/{body_hash}')
+
+
+def save():
+    """Scrive la cassetta registrata su disco (file temporaneo e rename). Senza registrazione attiva non fa nulla."""
+    if not is_recording():
+        return None
+    tmp_path = _path + '.tmp'
+    with zipfile.ZipFile(tmp_path, 'w', compression=zipfile.ZIP_DEFLATED, compresslevel=9) as archive:
+        archive.writestr('index.json', json.dumps(_index, ensure_ascii=False))
+        for body_hash, body in _bodies.items():
+            archive.writestr(f'bodies/{body_hash}', body)
+    os.replace(tmp_path, _path)
+    return _path
+
+
+def close():
+    """Salva la registrazione in corso e disattiva la cassetta. Restituisce il percorso salvato, se c'era una registrazione."""
+    global _mode, _archive, _index
+    saved_path = save()
+    if _archive is not None:
+        _archive.close()
+    _mode, _archive, _index = None, None, None
+    return saved_path
+
+
+def get_stats():
+    return dict(_stats)
+
+
+# --- HTTP ---
+
+class _Content:
+    def __init__(self, body):
+        self._body = body
+        self._offset = 0
+
+    async def read(self, n=-1):
+        end = len(self._body) if n is None or n < 0 else self._offset + n
+        chunk = self._body[self._offset:end]
+        self._offset += len(chunk)
+        return chunk
+
+
+class _CassetteResponse:
+    """Risposta servita dalla cassetta, con la parte dell'interfaccia di aiohttp.ClientResponse usata da scraper."""
+
+    def __init__(self, url, entry, body):
+        self.url = URL(url)
+        self.status = entry['status']
+        self.reason = entry.get('reason') or ''
+        self.headers = CIMultiDictProxy(CIMultiDict(entry['headers']))
+        self.content_length = len(body)
+        self.content = _Content(body)
+        self._encoding = entry.get('encoding') or 'utf-8'
+        self._body = body
+
+    def get_encoding(self):
+        return self._encoding
+
+    async def read(self):
+        return self._body
+
+    async def text(self, encoding=None, errors='strict'):
+        return self._body.decode(encoding or self._encoding, errors=errors)
+
+    def raise_for_status(self):
+        if self.status >= 400:
+            request_info = aiohttp.RequestInfo(self.url, 'GET', CIMultiDictProxy(CIMultiDict()), self.url)
+            raise aiohttp.ClientResponseError(request_info, (), status=self.status, message=self.reason, headers=self.headers)
+
+
+def _raise_recorded_error(entry):
+    if entry['error_type'] == 'timeout':
+        raise asyncio.TimeoutError(entry['error'])
+    raise aiohttp.ClientConnectionError(entry['error'])
+
+
+class _CassetteRequest:
+    """Context manager restituito da `get`: in registrazione esegue la richiesta reale e la salva."""
+
+    def __init__(self, session, url, kwargs):
+        self._session = session
+        self._url = url
+        self._kwargs = kwargs
+
+    async def __aenter__(self):
+        url = str(self._url)
+        if is_replaying():
+            entry = _next_entry('http', url)
+            _stats['http_replayed'] += 1
+            if 'error' in entry:
+                _raise_recorded_error(entry)
+            return _CassetteResponse(url, entry, _load_body(entry['body']))
+
+        try:
+            async with self._session.get(self._url, **self._kwargs) as response:
+                body = await response.read()
+                try:
+                    encoding = response.get_encoding()
+                except Exception:
+                    encoding = 'utf-8'
+                entry = {
+                    'status': response.status,
+                    'reason': response.reason,
+                    'headers': {name: response.headers[name] for name in KEPT_HEADERS if name in response.headers},
+                    'encoding': encoding,
+                    'body': _store_body(body),
+                }
+        except asyncio.TimeoutError as e:
+            entry = {'error': str(e) or "Timeout", 'error_type': 'timeout'}
+        except aiohttp.ClientConnectionError as e:
+            entry = {'error': str(e), 'error_type': 'connection'}
+        _index['http'].setdefault(url, []).append(entry)
+        _stats['http_recorded'] += 1
+        if 'error' in entry:
+            _raise_recorded_error(entry)
+        return _CassetteResponse(url, entry, _bodies[entry['body']])
+
+    async def __aexit__(self, exc_type, exc, tb):
+        return False
+
+
+class CassetteSession:
+    """
+    Sessione HTTP con la cassetta attiva. In registrazione avvolge la sessione aiohttp reale (il corpo di ogni risposta
+    viene letto per intero e salvato); in riproduzione non apre connessioni. Le risposte sono servite allo stesso modo
+    in entrambe le modalità, così la pipeline vede esattamente gli stessi oggetti.
+    """
+
+    def __init__(self, session=None):
+        self._session = session
+
+    async def __aenter__(self):
+        if self._session is not None:
+            await self._session.__aenter__()
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        if self._session is not None:
+            await self._session.__aexit__(exc_type, exc, tb)
+        return False
+
+    async def close(self):
+        if self._session is not None:
+            await self._session.close()
+
+    def get(self, url, **kwargs):
+        return _CassetteRequest(self._session, url, kwargs)
+
+
+def wrap_session(create_session):
+    """Sessione per la scansione: `create_session()` normale, avvolta dalla cassetta se attiva."""
+    if is_replaying():
+        return CassetteSession()
+    session = create_session()
+    return CassetteSession(session) if is_recording() else session
+
+
+# --- GEMINI ---
+
+def note_upload(uploaded_file, pdf_bytes):
+    """Associa un file caricato con la File API al suo contenuto, così la chiave della richiesta non dipende dall'upload."""
+    if is_recording():
+        _uploads[uploaded_file.name] = _hash(pdf_bytes)
+
+
+def _part_digest(part):
+    if isinstance(part, str):
+        return part
+    if isinstance(part, dict) and 'data' in part:
+        return 'data:' + _hash(part['data'])
+    name = getattr(part, 'name', None)
+    return 'data:' + _uploads.get(name, str(name))
+
+
+def _llm_key(model_key, contents):
+    digest = json.dumps([model_key] + [_part_digest(part) for part in contents], ensure_ascii=False)
+    return _hash(digest)
+
+
+class _CassetteGeminiResponse:
+    def __init__(self, entry):
+        self._entry = entry
+        usage = entry.get('usage')
+        self.usage_metadata = SimpleNamespace(**usage) if usage else None
+
+    @property
+    def text(self):
+        if 'text_error' in self._entry:
+            raise ValueError(self._entry['text_error'])
+        return self._entry['text']
+
+
+class CassetteModel:
+    """Modello Gemini con la cassetta attiva: registra le risposte del modello reale o le riproduce senza chiamarlo."""
+
+    def __init__(self, model_key, model=None, model_name=None):
+        self.model_key = model_key
+        self._model = model
+        self.model_name = model_name or getattr(model, 'model_name', model_key)
+
+    async def generate_content_async(self, contents, **kwargs):
+        key = _llm_key(self.model_key, contents)
+        if is_replaying():
+            entry = _next_entry('llm', key)
+            _stats['llm_replayed'] += 1
+            if 'error' in entry:
+                raise RuntimeError(entry['error'])
+            return _CassetteGeminiResponse(entry)
+
+        try:
+            response = await self._model.generate_content_async(contents, **kwargs)
+        except Exception as e:
+            # Anche gli errori (es. quota) sono registrati: in riproduzione si ripetono i tentativi nello stesso ordine.
+            _index['llm'].setdefault(key, []).append({'error': f"{type(e).__name__}: {e}"})
+            _stats['llm_recorded'] += 1
+            raise
+        usage = getattr(response, 'usage_metadata', None)
+        entry = {'usage': {field: getattr(usage, field, 0) or 0 for field in
+                           ('prompt_token_count', 'candidates_token_count', 'total_token_count')} if usage else None}
+        try:
+            entry['text'] = response.text
+        except Exception as e:
+            entry['text_error'] = str(e)
+        _index['llm'].setdefault(key, []).append(entry)
+        _stats['llm_recorded'] += 1
+        return response
+
+
+def wrap_models(setup_models):
+    """Modelli per la scansione: quelli di `setup_models()`, avvolti dalla cassetta se attiva; in riproduzione non serve la chiave API."""
+    if is_replaying():
+        return {key: CassetteModel(key, model_name=name) for key, name in _index['models'].items()}
+    models = setup_models()
+    if not models or not is_recording():
+        return models
+    _index['models'] = {key: getattr(model, 'model_name', key) for key, model in models.items()}
+    return {key: CassetteModel(key, model) for key, model in models.items()}
+
+
+def _batch_key(html_content, base_url):
+    return _hash(json.dumps([base_url, _hash(html_content)]))
+
+
+def record_batch_result(html_content, base_url, result):
+    """
+    Salva il risultato di una pagina analizzata in un lotto. La composizione dei lotti dipende dai tempi di arrivo
+    delle pagine, quindi in riproduzione i risultati sono serviti pagina per pagina invece che lotto per lotto.
+    """
+    if is_recording():
+        # Copia: il risultato viene poi modificato dalla pipeline (link resi assoluti, classi di concorso risolte).
+        _index['batch'][_batch_key(html_content, base_url)] = json.loads(json.dumps(result))
+
+
+def replay_batch_result(html_content, base_url):
+    """Risultato registrato per una pagina analizzata in un lotto, o None (la pagina passa all'analisi singola)."""
+    result = _index['batch'].get(_batch_key(html_content, base_url))
+    if result is not None:
+        _stats['llm_replayed'] += 1
+    return json.loads(json.dumps(result)) if result is not None else None
@@ -0,0 +1,89 @@
+import json
+import re
+import unicodedata
+
+# --- CARICAMENTO DELLA BASE DI CONOSCENZA DELLE CLASSI DI CONCORSO ---
+try:
+    with open('classi_concorso.json', 'r', encoding='utf-8') as f:
+        CDC_DATA = json.load(f)
+except FileNotFoundError:
+    print("ERRORE CRITICO: Il file 'classi_concorso.json' non è stato trovato. Assicurati che sia nella stessa cartella.")
+    CDC_DATA = []
+except json.JSONDecodeError:
+    print("ERRORE CRITICO: Il file 'classi_concorso.json' contiene un errore di formattazione.")
+    CDC_DATA = []
+
+KNOWN_CODES = {item['codice'].upper() for item in CDC_DATA}
+
+# Codici espliciti del tipo A-12, A12, A012, A - 12 (il trattino è obbligatorio se ci sono spazi,
+# così "fino a 12 ore" non viene scambiato per A-12) e codici di quattro caratteri come AB22 o ADSS.
+_EXPLICIT_AB_CODE = re.compile(r'(?<![a-z0-9])([ab])(?:\s?-\s?)?0?(\d{2})(?![a-z0-9])')
+_EXPLICIT_SHORT_CODE = re.compile(r'(?<![a-z0-9])([a-z0-9]{4})(?![a-z0-9])')
+# Forma dei codici di lingua straniera (AA24, AB25, ...): un codice con questa forma è esplicito anche se non
+# è nel file e non deve essere sostituito da una descrizione ("AB25 Lingua inglese" non è AB22).
+_EXPLICIT_LANGUAGE_CODE = re.compile(r'(?<![a-z0-9])([ab][a-z]\d{2})(?![a-z0-9])')
+
+# Posti di sostegno: il grado di scuola è scritto in molti modi diversi ("sostegno scuola secondaria I grado",
+# "sostegno primo grado", "sostegno scuola media"...), quindi si riconosce per parole chiave.
+_SOSTEGNO_GRADES = [
+    ('ADSS', re.compile(r'\b(ii grado|secondo grado|2 grado|superiore|superiori)\b')),
+    ('ADMM', re.compile(r'\b(i grado|primo grado|1 grado|media|medie)\b')),
+    ('ADEE', re.compile(r'\b(primaria|elementare|elementari)\b')),
+    ('ADAA', re.compile(r'\b(infanzia|materna)\b')),
+]
+
+
+def normalize(text):
+    """Minuscolo, senza accenti, con la punteggiatura sostituita da spazi singoli."""
+    text = unicodedata.normalize('NFKD', str(text)).encode('ascii', 'ignore').decode('ascii').lower()
+    return " ".join(re.sub(r'[^a-z0-9-]', ' ', text).split())
+
+
+def _build_index():
+    """Costruisce, una sola volta, la mappa pattern normalizzato -> codice e un'unica regex multi-pattern."""
+    pattern_to_code = {}
+    for item in CDC_DATA:
+        for text in [item['descrizione']] + item.get('alias', []):
+            pattern = normalize(text)
+            # A parità di pattern vale la prima classe che lo dichiara nel file.
+            if pattern and pattern not in pattern_to_code:
+                pattern_to_code[pattern] = item['codice']
+    # Le alternative più lunghe vanno prima: "matematica e scienze" deve vincere su "matematica".
+    ordered = sorted(pattern_to_code, key=len, reverse=True)
+    regex = re.compile(r'(?<![a-z0-9])(' + "|".join(re.escape(p) for p in ordered) + r')(?![a-z0-9])') if ordered else None
+    return pattern_to_code, regex
+
+
+_PATTERN_TO_CODE, _PATTERN_REGEX = _build_index()
+
+
+def resolve(subject_text):
+    """
+    Restituisce il codice della classe di concorso per il testo della materia estratto dal documento,
+    oppure None se non è riconoscibile. Un codice esplicito ha la precedenza sulle descrizioni.
+    """
+    if not subject_text:
+        return None
+    text = normalize(subject_text)
+
+    match = _EXPLICIT_AB_CODE.search(text)
+    if match:
+        return f"{match.group(1).upper()}-{match.group(2)}"
+    for candidate in _EXPLICIT_SHORT_CODE.findall(text):
+        if candidate.upper() in KNOWN_CODES:
+            return candidate.upper()
+    match = _EXPLICIT_LANGUAGE_CODE.search(text)
+    if match:
+        return match.group(1).upper()
+
+    if re.search(r'\bsost(egno)?\b', text):
+        for code, grade in _SOSTEGNO_GRADES:
+            if grade.search(text):
+                return code
+
+    if _PATTERN_REGEX is None:
+        return None
+    matches = [m.group(1) for m in _PATTERN_REGEX.finditer(text)]
+    if not matches:
+        return None
+    return _PATTERN_TO_CODE[max(matches, key=len)]
@@ -6,6 +6,51 @@ from dotenv import load_dotenv
 FAST_MODEL_NAME = 'gemini-2.5-flash' # Modello più veloce per analisi HTML
 POWERFUL_MODEL_NAME = 'gemini-2.5-pro'   # Modello più potente per estrazione dati da PDF/contenuti
 
+# Pool di connessioni HTTP condiviso da tutte le fasi della scansione
+HTTP_MAX_CONNECTIONS = 100          # connessioni totali aperte contemporaneamente
+HTTP_MAX_CONNECTIONS_PER_HOST = 6   # per non sovraccaricare un singolo sito UST
+HTTP_DNS_CACHE_TTL = 600            # secondi
+HTTP_KEEPALIVE_TIMEOUT = 30         # secondi di inattività prima di chiudere una connessione riutilizzabile
+
+# Concorrenza della pipeline di scansione
+LINK_COLLECTION_CONCURRENCY = 10    # pagine elenco lette in parallelo
+ARTICLE_ANALYSIS_CONCURRENCY = 50   # articoli analizzati in parallelo
+
+# Budget di quota per modello (richieste e token al minuto), da adeguare al proprio piano API.
+GEMINI_RATE_LIMITS = {
+    'fast': {'rpm': 1000, 'tpm': 1000000},
+    'powerful': {'rpm': 150, 'tpm': 2000000},
+}
+GEMINI_MAX_QUOTA_RETRIES = 5
+
+# Prezzi in dollari per milione di token (input, output), usati per stimare il costo di ogni chiamata.
+GEMINI_PRICES_PER_MILLION = {
+    'fast': {'input': 0.30, 'output': 2.50},
+    'powerful': {'input': 1.25, 'output': 10.00},
+}
+# Budget massimo di una scansione: raggiunto uno dei due limiti non vengono avviate nuove chiamate (None = nessun limite).
+LLM_TOKEN_BUDGET = None
+LLM_COST_BUDGET_USD = None
+
+# Raggruppamento delle pagine articolo piccole in un'unica richiesta di analisi universale
+LLM_BATCH_ENABLED = True
+LLM_BATCH_SMALL_PAGE_TOKENS = 1500  # solo le pagine ridotte sotto questa soglia vengono raggruppate
+LLM_BATCH_MAX_TOKENS = 12000        # dimensione massima stimata di un lotto
+LLM_BATCH_MAX_DOCS = 12
+LLM_BATCH_MAX_WAIT = 1.5            # secondi di attesa massima prima di inviare un lotto incompleto
+
+# Cascata di estrazione: i dati sono estratti prima con il modello veloce; si passa al modello potente
+# solo se il risultato non supera i controlli (campi obbligatori, classe di concorso nota, ore plausibili).
+EXTRACTION_CASCADE_ENABLED = True
+EXTRACTION_PLAUSIBLE_HOURS = (1, 25)  # ore settimanali accettate senza ricorrere al modello potente
+
+# Metriche della pipeline (durate per fase, attese in coda, errori) esportate in JSON e formato Prometheus
+METRICS_DIR = 'metrics'
+METRICS_EXPORT_INTERVAL = 60  # secondi tra un'esportazione e l'altra durante la scansione
+
+# All'avvio gli interpelli con data di fine già passata sono spostati nella tabella di archivio
+ARCHIVE_EXPIRED_INTERPELLI = True
+
 SITES_CONFIG = {
     "Bergamo": {
         "url": "https://bergamo.istruzionelombardia.gov.it/argomento/interpelli-ricerca-supplenti/"
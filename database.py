@@ -1,13 +1,102 @@
 import sqlite3
 from sqlite3 import Error
+from datetime import date
 import os
+import re
+import llm_schemas
 
 DB_FILE = "interpelli.sqlite"
 
-def create_connection():
+# WAL e synchronous=NORMAL: un solo fsync per checkpoint invece che per ogni commit.
+CONNECTION_PRAGMAS = [
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA cache_size=-16000",
+    "PRAGMA busy_timeout=5000",
+]
+
+INTERPELLO_COLUMNS = ['nome_scuola', 'indirizzo', 'citta', 'provincia', 'data_fine_incarico',
+                      'classe_di_concorso', 'numero_di_ore', 'tipo_cattedra', 'url_sorgente']
+
+# Colonne calcolate in scrittura, usate da filtri e indici: data di fine in formato ISO (ordinabile e confrontabile)
+# e classe di concorso e provincia in forma normalizzata.
+DERIVED_COLUMNS = {
+    'data_fine_iso': 'TEXT',
+    'cdc_norm': 'TEXT',
+    'provincia_norm': 'TEXT',
+}
+STORED_COLUMNS = INTERPELLO_COLUMNS + list(DERIVED_COLUMNS)
+
+# Colonne restituite dalle query di consultazione, nell'ordine atteso da ui.
+SELECT_COLUMNS = ("id, nome_scuola, indirizzo, citta, provincia, data_fine_incarico, classe_di_concorso, "
+                  "numero_di_ore, tipo_cattedra, url_sorgente, data_inserimento")
+
+INTERPELLI_INDEXES = [
+    # Ordinamento delle viste e elenco delle province
+    "CREATE INDEX IF NOT EXISTS idx_interpelli_elenco ON interpelli(provincia, classe_di_concorso, data_inserimento DESC)",
+    # Filtri per classe di concorso / provincia, anche combinati con la scadenza; coprono anche l'elenco delle classi
+    "CREATE INDEX IF NOT EXISTS idx_interpelli_cdc ON interpelli(cdc_norm, data_fine_iso)",
+    "CREATE INDEX IF NOT EXISTS idx_interpelli_provincia ON interpelli(provincia_norm, data_fine_iso)",
+    # Intervalli di scadenza, interpelli ancora aperti e archiviazione dei scaduti
+    "CREATE INDEX IF NOT EXISTS idx_interpelli_scadenza ON interpelli(data_fine_iso)",
+    "CREATE INDEX IF NOT EXISTS idx_interpelli_ore ON interpelli(numero_di_ore)",
+]
+
+# Indice full-text su scuola, città, indirizzo e tipo di cattedra. È un indice "external content": i testi restano
+# solo in `interpelli` e i trigger tengono l'indice allineato a inserimenti, aggiornamenti e archiviazioni.
+# Il tokenizer ignora maiuscole e accenti; gli indici di prefisso rendono immediate le ricerche per inizio di parola.
+FTS_COLUMNS = ['nome_scuola', 'citta', 'indirizzo', 'tipo_cattedra']
+# Pesi per il ranking bm25, nell'ordine di FTS_COLUMNS: una corrispondenza nel nome della scuola conta di più.
+FTS_WEIGHTS = [10.0, 5.0, 2.0, 1.0]
+
+FTS_TRIGGERS = [
+    f"""CREATE TRIGGER IF NOT EXISTS interpelli_fts_insert AFTER INSERT ON interpelli BEGIN
+        INSERT INTO interpelli_fts(rowid, {', '.join(FTS_COLUMNS)}) VALUES (new.id, {', '.join('new.' + c for c in FTS_COLUMNS)});
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS interpelli_fts_delete AFTER DELETE ON interpelli BEGIN
+        INSERT INTO interpelli_fts(interpelli_fts, rowid, {', '.join(FTS_COLUMNS)}) VALUES ('delete', old.id, {', '.join('old.' + c for c in FTS_COLUMNS)});
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS interpelli_fts_update AFTER UPDATE OF {', '.join(FTS_COLUMNS)} ON interpelli BEGIN
+        INSERT INTO interpelli_fts(interpelli_fts, rowid, {', '.join(FTS_COLUMNS)}) VALUES ('delete', old.id, {', '.join('old.' + c for c in FTS_COLUMNS)});
+        INSERT INTO interpelli_fts(rowid, {', '.join(FTS_COLUMNS)}) VALUES (new.id, {', '.join('new.' + c for c in FTS_COLUMNS)});
+    END""",
+]
+
+def normalize_cdc(value):
+    """Classe di concorso senza spazi e in maiuscolo (es. ' a-22 ' -> 'A-22')."""
+    if value is None:
+        return None
+    return re.sub(r'\s+', '', str(value)).upper() or None
+
+def normalize_provincia(value):
+    if value is None:
+        return None
+    return " ".join(str(value).split()).casefold() or None
+
+def to_iso_date(value):
+    """Data in formato ISO (YYYY-MM-DD) da una data o da un testo come DD/MM/YYYY; None se non interpretabile."""
+    if value is None or (isinstance(value, str) and not value.strip()):
+        return None
+    try:
+        return llm_schemas.parse_date(value).isoformat()
+    except ValueError:
+        return None
+
+def _stored_values(interpello_data):
+    derived = {
+        'data_fine_iso': to_iso_date(interpello_data.get('data_fine_incarico')),
+        'cdc_norm': normalize_cdc(interpello_data.get('classe_di_concorso')),
+        'provincia_norm': normalize_provincia(interpello_data.get('provincia')),
+    }
+    return tuple(interpello_data.get(c) for c in INTERPELLO_COLUMNS) + tuple(derived[c] for c in DERIVED_COLUMNS)
+
+def create_connection(check_same_thread=True):
     conn = None
     try:
-        conn = sqlite3.connect(DB_FILE)
+        conn = sqlite3.connect(DB_FILE, check_same_thread=check_same_thread)
+        for pragma in CONNECTION_PRAGMAS:
+            conn.execute(pragma)
         return conn
     except Error as e:
         print(f"Errore durante la connessione al database: {e}")
@@ -27,33 +116,134 @@ def create_table(conn):
         tipo_cattedra TEXT,
         url_sorgente TEXT NOT NULL,
         data_inserimento TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        data_fine_iso TEXT,
+        cdc_norm TEXT,
+        provincia_norm TEXT,
         UNIQUE (nome_scuola, classe_di_concorso, data_fine_incarico)
     );
     """
     try:
         c = conn.cursor()
         c.execute(create_table_sql)
+        migrate_interpelli_table(conn)
+        for index_sql in INTERPELLI_INDEXES:
+            c.execute(index_sql)
+        create_archive_table(conn)
+        create_fts_index(conn)
+        conn.commit()
         print("Tabella 'interpelli' creata o già esistente.")
     except Error as e:
         print(f"Errore durante la creazione della tabella: {e}")
 
+def migrate_interpelli_table(conn):
+    """
+    Aggiunge alle tabelle create da versioni precedenti le colonne calcolate e le valorizza per le righe esistenti.
+    Le date in formato libero sono convertite con lo stesso parser usato per le risposte di Gemini.
+    """
+    existing = {row[1] for row in conn.execute("PRAGMA table_info(interpelli)")}
+    missing = [column for column in DERIVED_COLUMNS if column not in existing]
+    if not missing:
+        return
+    with conn:
+        for column in missing:
+            conn.execute(f"ALTER TABLE interpelli ADD COLUMN {column} {DERIVED_COLUMNS[column]}")
+        rows = conn.execute("SELECT id, data_fine_incarico, classe_di_concorso, provincia FROM interpelli").fetchall()
+        conn.executemany("UPDATE interpelli SET data_fine_iso = ?, cdc_norm = ?, provincia_norm = ? WHERE id = ?",
+                         [(to_iso_date(data_fine), normalize_cdc(cdc), normalize_provincia(provincia), row_id)
+                          for row_id, data_fine, cdc, provincia in rows])
+    print(f"Tabella 'interpelli' aggiornata: aggiunte le colonne {', '.join(missing)} a {len(rows)} righe.")
+
+def create_fts_index(conn):
+    """Crea l'indice full-text e i trigger di sincronizzazione; se l'indice è nuovo lo popola con le righe esistenti."""
+    exists = conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'interpelli_fts'").fetchone() is not None
+    try:
+        conn.execute(f"""CREATE VIRTUAL TABLE IF NOT EXISTS interpelli_fts USING fts5(
+                             {', '.join(FTS_COLUMNS)}, content='interpelli', content_rowid='id',
+                             tokenize='unicode61 remove_diacritics 2', prefix='2 3')""")
+    except Error as e:
+        # SQLite compilato senza FTS5: la ricerca testuale non è disponibile, il resto funziona.
+        print(f"Ricerca testuale non disponibile (FTS5): {e}")
+        return
+    for trigger_sql in FTS_TRIGGERS:
+        conn.execute(trigger_sql)
+    if not exists:
+        conn.execute("INSERT INTO interpelli_fts(interpelli_fts) VALUES('rebuild')")
+
+def has_fts_index(conn):
+    return conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'interpelli_fts'").fetchone() is not None
+
+def create_archive_table(conn):
+    """Archivio degli interpelli scaduti: stesse colonne della tabella principale, più la data di archiviazione."""
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS interpelli_archivio (
+        id INTEGER PRIMARY KEY,
+        nome_scuola TEXT NOT NULL,
+        indirizzo TEXT,
+        citta TEXT,
+        provincia TEXT NOT NULL,
+        data_fine_incarico TEXT,
+        classe_di_concorso TEXT,
+        numero_di_ore INTEGER,
+        tipo_cattedra TEXT,
+        url_sorgente TEXT NOT NULL,
+        data_inserimento TIMESTAMP,
+        data_fine_iso TEXT,
+        cdc_norm TEXT,
+        provincia_norm TEXT,
+        data_archiviazione TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        UNIQUE (nome_scuola, classe_di_concorso, data_fine_incarico)
+    );
+    """)
+
+def archive_expired_interpelli(conn, today=None):
+    """
+    Sposta nell'archivio gli interpelli con data di fine anteriore a `today` (predefinita: oggi), in un'unica transazione.
+    Gli interpelli senza data interpretabile restano nella tabella principale. Restituisce il numero di righe spostate.
+    """
+    today_iso = to_iso_date(today or date.today())
+    columns = f"id, {', '.join(STORED_COLUMNS)}, data_inserimento"
+    try:
+        with conn:
+            conn.execute(f"""INSERT OR IGNORE INTO interpelli_archivio({columns})
+                             SELECT {columns} FROM interpelli WHERE data_fine_iso < ?""", (today_iso,))
+            cur = conn.execute("DELETE FROM interpelli WHERE data_fine_iso < ?", (today_iso,))
+            return cur.rowcount
+    except Error as e:
+        print(f"Errore durante l'archiviazione degli interpelli scaduti: {e}")
+        return 0
+
+def create_crawl_ledger_table(conn):
+    """Registro degli articoli già analizzati, usato per la scansione incrementale."""
+    create_table_sql = """
+    CREATE TABLE IF NOT EXISTS crawl_ledger (
+        url TEXT PRIMARY KEY,
+        provincia TEXT NOT NULL,
+        first_seen TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        last_seen TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    );
+    """
+    try:
+        c = conn.cursor()
+        c.execute(create_table_sql)
+        c.execute("CREATE INDEX IF NOT EXISTS idx_crawl_ledger_provincia ON crawl_ledger(provincia)")
+    except Error as e:
+        print(f"Errore durante la creazione della tabella 'crawl_ledger': {e}")
+
+def get_known_article_urls(conn, provincia):
+    cur = conn.cursor()
+    cur.execute("SELECT url FROM crawl_ledger WHERE provincia = ?", (provincia,))
+    return {row[0] for row in cur.fetchall()}
+
+LEDGER_UPSERT_SQL = """ INSERT INTO crawl_ledger(url, provincia) VALUES(?, ?)
+                        ON CONFLICT(url) DO UPDATE SET last_seen = CURRENT_TIMESTAMP """
+
 def insert_interpello(conn, interpello_data):
-    sql = ''' INSERT INTO interpelli(nome_scuola, indirizzo, citta, provincia, data_fine_incarico, classe_di_concorso, numero_di_ore, tipo_cattedra, url_sorgente)
-              VALUES(?,?,?,?,?,?,?,?,?) '''
+    sql = f''' INSERT INTO interpelli({", ".join(STORED_COLUMNS)})
+               VALUES({", ".join("?" for _ in STORED_COLUMNS)}) '''
     
     try:
         cur = conn.cursor()
-        cur.execute(sql, (
-            interpello_data.get('nome_scuola'),
-            interpello_data.get('indirizzo'),
-            interpello_data.get('citta'),
-            interpello_data.get('provincia'),
-            interpello_data.get('data_fine_incarico'),
-            interpello_data.get('classe_di_concorso'),
-            interpello_data.get('numero_di_ore'),
-            interpello_data.get('tipo_cattedra'),
-            interpello_data.get('url_sorgente')
-        ))
+        cur.execute(sql, _stored_values(interpello_data))
         conn.commit()
         print(f"Inserito nuovo interpello per: {interpello_data.get('nome_scuola')}")
         return cur.lastrowid
@@ -64,50 +254,265 @@ def insert_interpello(conn, interpello_data):
         print(f"Errore durante l'inserimento nel database: {e}")
         return None
 
+def insert_interpelli_batch(conn, rows, seen_articles=()):
+    """
+    Inserisce un lotto di interpelli con executemany in un'unica transazione, insieme alle voci del ledger.
+    I duplicati (stessa scuola, CDC e data di fine) sono ignorati. Se una riga viola un vincolo il lotto viene
+    riscritto riga per riga e le righe non valide sono scartate.
+    Restituisce i conteggi {'inserted', 'duplicates', 'rejected'}.
+    """
+    columns = ", ".join(STORED_COLUMNS)
+    placeholders = ", ".join("?" for _ in STORED_COLUMNS)
+    sql = f""" INSERT INTO interpelli({columns}) VALUES({placeholders})
+               ON CONFLICT(nome_scuola, classe_di_concorso, data_fine_incarico) DO NOTHING """
+    params = [_stored_values(row) for row in rows]
+
+    counts = {'inserted': 0, 'duplicates': 0, 'rejected': 0}
+    try:
+        try:
+            with conn:
+                # rowcount esclude le scritture dei trigger (indice FTS), a differenza di total_changes
+                affected = conn.executemany(sql, params).rowcount
+                if seen_articles:
+                    conn.executemany(LEDGER_UPSERT_SQL, list(seen_articles))
+        except sqlite3.IntegrityError as e:
+            # Una riga non valida (es. campo obbligatorio mancante) annulla l'intero lotto: lo si riscrive
+            # riga per riga, scartando solo le righe rifiutate, così gli altri articoli non vanno persi.
+            print(f"Lotto rifiutato dal database ({e}), nuovo tentativo riga per riga.")
+            with conn:
+                affected = 0
+                for row, values in zip(rows, params):
+                    try:
+                        affected += conn.execute(sql, values).rowcount
+                    except sqlite3.IntegrityError as row_error:
+                        counts['rejected'] += 1
+                        print(f"Interpello scartato ({row_error}): {row.get('nome_scuola')} - {row.get('url_sorgente')}")
+                if seen_articles:
+                    conn.executemany(LEDGER_UPSERT_SQL, list(seen_articles))
+        counts['inserted'] = affected
+        counts['duplicates'] = len(params) - affected - counts['rejected']
+    except Error as e:
+        print(f"Errore durante l'inserimento del lotto nel database: {e}")
+        return None
+    return counts
+
 def setup_database():
     conn = create_connection()
     if conn is not None:
         create_table(conn)
+        create_crawl_ledger_table(conn)
+        # Aggiorna le statistiche usate dal planner per scegliere tra gli indici (veloce se nulla è cambiato).
+        conn.execute("PRAGMA optimize")
         conn.close()
     else:
         print("Errore! Impossibile creare la connessione al database.")
 
-def get_all_interpelli(conn):
-    cur = conn.cursor()
-    cur.execute("SELECT * FROM interpelli ORDER BY provincia, classe_di_concorso, data_inserimento DESC")
-    rows = cur.fetchall()
-    return rows
-
 def get_unique_classi_di_concorso(conn):
     cur = conn.cursor()
-    cur.execute("SELECT DISTINCT classe_di_concorso FROM interpelli WHERE classe_di_concorso IS NOT NULL ORDER BY classe_di_concorso")
+    cur.execute("SELECT DISTINCT cdc_norm FROM interpelli WHERE cdc_norm IS NOT NULL ORDER BY cdc_norm")
     rows = [row[0] for row in cur.fetchall()]
     return rows
 
-def get_interpelli_by_filter(conn, filters):
-    base_query = "SELECT * FROM interpelli WHERE 1=1"
-    params = []
+def get_unique_province(conn):
+    cur = conn.cursor()
+    cur.execute("SELECT DISTINCT provincia FROM interpelli ORDER BY provincia")
+    return [row[0] for row in cur.fetchall()]
+
+def _filter_conditions(filters):
+    """
+    Condizioni SQL (e parametri) per i filtri delle viste: 'classe_di_concorso', 'provincia', 'min_ore',
+    'data_fine_da' / 'data_fine_a' (date o testo DD/MM/YYYY, estremi inclusi) e 'ancora_aperti'
+    (data di fine non ancora passata; gli interpelli senza data sono esclusi).
+    """
+    conditions, params = [], []
 
     if 'classe_di_concorso' in filters:
-        base_query += " AND classe_di_concorso = ?"
-        params.append(filters['classe_di_concorso'])
+        conditions.append("cdc_norm = ?")
+        params.append(normalize_cdc(filters['classe_di_concorso']))
+
+    if 'provincia' in filters:
+        conditions.append("provincia_norm = ?")
+        params.append(normalize_provincia(filters['provincia']))
     
     if 'min_ore' in filters:
-        base_query += " AND numero_di_ore >= ?"
+        conditions.append("numero_di_ore >= ?")
         params.append(filters['min_ore'])
-    
-    base_query += " ORDER BY provincia, classe_di_concorso, data_inserimento DESC"
-    
-    cur = conn.cursor()
-    cur.execute(base_query, params)
-    rows = cur.fetchall()
-    return rows
+
+    if 'data_fine_da' in filters:
+        conditions.append("data_fine_iso >= ?")
+        params.append(to_iso_date(filters['data_fine_da']))
+
+    if 'data_fine_a' in filters:
+        conditions.append("data_fine_iso <= ?")
+        params.append(to_iso_date(filters['data_fine_a']))
+
+    if filters.get('ancora_aperti'):
+        conditions.append("data_fine_iso >= ?")
+        params.append(date.today().isoformat())
+    return conditions, params
+
+def build_fts_query(text):
+    """
+    Trasforma il testo digitato in una query FTS5: ogni parola è cercata come prefisso e tutte devono comparire
+    (es. 'liceo monz' -> '"liceo"* "monz"*'). I caratteri speciali della sintassi FTS5 sono ignorati.
+    """
+    words = re.findall(r'\w+', text or "")
+    return " ".join(f'"{word}"*' for word in words)
+
+# --- CONSULTAZIONE A PAGINE ---
+
+PAGE_SIZE = 25
+
+# Ordinamento delle viste con filtri: provincia, classe di concorso, inserimento più recente e infine l'id, così ogni
+# riga ha una chiave unica. Coincide con l'indice idx_interpelli_elenco (che termina implicitamente con il rowid crescente).
+KEYSET_ORDER = [('provincia', False), ('classe_di_concorso', False), ('data_inserimento', True), ('id', False)]
+# Ordinamento dei risultati della ricerca testuale: pertinenza (bm25, più basso è migliore), poi id.
+SEARCH_KEYSET_ORDER = [('score', False), ('id', False)]
+
+def _keyset_condition(order, key):
+    """
+    Condizione "riga successiva a `key`" nell'ordinamento `order` ([(colonna, decrescente)]), compresi i NULL
+    (in SQLite precedono ogni valore in ordine crescente e seguono in ordine decrescente).
+    La prima colonna deve essere NOT NULL: la condizione ridondante su di essa permette di posizionarsi sull'indice.
+    """
+    disjuncts, params = [], []
+    for i, ((column, descending), value) in enumerate(zip(order, key)):
+        parts = [f"{prev_column} IS ?" for prev_column, _ in order[:i]]
+        part_params = list(key[:i])
+        if value is None:
+            if descending:
+                continue
+            parts.append(f"{column} IS NOT NULL")
+        elif descending:
+            parts.append(f"({column} < ? OR {column} IS NULL)")
+            part_params.append(value)
+        else:
+            parts.append(f"{column} > ?")
+            part_params.append(value)
+        disjuncts.append("(" + " AND ".join(parts) + ")")
+        params += part_params
+    first_column, first_descending = order[0]
+    seek = f"{first_column} {'<=' if first_descending else '>='} ?"
+    return f"{seek} AND ({' OR '.join(disjuncts) or '0'})", [key[0]] + params
+
+class InterpelliPager:
+    """
+    Vista a pagine sugli interpelli: i filtri di _filter_conditions oppure una ricerca testuale (`search_text`).
+    La paginazione è keyset: ogni pagina riparte dalla chiave di ordinamento dell'ultima (o della prima) riga mostrata,
+    quindi costa come la prima in qualunque punto della vista, e in memoria c'è una sola pagina alla volta.
+    """
+
+    def __init__(self, conn, filters=None, search_text=None, page_size=PAGE_SIZE):
+        self.conn = conn
+        self.page_size = page_size
+        self.page_number = 0
+        self.has_next = False
+        self.has_previous = False
+        self._first_key = self._last_key = None
+        self._empty = False
+        column_names = [column.strip() for column in SELECT_COLUMNS.split(",")]
+        if search_text is not None:
+            fts_query = build_fts_query(search_text)
+            self._empty = not fts_query or not has_fts_index(conn)
+            weights = ", ".join(str(weight) for weight in FTS_WEIGHTS)
+            self._source = f"""(SELECT {', '.join('i.' + c for c in column_names)}, bm25(interpelli_fts, {weights}) AS score
+                                FROM interpelli_fts JOIN interpelli i ON i.id = interpelli_fts.rowid
+                                WHERE interpelli_fts MATCH ?)"""
+            self._params = [fts_query]
+            self._conditions = []
+            self._order = SEARCH_KEYSET_ORDER
+        else:
+            self._source = "interpelli"
+            self._conditions, self._params = _filter_conditions(filters or {})
+            self._order = KEYSET_ORDER
+        # Le colonne della chiave che non fanno parte della riga mostrata (es. il punteggio) sono lette in coda.
+        extra_columns = [column for column, _ in self._order if column not in column_names]
+        self._row_width = len(column_names)
+        self._select = ", ".join(column_names + extra_columns)
+        selected = column_names + extra_columns
+        self._key_positions = [selected.index(column) for column, _ in self._order]
+
+    def _query(self, key=None, forward=True, limit=None):
+        order = [(column, descending != (not forward)) for column, descending in self._order]
+        conditions, params = list(self._conditions), list(self._params)
+        if key is not None:
+            condition, condition_params = _keyset_condition(order, key)
+            conditions.append(condition)
+            params += condition_params
+        sql = f"SELECT {self._select} FROM {self._source}"
+        if conditions:
+            sql += " WHERE " + " AND ".join(conditions)
+        sql += " ORDER BY " + ", ".join(f"{column} {'DESC' if descending else 'ASC'}" for column, descending in order)
+        if limit is not None:
+            sql += " LIMIT ?"
+            params.append(limit)
+        return sql, params
+
+    def _fetch(self, key, forward):
+        if self._empty:
+            return [], False
+        sql, params = self._query(key, forward, limit=self.page_size + 1)
+        rows = self.conn.execute(sql, params).fetchall()
+        more = len(rows) > self.page_size
+        rows = rows[:self.page_size]
+        if not forward:
+            rows.reverse()
+        return rows, more
+
+    def _show(self, rows):
+        self._first_key = tuple(rows[0][i] for i in self._key_positions)
+        self._last_key = tuple(rows[-1][i] for i in self._key_positions)
+        return [row[:self._row_width] for row in rows]
+
+    def first_page(self):
+        rows, self.has_next = self._fetch(None, True)
+        self.page_number, self.has_previous = 1, False
+        return self._show(rows) if rows else []
+
+    def next_page(self):
+        """Righe della pagina successiva, o None se la pagina corrente è l'ultima."""
+        if not self.has_next:
+            return None
+        rows, self.has_next = self._fetch(self._last_key, True)
+        if not rows:
+            return None
+        self.page_number += 1
+        self.has_previous = True
+        return self._show(rows)
+
+    def previous_page(self):
+        """Righe della pagina precedente, o None se la pagina corrente è la prima."""
+        if not self.has_previous:
+            return None
+        rows, self.has_previous = self._fetch(self._first_key, False)
+        if not rows:
+            return None
+        self.page_number -= 1
+        self.has_next = True
+        return self._show(rows)
+
+    def iter_rows(self, chunk_size=500):
+        """Tutte le righe della vista, nell'ordine di visualizzazione, lette dal cursore a blocchi di `chunk_size`."""
+        if self._empty:
+            return
+        sql, params = self._query()
+        cur = self.conn.execute(sql, params)
+        while True:
+            chunk = cur.fetchmany(chunk_size)
+            if not chunk:
+                break
+            for row in chunk:
+                yield row[:self._row_width]
 
 def delete_database_file():
     """Cancella il file del database se esiste."""
     if os.path.exists(DB_FILE):
         try:
             os.remove(DB_FILE)
+            # File ausiliari della modalità WAL
+            for suffix in ("-wal", "-shm"):
+                if os.path.exists(DB_FILE + suffix):
+                    os.remove(DB_FILE + suffix)
             return True
         except OSError as e:
             print(f"Errore durante la cancellazione del database: {e}")
@@ -0,0 +1,152 @@
+import asyncio
+import copy
+import hashlib
+import json
+import time
+from sqlite3 import Error
+import database
+
+# Registro dei documenti già elaborati, condiviso tra le esecuzioni: per ogni contenuto (SHA-256)
+# conserva il risultato dell'estrazione, così un PDF ripubblicato o linkato da più articoli
+# viene riconosciuto prima di qualsiasi chiamata all'LLM.
+
+_conn = None
+_in_flight = {}
+_stats = {'reused': 0, 'extracted': 0, 'not_modified': 0}
+
+
+def _get_connection():
+    global _conn
+    if _conn is None:
+        _conn = database.create_connection(check_same_thread=False)
+        if _conn is None:
+            return None
+        try:
+            _conn.execute("""
+                CREATE TABLE IF NOT EXISTS processed_documents (
+                    content_hash TEXT PRIMARY KEY,
+                    extracted_json TEXT NOT NULL,
+                    processed_at REAL NOT NULL
+                )
+            """)
+            _conn.execute("""
+                CREATE TABLE IF NOT EXISTS document_urls (
+                    url TEXT PRIMARY KEY,
+                    content_hash TEXT NOT NULL,
+                    seen_at REAL NOT NULL
+                )
+            """)
+            _conn.commit()
+        except Error as e:
+            print(f"Errore durante l'apertura del registro dei documenti: {e}")
+            _conn = None
+    return _conn
+
+
+def hash_content(content):
+    return hashlib.sha256(content).hexdigest()
+
+
+def lookup(content_hash):
+    """Restituisce il risultato di estrazione salvato per questo contenuto, o None."""
+    conn = _get_connection()
+    if conn is None:
+        return None
+    row = conn.execute("SELECT extracted_json FROM processed_documents WHERE content_hash = ?", (content_hash,)).fetchone()
+    return json.loads(row[0]) if row else None
+
+
+def lookup_url(url):
+    """
+    Per un URL già elaborato restituisce (hash_del_contenuto, dati_estratti) dell'ultima versione vista, o None.
+    Serve a evitare il download: se il server conferma con un 304 che il documento non è cambiato, si riusano i dati.
+    """
+    conn = _get_connection()
+    if conn is None:
+        return None
+    row = conn.execute("""SELECT u.content_hash, p.extracted_json FROM document_urls u
+                          JOIN processed_documents p ON p.content_hash = u.content_hash
+                          WHERE u.url = ?""", (url,)).fetchone()
+    return (row[0], json.loads(row[1])) if row else None
+
+
+def note_not_modified(url, content_hash):
+    """Registra che l'URL, confermato invariato dal server, punta ancora allo stesso contenuto."""
+    _stats['not_modified'] += 1
+    record(url, content_hash)
+
+
+def record(url, content_hash, extracted_data=None):
+    """Associa l'URL al contenuto e, se presente, salva il risultato dell'estrazione."""
+    conn = _get_connection()
+    if conn is None:
+        return
+    now = time.time()
+    try:
+        with conn:
+            if extracted_data is not None:
+                conn.execute("INSERT OR REPLACE INTO processed_documents(content_hash, extracted_json, processed_at) VALUES(?,?,?)",
+                             (content_hash, json.dumps(extracted_data, ensure_ascii=False), now))
+            conn.execute("INSERT OR REPLACE INTO document_urls(url, content_hash, seen_at) VALUES(?,?,?)", (url, content_hash, now))
+    except Error as e:
+        print(f"Errore durante l'aggiornamento del registro dei documenti: {e}")
+
+
+async def get_or_extract(url, content, extract, logger):
+    """
+    Restituisce i dati estratti per `content`: dal registro se il documento è già stato elaborato
+    (anche con un altro URL o in un'esecuzione precedente), altrimenti chiamando `extract()`.
+    Le richieste contemporanee per lo stesso contenuto attendono un'unica estrazione.
+    """
+    content_hash = hash_content(content)
+    stored = lookup(content_hash)
+    if stored is not None:
+        logger.info(f"Documento {url} già elaborato (sha256 {content_hash[:12]}): riuso i dati salvati.")
+        _stats['reused'] += 1
+        record(url, content_hash)
+        return stored
+
+    pending = _in_flight.get(content_hash)
+    if pending is not None and not pending.done():
+        logger.info(f"Documento {url} identico a uno in elaborazione (sha256 {content_hash[:12]}): attendo il risultato.")
+        _stats['reused'] += 1
+        return copy.deepcopy(await asyncio.shield(pending))
+
+    future = asyncio.get_running_loop().create_future()
+    _in_flight[content_hash] = future
+    try:
+        extracted_data = await extract()
+        _stats['extracted'] += 1
+        # Anche un risultato vuoto (documento senza interpelli) è registrato: non va estratto di nuovo.
+        if extracted_data is not None:
+            record(url, content_hash, extracted_data)
+        # I chiamanti modificano i dati (provincia, url_sorgente): ognuno riceve una copia.
+        future.set_result(copy.deepcopy(extracted_data))
+        return extracted_data
+    except asyncio.CancelledError:
+        future.cancel()
+        raise
+    except Exception as e:
+        future.set_exception(e)
+        # Evita l'avviso "exception was never retrieved" se nessun altro era in attesa.
+        future.exception()
+        raise
+    finally:
+        _in_flight.pop(content_hash, None)
+
+
+def get_stats():
+    return dict(_stats)
+
+
+def reset_stats():
+    _stats['reused'] = 0
+    _stats['extracted'] = 0
+    _stats['not_modified'] = 0
+
+
+def close():
+    global _conn
+    if _conn is not None:
+        _conn.close()
+        _conn = None
@@ -0,0 +1,127 @@
+import csv
+import json
+import time
+from itertools import chain, groupby, islice
+from reportlab.platypus import SimpleDocTemplate, Table as PdfTable, TableStyle, Paragraph, Spacer
+from reportlab.lib.styles import getSampleStyleSheet
+from reportlab.lib.pagesizes import landscape, letter
+from reportlab.lib import colors
+import database
+
+# Esportazione delle viste del database. Le righe arrivano dal cursore SQLite a blocchi (InterpelliPager.iter_rows)
+# e ogni formato le scrive man mano: nessun formato tiene in memoria l'intera vista.
+
+EXPORT_CHUNK_SIZE = 500   # righe lette dal cursore per ogni blocco
+PDF_ROWS_PER_TABLE = 40   # righe per tabella nel PDF (circa una pagina)
+PDF_LOOKAHEAD = 8         # flowable preparati in anticipo per reportlab
+
+COLUMNS = [column.strip() for column in database.SELECT_COLUMNS.split(",")]
+
+PDF_TABLE_STYLE = TableStyle([
+    ('BACKGROUND', (0,0), (-1,0), colors.grey), ('TEXTCOLOR',(0,0),(-1,0),colors.whitesmoke),
+    ('ALIGN', (0,0), (-1,-1), 'CENTER'), ('FONTNAME', (0,0), (-1,0), 'Helvetica-Bold'),
+    ('BOTTOMPADDING', (0,0), (-1,0), 12), ('BACKGROUND', (0,1), (-1,-1), colors.beige),
+    ('GRID', (0,0), (-1,-1), 1, colors.black)
+])
+
+
+def write_csv(rows, filename):
+    with open(filename, 'w', encoding='utf-8', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(COLUMNS)
+        count = 0
+        for row in rows:
+            writer.writerow(row)
+            count += 1
+    return count
+
+
+def write_jsonl(rows, filename):
+    """Un oggetto JSON per riga, con i nomi delle colonne come chiavi."""
+    with open(filename, 'w', encoding='utf-8') as f:
+        count = 0
+        for row in rows:
+            f.write(json.dumps(dict(zip(COLUMNS, row)), ensure_ascii=False) + "\n")
+            count += 1
+    return count
+
+
+class _LazyFlowables(list):
+    """
+    Lista di flowable per `build` di reportlab riempita a poco a poco da un generatore: build consuma la lista
+    dalla testa controllandone la lunghezza a ogni passo, quindi basta tenere pronti pochi elementi alla volta.
+    """
+
+    def __init__(self, source, lookahead=PDF_LOOKAHEAD):
+        super().__init__()
+        self._source = iter(source)
+        self._lookahead = lookahead
+
+    def __len__(self):
+        while self._source is not None and list.__len__(self) < self._lookahead:
+            try:
+                self.append(next(self._source))
+            except StopIteration:
+                self._source = None
+        return list.__len__(self)
+
+
+def _pdf_flowables(rows, counter):
+    styles = getSampleStyleSheet()
+    yield Paragraph("Report Interpelli", styles['h1'])
+    # Le righe sono già ordinate per provincia (o per pertinenza): si raggruppano quelle consecutive.
+    for provincia, province_rows in groupby(rows, key=lambda row: row[4]):
+        yield Spacer(1, 24)
+        yield Paragraph(f"Provincia: {(provincia or 'N/D').upper()}", styles['h2'])
+        yield Spacer(1, 12)
+        province_rows = iter(province_rows)
+        while True:
+            batch = list(islice(province_rows, PDF_ROWS_PER_TABLE))
+            if not batch:
+                break
+            data = [["ID", "Scuola", "Città", "Fine Incarico", "CDC", "Ore", "Cattedra"]]
+            for row in batch:
+                (id_interpello, nome_scuola, _, citta, _, data_fine, cdc, ore, cattedra, _, _) = row
+                data.append([
+                    str(id_interpello), str(nome_scuola or 'N/D'), str(citta or 'N/D'),
+                    str(data_fine or 'N/D'), str(cdc or 'N/D'), str(ore or 'N/D'), str(cattedra or 'N/D')
+                ])
+            counter[0] += len(batch)
+            pdf_table = PdfTable(data, repeatRows=1)
+            pdf_table.setStyle(PDF_TABLE_STYLE)
+            yield pdf_table
+
+
+def write_pdf(rows, filename):
+    """
+    Scrive il PDF a blocchi di PDF_ROWS_PER_TABLE righe: le tabelle sono create solo quando reportlab arriva a
+    impaginarle. Restano in memoria le pagine già impaginate (in forma compatta) fino al salvataggio del file.
+    """
+    counter = [0]
+    doc = SimpleDocTemplate(filename, pagesize=landscape(letter))
+    doc.build(_LazyFlowables(_pdf_flowables(rows, counter)))
+    return counter[0]
+
+
+WRITERS = {
+    'pdf': write_pdf,
+    'csv': write_csv,
+    'jsonl': write_jsonl,
+}
+
+
+def export_view(pager, export_format, filename=None):
+    """
+    Esporta tutte le righe della vista `pager` (database.InterpelliPager) nel formato indicato ('pdf', 'csv', 'jsonl').
+    Restituisce il nome del file creato, o None se la vista è vuota.
+    """
+    rows = pager.iter_rows(chunk_size=EXPORT_CHUNK_SIZE)
+    first_row = next(rows, None)
+    if first_row is None:
+        print("Nessun dato da esportare.")
+        return None
+
+    filename = filename or f"report_interpelli_{time.strftime('%Y%m%d-%H%M%S')}.{export_format}"
+    count = WRITERS[export_format](chain([first_row], rows), filename)
+    print(f"\n{count} interpelli esportati con successo nel file: {filename}")
+    return filename
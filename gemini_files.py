@@ -0,0 +1,84 @@
+import asyncio
+import logging
+import google.generativeai as genai
+
+# Le chiamate della File API di Gemini sono sincrone: vengono eseguite in un thread per non bloccare l'event loop.
+
+MIN_POLL_INTERVAL = 0.5
+MAX_POLL_INTERVAL = 5.0
+POLL_BACKOFF_FACTOR = 1.5
+
+
+async def upload_file(path, display_name=None):
+    return await asyncio.to_thread(genai.upload_file, path=path, display_name=display_name or path)
+
+
+async def delete_file(uploaded_file, logger=None):
+    """Elimina il file remoto; gli errori sono solo registrati, il file scade comunque dopo 48 ore."""
+    try:
+        await asyncio.to_thread(genai.delete_file, uploaded_file.name)
+    except Exception as e:
+        (logger or logging.getLogger()).warning(f"Impossibile eliminare il file remoto {uploaded_file.name}: {e}")
+
+
+class FileStatePoller:
+    """
+    Attende che i file caricati escano dallo stato PROCESSING con un unico ciclo di polling condiviso:
+    a ogni giro tutti i file in attesa vengono controllati insieme. L'intervallo parte da MIN_POLL_INTERVAL,
+    cresce quando nulla cambia e torna al minimo quando arriva un nuovo file o uno stato cambia.
+    """
+    def __init__(self):
+        self._pending = {}
+        self._task = None
+        self._loop = None
+        self._interval = MIN_POLL_INTERVAL
+
+    async def wait_until_processed(self, uploaded_file):
+        if uploaded_file.state.name != "PROCESSING":
+            return uploaded_file
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            # Nuova esecuzione (nuovo event loop): lo stato della precedente non è più valido.
+            self._pending = {}
+            self._task = None
+            self._loop = loop
+        future = loop.create_future()
+        self._pending.setdefault(uploaded_file.name, []).append(future)
+        self._interval = MIN_POLL_INTERVAL
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._poll_loop())
+        return await future
+
+    async def _poll_loop(self):
+        while self._pending:
+            await asyncio.sleep(self._interval)
+            names = list(self._pending)
+            results = await asyncio.gather(*[asyncio.to_thread(genai.get_file, name) for name in names], return_exceptions=True)
+            changed = False
+            for name, result in zip(names, results):
+                if not isinstance(result, Exception) and result.state.name == "PROCESSING":
+                    continue
+                changed = True
+                for future in self._pending.pop(name, []):
+                    if future.done():
+                        continue
+                    if isinstance(result, Exception):
+                        future.set_exception(result)
+                    else:
+                        future.set_result(result)
+            # Rimuove le attese annullate (es. worker interrotti)
+            for name in list(self._pending):
+                self._pending[name] = [f for f in self._pending[name] if not f.done()]
+                if not self._pending[name]:
+                    del self._pending[name]
+            if changed:
+                self._interval = MIN_POLL_INTERVAL
+            else:
+                self._interval = min(MAX_POLL_INTERVAL, self._interval * POLL_BACKOFF_FACTOR)
+
+
+_poller = FileStatePoller()
+
+
+async def wait_until_processed(uploaded_file):
+    return await _poller.wait_until_processed(uploaded_file)
@@ -0,0 +1,101 @@
+import re
+from urllib.parse import urljoin
+from bs4 import BeautifulSoup, Comment
+
+# Elementi del tema WordPress dei siti UST che non contengono mai dati utili per l'LLM.
+NOISE_TAGS = ['script', 'style', 'noscript', 'svg', 'form', 'button', 'input', 'select',
+              'nav', 'footer', 'aside', 'link', 'meta', 'head', 'picture', 'img', 'video', 'audio']
+NOISE_SELECTORS = ['[role=navigation]', '[role=banner]', '[role=contentinfo]', '[aria-hidden=true]',
+                   '.menu', '.navbar', '.breadcrumb', '.breadcrumbs', '.sidebar', '.widget', '.cookie',
+                   '#cookie-law-info-bar', '#masthead', '.site-header', '.share', '.social', '.skip-link', '.screen-reader-text']
+# I `<header>` dentro un articolo (es. `entry-header` di WordPress) contengono titolo e link dell'articolo:
+# si rimuovono solo quelli del sito, fuori da article/main.
+CONTENT_CONTAINERS = ['article', 'main']
+# Contenuti incorporati (anteprime di Google Drive, PDF incorporati): l'indirizzo è conservato come link.
+EMBED_TAGS = {'iframe': 'src', 'embed': 'src', 'object': 'data'}
+# Regioni candidate per il contenuto principale, in ordine di preferenza.
+MAIN_CONTENT_SELECTORS = ['main', '[role=main]', '#main', '#content', '.site-content', '#primary', '.entry-content', 'article']
+
+# Se la regione principale contiene meno di questa frazione del testo della pagina, si usa l'intero body ripulito.
+MIN_MAIN_TEXT_RATIO = 0.1
+CHARS_PER_TOKEN = 4
+
+
+def estimate_tokens(text):
+    """Stima approssimativa dei token (circa 4 caratteri per token)."""
+    return len(text or "") // CHARS_PER_TOKEN
+
+
+def _select_main_region(soup):
+    body = soup.body or soup
+    body_text_len = len(body.get_text(strip=True))
+    for selector in MAIN_CONTENT_SELECTORS:
+        region = soup.select_one(selector)
+        if region is not None and len(region.get_text(strip=True)) >= body_text_len * MIN_MAIN_TEXT_RATIO:
+            return region
+    return body
+
+
+def reduce_html(html_content, base_url=None):
+    """
+    Riduce l'HTML di una pagina al solo contenuto principale: testo e link `<a>` (con URL assoluti).
+    Il risultato è un HTML minimale, molto più piccolo dell'originale ma con le stesse informazioni utili.
+    """
+    if not html_content:
+        return html_content
+
+    soup = BeautifulSoup(html_content, 'html.parser')
+    for comment in soup.find_all(string=lambda s: isinstance(s, Comment)):
+        comment.extract()
+    for tag in soup.find_all(list(EMBED_TAGS)):
+        src = tag.get(EMBED_TAGS[tag.name])
+        if not src or src.startswith(('about:', 'javascript:')):
+            tag.decompose()
+            continue
+        anchor = soup.new_tag('a', href=src)
+        anchor.string = tag.get('title') or "Documento incorporato"
+        tag.replace_with(anchor)
+    for tag in soup.find_all(NOISE_TAGS):
+        tag.decompose()
+    for header in soup.find_all('header'):
+        if header.find_parent(CONTENT_CONTAINERS) is None:
+            header.decompose()
+    for selector in NOISE_SELECTORS:
+        for tag in soup.select(selector):
+            tag.decompose()
+
+    region = _select_main_region(soup)
+
+    for anchor in region.find_all('a'):
+        href = anchor.get('href')
+        text = " ".join(anchor.get_text(" ", strip=True).split())
+        if not href or href.startswith(('#', 'javascript:', 'mailto:')):
+            anchor.replace_with(text)
+            continue
+        if base_url:
+            href = urljoin(base_url, href)
+        anchor.replace_with(f'<a href="{href}">{text}</a>')
+
+    text = region.get_text("\n")
+    lines = [" ".join(line.split()) for line in text.splitlines()]
+    reduced = "\n".join(line for line in lines if line)
+    return re.sub(r'\n{3,}', '\n\n', reduced)
+
+
+def reduce_for_llm(html_content, url, logger):
+    """Riduce l'HTML e registra nel log la stima dei token prima e dopo la riduzione."""
+    if not html_content:
+        return html_content
+    try:
+        reduced = reduce_html(html_content, url)
+    except Exception as e:
+        logger.warning(f"Riduzione HTML fallita per {url}, uso l'HTML originale: {e}")
+        return html_content
+    if not reduced.strip():
+        logger.warning(f"Riduzione HTML vuota per {url}, uso l'HTML originale.")
+        return html_content
+    before = estimate_tokens(html_content)
+    after = estimate_tokens(reduced)
+    saving = 1 - after / before if before else 0
+    logger.info(f"Riduzione HTML per {url}: ~{before} -> ~{after} token stimati (-{saving:.0%})")
+    return reduced
@@ -0,0 +1,205 @@
+import hashlib
+import os
+import sqlite3
+import time
+from sqlite3 import Error
+
+# Archivio locale delle risposte HTTP: metadati (ETag, Last-Modified, hash) in SQLite,
+# corpi delle pagine salvati su disco e indirizzati per contenuto. Dei documenti (PDF) si salvano solo
+# i metadati: il contenuto resta in memoria fino all'estrazione e non viene scritto su disco.
+STORE_FILE = "http_cache.sqlite"
+BODY_FOLDER = "http_cache"
+# Pulizia all'apertura: voci non più scaricate da MAX_AGE_DAYS giorni e, oltre MAX_SIZE_MB, i corpi usati meno di recente.
+MAX_AGE_DAYS = 30
+MAX_SIZE_MB = 200
+
+STATUS_NEW = "new"
+STATUS_CHANGED = "changed"
+STATUS_UNCHANGED = "unchanged"
+
+_conn = None
+_run_status = {}
+
+
+def _get_connection():
+    global _conn
+    if _conn is None:
+        try:
+            _conn = sqlite3.connect(STORE_FILE, check_same_thread=False)
+            _conn.execute("""
+                CREATE TABLE IF NOT EXISTS http_entries (
+                    url TEXT PRIMARY KEY,
+                    etag TEXT,
+                    last_modified TEXT,
+                    body_hash TEXT NOT NULL,
+                    encoding TEXT,
+                    fetched_at REAL NOT NULL
+                )
+            """)
+            _conn.commit()
+            evict()
+        except Error as e:
+            print(f"Errore durante l'apertura dell'archivio HTTP: {e}")
+            _conn = None
+    return _conn
+
+
+def _body_path(body_hash):
+    return os.path.join(BODY_FOLDER, body_hash[:2], body_hash)
+
+
+def _get_entry(url):
+    conn = _get_connection()
+    if conn is None:
+        return None
+    row = conn.execute("SELECT etag, last_modified, body_hash, encoding FROM http_entries WHERE url = ?", (url,)).fetchone()
+    if row is None:
+        return None
+    return {'etag': row[0], 'last_modified': row[1], 'body_hash': row[2], 'encoding': row[3]}
+
+
+def conditional_headers(url, body_hash=None):
+    """
+    Header If-None-Match / If-Modified-Since per un URL già scaricato, se il corpo è ancora in archivio.
+    Per i documenti, di cui si salvano solo i metadati, si passa `body_hash`: gli header sono inviati solo se la voce
+    si riferisce a quel contenuto (un 304 conferma allora che il documento è ancora quello).
+    """
+    entry = _get_entry(url)
+    if entry is None:
+        return {}
+    if body_hash is not None:
+        if entry['body_hash'] != body_hash:
+            return {}
+    elif not os.path.exists(_body_path(entry['body_hash'])):
+        return {}
+    headers = {}
+    if entry['etag']:
+        headers['If-None-Match'] = entry['etag']
+    if entry['last_modified']:
+        headers['If-Modified-Since'] = entry['last_modified']
+    return headers
+
+
+def mark_not_modified(url):
+    """Registra una risposta 304 per `url`: aggiorna la data dell'ultimo recupero e lo stato della scansione."""
+    conn = _get_connection()
+    if conn is None:
+        return
+    conn.execute("UPDATE http_entries SET fetched_at = ? WHERE url = ?", (time.time(), url))
+    conn.commit()
+    _run_status.setdefault(url, STATUS_UNCHANGED)
+
+
+def load_not_modified(url):
+    """Gestisce una risposta 304: restituisce (corpo, encoding) dall'archivio, oppure (None, None) se mancante."""
+    entry = _get_entry(url)
+    if entry is None:
+        return None, None
+    try:
+        with open(_body_path(entry['body_hash']), 'rb') as f:
+            body = f.read()
+    except OSError:
+        return None, None
+    mark_not_modified(url)
+    return body, entry['encoding']
+
+
+def save_response(url, body, etag=None, last_modified=None, encoding=None, store_body=True):
+    """
+    Salva una risposta completa e restituisce lo stato rispetto all'esecuzione precedente (new/changed/unchanged).
+    Con `store_body=False` (documenti) si registrano solo i validatori e l'hash, senza scrivere il corpo su disco.
+    """
+    body_hash = hashlib.sha256(body).hexdigest()
+    previous = _get_entry(url)
+    if previous is None:
+        status = STATUS_NEW
+    elif previous['body_hash'] == body_hash:
+        status = STATUS_UNCHANGED
+    else:
+        status = STATUS_CHANGED
+    # Conta il primo recupero della sessione: è il confronto con l'esecuzione precedente.
+    _run_status.setdefault(url, status)
+
+    conn = _get_connection()
+    if conn is None:
+        return status
+    try:
+        path = _body_path(body_hash)
+        if store_body and not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, 'wb') as f:
+                f.write(body)
+        conn.execute(
+            "INSERT OR REPLACE INTO http_entries(url, etag, last_modified, body_hash, encoding, fetched_at) VALUES(?,?,?,?,?,?)",
+            (url, etag, last_modified, body_hash, encoding, time.time())
+        )
+        conn.commit()
+    except (Error, OSError) as e:
+        print(f"Errore durante il salvataggio nell'archivio HTTP per {url}: {e}")
+    return status
+
+
+def _remove_body(body_hash):
+    try:
+        os.remove(_body_path(body_hash))
+    except FileNotFoundError:
+        pass
+
+
+def evict(max_age_days=MAX_AGE_DAYS, max_size_mb=MAX_SIZE_MB):
+    """
+    Rimuove le voci non aggiornate da più di `max_age_days` giorni e, se i corpi su disco superano `max_size_mb`,
+    quelle recuperate meno di recente. Un corpo è cancellato quando nessuna voce lo usa più; vengono cancellati
+    anche i file rimasti orfani (es. PDF salvati da versioni precedenti). Restituisce il numero di voci rimosse.
+    """
+    conn = _conn
+    if conn is None:
+        return 0
+    removed = 0
+    try:
+        cur = conn.execute("DELETE FROM http_entries WHERE fetched_at < ?", (time.time() - max_age_days * 86400,))
+        removed += cur.rowcount
+        # Ultimo recupero di ogni corpo, dal più vecchio al più recente.
+        last_fetched = conn.execute("""SELECT body_hash FROM http_entries
+                                       GROUP BY body_hash ORDER BY MAX(fetched_at)""").fetchall()
+        referenced = {body_hash for (body_hash,) in last_fetched}
+        sizes = {}
+        if os.path.isdir(BODY_FOLDER):
+            for folder, _, files in os.walk(BODY_FOLDER):
+                for name in files:
+                    if name in referenced:
+                        sizes[name] = os.path.getsize(os.path.join(folder, name))
+                    else:
+                        os.remove(os.path.join(folder, name))
+        total = sum(sizes.values())
+        max_bytes = max_size_mb * 1024 * 1024
+        for (body_hash,) in last_fetched:
+            if total <= max_bytes:
+                break
+            if body_hash not in sizes:
+                continue
+            removed += conn.execute("DELETE FROM http_entries WHERE body_hash = ?", (body_hash,)).rowcount
+            _remove_body(body_hash)
+            total -= sizes[body_hash]
+        conn.commit()
+    except (Error, OSError) as e:
+        print(f"Errore durante la pulizia dell'archivio HTTP: {e}")
+    return removed
+
+
+def reset_run_status():
+    _run_status.clear()
+
+
+def get_run_summary():
+    summary = {STATUS_NEW: 0, STATUS_CHANGED: 0, STATUS_UNCHANGED: 0}
+    for status in _run_status.values():
+        summary[status] += 1
+    return summary
+
+
+def close():
+    global _conn
+    if _conn is not None:
+        _conn.close()
+        _conn = None
@@ -0,0 +1,143 @@
+import hashlib
+import json
+import os
+import sqlite3
+import time
+from sqlite3 import Error
+
+# Cache persistente delle risposte di Gemini, indicizzata per modello, prompt e hash dell'input.
+CACHE_FILE = "llm_cache.sqlite"
+MAX_AGE_DAYS = 30
+MAX_SIZE_MB = 200
+
+# Impostare AINTERPELLI_NO_LLM_CACHE=1 (anche nel file .env) per ignorare la cache.
+BYPASS_ENV_VAR = "AINTERPELLI_NO_LLM_CACHE"
+
+_conn = None
+_stats = {'hits': 0, 'misses': 0, 'stores': 0, 'evicted': 0}
+
+
+def is_bypassed():
+    return os.getenv(BYPASS_ENV_VAR, "").strip().lower() in ("1", "true", "si", "yes")
+
+
+def _get_connection():
+    global _conn
+    if _conn is None:
+        try:
+            _conn = sqlite3.connect(CACHE_FILE, check_same_thread=False)
+            _conn.execute("""
+                CREATE TABLE IF NOT EXISTS responses (
+                    cache_key TEXT PRIMARY KEY,
+                    model_name TEXT NOT NULL,
+                    response_text TEXT NOT NULL,
+                    size_bytes INTEGER NOT NULL,
+                    created_at REAL NOT NULL,
+                    last_access REAL NOT NULL
+                )
+            """)
+            _conn.execute("CREATE INDEX IF NOT EXISTS idx_responses_last_access ON responses(last_access)")
+            _conn.commit()
+            evict()
+        except Error as e:
+            print(f"Errore durante l'apertura della cache LLM: {e}")
+            _conn = None
+    return _conn
+
+
+def hash_content(content):
+    """Restituisce lo SHA-256 del contenuto (HTML come stringa o byte di un PDF)."""
+    if isinstance(content, str):
+        content = content.encode('utf-8')
+    return hashlib.sha256(content).hexdigest()
+
+
+def make_key(model_name, prompt, content_hash):
+    """Chiave della cache: dipende dal modello, dal testo del prompt e dall'hash dell'input."""
+    raw_key = json.dumps([model_name, prompt, content_hash], ensure_ascii=False)
+    return hashlib.sha256(raw_key.encode('utf-8')).hexdigest()
+
+
+def get(key):
+    """Restituisce il testo della risposta in cache o None."""
+    if is_bypassed():
+        return None
+    conn = _get_connection()
+    if conn is None:
+        return None
+    try:
+        row = conn.execute("SELECT response_text, created_at FROM responses WHERE cache_key = ?", (key,)).fetchone()
+        if row and row[1] >= time.time() - MAX_AGE_DAYS * 86400:
+            conn.execute("UPDATE responses SET last_access = ? WHERE cache_key = ?", (time.time(), key))
+            conn.commit()
+            _stats['hits'] += 1
+            return row[0]
+    except Error as e:
+        print(f"Errore durante la lettura della cache LLM: {e}")
+    _stats['misses'] += 1
+    return None
+
+
+def put(key, model_name, response_text):
+    """Salva una risposta valida nella cache."""
+    if is_bypassed() or response_text is None:
+        return
+    conn = _get_connection()
+    if conn is None:
+        return
+    now = time.time()
+    try:
+        conn.execute(
+            "INSERT OR REPLACE INTO responses(cache_key, model_name, response_text, size_bytes, created_at, last_access) VALUES(?,?,?,?,?,?)",
+            (key, model_name, response_text, len(response_text.encode('utf-8')), now, now)
+        )
+        conn.commit()
+        _stats['stores'] += 1
+    except Error as e:
+        print(f"Errore durante la scrittura nella cache LLM: {e}")
+
+
+def evict(max_age_days=MAX_AGE_DAYS, max_size_mb=MAX_SIZE_MB):
+    """Rimuove le voci scadute e, se la cache supera la dimensione massima, quelle usate meno di recente."""
+    conn = _conn
+    if conn is None:
+        return 0
+    removed = 0
+    try:
+        cur = conn.execute("DELETE FROM responses WHERE created_at < ?", (time.time() - max_age_days * 86400,))
+        removed += cur.rowcount
+        max_bytes = max_size_mb * 1024 * 1024
+        total = conn.execute("SELECT COALESCE(SUM(size_bytes), 0) FROM responses").fetchone()[0]
+        if total > max_bytes:
+            for cache_key, size_bytes in conn.execute("SELECT cache_key, size_bytes FROM responses ORDER BY last_access").fetchall():
+                if total <= max_bytes:
+                    break
+                conn.execute("DELETE FROM responses WHERE cache_key = ?", (cache_key,))
+                total -= size_bytes
+                removed += 1
+        conn.commit()
+    except Error as e:
+        print(f"Errore durante la pulizia della cache LLM: {e}")
+    _stats['evicted'] += removed
+    return removed
+
+
+def reset_stats():
+    """Azzera i contatori all'inizio di ogni scansione, così il riepilogo riguarda solo quella."""
+    for key in _stats:
+        _stats[key] = 0
+
+
+def get_stats():
+    """Restituisce una copia dei contatori di hit/miss della sessione corrente."""
+    stats = dict(_stats)
+    lookups = stats['hits'] + stats['misses']
+    stats['hit_rate'] = stats['hits'] / lookups if lookups else 0.0
+    return stats
+
+
+def close():
+    global _conn
+    if _conn is not None:
+        _conn.close()
+        _conn = None
@@ -1,22 +1,21 @@
-import google.generativeai as genai
 import json
+import os
+import tempfile
 import time
 from urllib.parse import urljoin
 import logging
 import asyncio
-
-# --- CARICAMENTO DELLA BASE DI CONOSCENZA DELLE CLASSI DI CONCORSO ---
-try:
-    with open('classi_concorso.json', 'r', encoding='utf-8') as f:
-        CDC_DATA = json.load(f)
-    # Convertiamo la lista di oggetti in una stringa JSON formattata per il prompt
-    CDC_CONTEXT_JSON = json.dumps(CDC_DATA, indent=2, ensure_ascii=False)
-except FileNotFoundError:
-    print("ERRORE CRITICO: Il file 'classi_concorso.json' non è stato trovato. Assicurati che sia nella stessa cartella.")
-    CDC_CONTEXT_JSON = "[]"
-except json.JSONDecodeError:
-    print("ERRORE CRITICO: Il file 'classi_concorso.json' contiene un errore di formattazione.")
-    CDC_CONTEXT_JSON = "[]"
+import config
+import cassette
+import llm_cache
+import gemini_files
+import html_reducer
+import pdf_text
+import cdc_resolver
+import llm_schemas
+import llm_usage
+import metrics
+from rate_limiter import TokenBucketLimiter
 
 # --- PROMPT ---
 
@@ -52,30 +51,47 @@ Il tuo compito è analizzare il seguente HTML di una pagina di avviso e trovare
 L'URL di base per questa pagina è: {base_url}. Assicurati che tutti gli URL siano assoluti.
 
 Formato per `extracted_data` (se presente):
-`{{"nome_scuola": "Nome...", "indirizzo": "Indirizzo...", "citta": "Città...", "data_fine_incarico": "DD/MM/YYYY", "classe_di_concorso": "Codice...", "numero_di_ore": 18, "tipo_cattedra": "Tipo..."}}`
+`{{"nome_scuola": "Nome...", "indirizzo": "Indirizzo...", "citta": "Città...", "data_fine_incarico": "DD/MM/YYYY", "materia": "Materia o classe di concorso come scritta nel testo...", "numero_di_ore": 18, "tipo_cattedra": "Tipo..."}}`
 """
 
-# --- PROMPT DI ESTRAZIONE DATI DINAMICO ---
-DATA_EXTRACTION_PROMPT_TEMPLATE = f"""
-Sei un esperto del sistema scolastico italiano. Il tuo compito è analizzare il documento o il testo HTML fornito e estrarre le seguenti informazioni in formato JSON.
+BATCH_UNIVERSAL_DATA_FINDER_PROMPT = """
+Sei un assistente esperto nell'analisi di avvisi scolastici italiani.
+Riceverai PIÙ pagine di avviso, ognuna preceduta da un'intestazione `=== DOCUMENTO <id> | URL di base: <url> ===`.
+Analizza ogni documento SEPARATAMENTE e in modo indipendente dagli altri, seguendo questa logica:
+
+1.  **CERCA PRIMA I LINK**: cerca link `<a>` che puntano a documenti o portali esterni.
+2.  **CATEGORIZZA I LINK**:
+    - Se un link finisce con `.pdf`, `.doc`, `.docx`, mettilo nella lista `file_links`.
+    - Se un link punta a `drive.google.com`, mettilo nella lista `gdrive_links`.
+    - Se un link punta a portali noti come `axioscloud.it`, `nuvola.madisoft.it`, `argo.net`, `spaggiari.eu`, mettilo nella lista `portal_links`.
+3.  **SE TROVI QUALSIASI TIPO DI LINK**: restituisci le liste di link trovate e `extracted_data` deve essere `null`.
+4.  **SE E SOLO SE NON TROVI NESSUN LINK**: estrai direttamente i dati dell'interpello dal testo e mettili in `extracted_data`.
+
+**Formato JSON di risposta OBBLIGATORIO** (un elemento per ogni documento, con lo stesso id):
+`{"results": [{"id": "<id>", "file_links": [], "gdrive_links": [], "portal_links": [], "extracted_data": OGGETTO_DATI_O_NULL}]}`
+
+Gli URL devono essere assoluti, rispetto all'URL di base del documento a cui appartengono.
 
-### CONTESTO E CODICI DI RIFERIMENTO ###
-Usa la seguente lista JSON come riferimento per dedurre la Classe di Concorso (CDC) corretta, anche se il codice non è scritto esplicitamente.
-Cerca nel testo una delle descrizioni o degli "alias" e restituisci il "codice" corrispondente. Se trovi un codice esplicito (es. A041), usa quello.
+Formato per `extracted_data` (se presente):
+`{"nome_scuola": "Nome...", "indirizzo": "Indirizzo...", "citta": "Città...", "data_fine_incarico": "DD/MM/YYYY", "materia": "Materia o classe di concorso come scritta nel testo...", "numero_di_ore": 18, "tipo_cattedra": "Tipo..."}`
+"""
 
-**LISTA DI RIFERIMENTO CDC:**
-{CDC_CONTEXT_JSON}
+# --- PROMPT DI ESTRAZIONE DATI ---
+# La classe di concorso non viene dedotta dal modello: si chiede il testo della materia,
+# che viene poi risolto localmente in un codice da cdc_resolver (vedi _resolve_classi_di_concorso).
+DATA_EXTRACTION_PROMPT_TEMPLATE = """
+Sei un esperto del sistema scolastico italiano. Il tuo compito è analizzare il documento o il testo HTML fornito e estrarre le seguenti informazioni in formato JSON.
 
 ### FORMATO JSON RICHIESTO ###
-{{
+{
   "nome_scuola": "Nome completo dell'istituto scolastico",
   "indirizzo": "Indirizzo completo della scuola (via, numero civico)",
   "citta": "Città della scuola",
   "data_fine_incarico": "Data di fine dell'incarico (formato DD/MM/YYYY)",
-  "classe_di_concorso": "Codice della classe di concorso dedotto o trovato",
+  "materia": "Materia o classe di concorso esattamente come scritta nel documento, compreso l'eventuale codice (es. 'A022 - Italiano, storia, geografia')",
   "numero_di_ore": "Numero intero di ore settimanali",
   "tipo_cattedra": "Descrizione del tipo di cattedra (es. Cattedra Interna, Spezzone, COE)"
-}}
+}
 
 Analizza attentamente il documento per trovare tutti i dati. Se un'informazione non è presente, lascia il campo come null.
 """
@@ -83,22 +99,228 @@ Analizza attentamente il documento per trovare tutti i dati. Se un'informazione
 # Assegniamo il template compilato a una variabile per usarlo nelle funzioni
 DATA_EXTRACTION_PROMPT = DATA_EXTRACTION_PROMPT_TEMPLATE
 
+# --- PROMPT DI CORREZIONE ---
+# Usati con il modello veloce quando una risposta non è JSON valido o un singolo campo non supera la validazione.
+
+JSON_REPAIR_PROMPT = """
+Il testo seguente doveva essere un JSON valido ma contiene errori di sintassi.
+Restituisci lo stesso contenuto come JSON valido, senza aggiungere, togliere o modificare i dati.
+"""
+
+FIELD_REPAIR_PROMPT = """
+Nel dato di un interpello scolastico il campo `{field}` ha il valore {value}, che non è valido: deve essere {expected}.
+Contesto dell'interpello: {context}
+Restituisci un oggetto JSON {{"value": ...}} con il valore corretto, oppure {{"value": null}} se non è determinabile.
+"""
+
+
+# Stima forfettaria dei token di input per un PDF caricato, finché usage_metadata non dà il valore reale.
+PDF_TOKEN_ESTIMATE = 3000
+OUTPUT_TOKEN_ESTIMATE = 500
+# I PDF fino a questa dimensione (in byte grezzi, prompt compreso) sono inviati inline nella richiesta.
+# Il limite di Gemini è di 20 MB per richiesta, ma i byte inline viaggiano in base64 (+33%): 14 MB ne diventano ~18,7.
+INLINE_PDF_MAX_BYTES = 14 * 1024 * 1024
+
+_rate_limiters = {}
+
+def _get_rate_limiter(model_key):
+    if model_key not in _rate_limiters:
+        limits = config.GEMINI_RATE_LIMITS[model_key]
+        _rate_limiters[model_key] = TokenBucketLimiter(model_key, limits['rpm'], limits['tpm'])
+    return _rate_limiters[model_key]
+
+def get_rate_limit_status():
+    """Uso corrente dei budget RPM/TPM per ciascun modello."""
+    return {model_key: limiter.status() for model_key, limiter in _rate_limiters.items()}
+
+def _is_quota_error(error):
+    text = str(error)
+    return "429" in text or "RESOURCE_EXHAUSTED" in text or "quota" in text.lower() or type(error).__name__ == "ResourceExhausted"
+
+def _estimate_tokens(contents):
+    total = OUTPUT_TOKEN_ESTIMATE
+    for part in contents:
+        total += html_reducer.estimate_tokens(part) if isinstance(part, str) else PDF_TOKEN_ESTIMATE
+    return total
+
+async def _generate(models, model_key, contents, logger, prompt_type, response_schema=None):
+    """
+    Chiama `generate_content_async` rispettando il budget RPM/TPM del modello.
+    Sugli errori di quota ritenta con backoff esponenziale e jitter, condiviso da tutte le chiamate allo stesso modello.
+    Con `response_schema` la risposta è richiesta in JSON conforme allo schema.
+    Ogni chiamata è registrata in llm_usage con `prompt_type`; a budget esaurito solleva llm_usage.BudgetExceeded.
+    """
+    llm_usage.check_budget()
+    kwargs = {}
+    if response_schema is not None:
+        kwargs['generation_config'] = {'response_mime_type': 'application/json', 'response_schema': response_schema}
+    limiter = _get_rate_limiter(model_key)
+    estimated_tokens = _estimate_tokens(contents)
+    attempt = 0
+    while True:
+        await limiter.acquire(estimated_tokens)
+        start = time.monotonic()
+        try:
+            response = await models[model_key].generate_content_async(contents, **kwargs)
+        except Exception as e:
+            if not _is_quota_error(e) or attempt >= config.GEMINI_MAX_QUOTA_RETRIES:
+                raise
+            delay = limiter.backoff_delay(attempt)
+            logger.warning(f"Quota Gemini ({model_key}) superata, nuovo tentativo tra {delay:.1f}s: {e}")
+            attempt += 1
+            continue
+        usage = getattr(response, 'usage_metadata', None)
+        limiter.record_usage(estimated_tokens, getattr(usage, 'total_token_count', 0) if usage else 0)
+        llm_usage.record_call(model_key, _model_name(models[model_key]), prompt_type, usage, time.monotonic() - start)
+        return response
+
+def _resolve_classi_di_concorso(extracted_data):
+    """Sostituisce il campo 'materia' restituito dal modello con il codice CDC risolto localmente."""
+    items = extracted_data if isinstance(extracted_data, list) else [extracted_data]
+    for item in items:
+        if not isinstance(item, dict):
+            continue
+        subject = item.pop('materia', None) or item.get('classe_di_concorso')
+        code = cdc_resolver.resolve(subject)
+        # Se la materia non corrisponde a nessuna classe nota si conserva il testo originale.
+        item['classe_di_concorso'] = code or subject
+    return extracted_data
+
+# Statistiche di parsing e correzione per prompt: chiamate, risposte non JSON, JSON corretti,
+# campi corretti singolarmente e correzioni non riuscite.
+_parse_stats = {}
+
+def _stats_for(prompt_name):
+    return _parse_stats.setdefault(prompt_name, {'calls': 0, 'parse_failures': 0, 'json_repairs': 0,
+                                                  'field_repairs': 0, 'repair_failures': 0})
+
+def get_parse_stats():
+    """Tasso di risposte non valide e di correzioni, per ciascun prompt."""
+    return {name: dict(stats) for name, stats in _parse_stats.items()}
+
+def _loads_json(raw_text):
+    """Decodifica la risposta; se il modello ha aggiunto testo o blocchi ``` attorno al JSON, prova a isolarlo."""
+    text = raw_text.strip()
+    try:
+        return json.loads(text)
+    except json.JSONDecodeError:
+        starts = [i for i in (text.find('['), text.find('{')) if i != -1]
+        end = max(text.rfind(']'), text.rfind('}'))
+        if not starts or end < min(starts):
+            raise
+        return json.loads(text[min(starts):end+1])
+
+async def _parse_json_response(models, raw_text, schema, prompt_name, logger):
+    """
+    Restituisce la risposta decodificata. Se non è JSON valido viene fatta una sola richiesta di correzione
+    al modello veloce, con il solo testo della risposta; se anche questa fallisce l'errore viene propagato.
+    """
+    stats = _stats_for(prompt_name)
+    stats['calls'] += 1
+    try:
+        return _loads_json(raw_text)
+    except json.JSONDecodeError:
+        stats['parse_failures'] += 1
+    logger.warning(f"Risposta non JSON per il prompt {prompt_name}: richiesta di correzione al modello veloce.")
+    try:
+        response = await _generate(models, 'fast', [JSON_REPAIR_PROMPT, raw_text], logger, 'correzione_json', response_schema=schema)
+        data = _loads_json(response.text)
+    except Exception:
+        stats['repair_failures'] += 1
+        raise
+    stats['json_repairs'] += 1
+    return data
+
+async def _repair_field(models, item, field, value, prompt_name, logger):
+    """Richiede al modello veloce il solo campo non valido; restituisce il valore convertito o None."""
+    stats = _stats_for(prompt_name)
+    context = json.dumps({k: v for k, v in item.items() if v is not None}, ensure_ascii=False)
+    prompt = FIELD_REPAIR_PROMPT.format(field=field, value=json.dumps(value, ensure_ascii=False),
+                                        expected=llm_schemas.FIELD_EXPECTATIONS[field], context=context)
+    try:
+        response = await _generate(models, 'fast', [prompt], logger, 'correzione_campo',
+                                   response_schema=llm_schemas.FIELD_REPAIR_SCHEMAS[field])
+        repaired = llm_schemas.FIELD_COERCERS[field](_loads_json(response.text).get('value'))
+    except Exception as e:
+        stats['repair_failures'] += 1
+        logger.warning(f"Correzione del campo {field} ({value!r}) non riuscita: {e}")
+        return None
+    stats['field_repairs'] += 1
+    logger.info(f"Campo {field} corretto: {value!r} -> {repaired!r}")
+    return repaired
+
+async def _validate_interpelli(models, extracted_data, prompt_name, logger):
+    """
+    Valida e converte i tipi degli interpelli estratti (ore come intero, data come DD/MM/YYYY).
+    I campi non convertibili vengono richiesti di nuovo singolarmente; gli elementi senza nome della scuola
+    sono scartati perché non possono essere salvati. Restituisce sempre una lista.
+    """
+    items = extracted_data if isinstance(extracted_data, list) else [extracted_data]
+    valid_items = []
+    for item in items:
+        clean, invalid = llm_schemas.validate_interpello(item)
+        if clean is None:
+            continue
+        for field, value in invalid.items():
+            if field in llm_schemas.FIELD_REPAIR_SCHEMAS:
+                clean[field] = await _repair_field(models, clean, field, value, prompt_name, logger)
+        if not clean.get('nome_scuola'):
+            logger.warning(f"Interpello scartato perché senza nome della scuola: {item}")
+            continue
+        valid_items.append(clean)
+    return valid_items
+
+async def _validate_universal_result(models, data, prompt_name, logger):
+    """Normalizza il risultato dell'analisi universale: liste di link di sole stringhe e dati validati."""
+    if not isinstance(data, dict):
+        raise ValueError(f"Risultato dell'analisi universale non valido: {data!r}")
+    for key in ["file_links", "gdrive_links", "portal_links"]:
+        links = data.get(key)
+        data[key] = [link for link in links if isinstance(link, str) and link.strip()] if isinstance(links, list) else []
+    if data.get("extracted_data"):
+        items = await _validate_interpelli(models, data["extracted_data"], prompt_name, logger)
+        data["extracted_data"] = (items[0] if len(items) == 1 else items) or None
+    else:
+        data["extracted_data"] = None
+    return data
+
+def _model_name(model):
+    return getattr(model, 'model_name', str(model))
+
+def _cache_lookup(model, prompt, content):
+    """Cerca nella cache la risposta per (modello, prompt, contenuto). Restituisce (chiave, testo o None)."""
+    cache_key = llm_cache.make_key(_model_name(model), prompt, llm_cache.hash_content(content))
+    # Con una cassetta attiva ogni risposta deve passare dal modello (reale o registrato), non dalla cache locale.
+    if cassette.is_active():
+        return cache_key, None
+    return cache_key, llm_cache.get(cache_key)
 
 async def extract_page_links_with_gemini(models, html_content, base_url, logger):
     logger.info(f"Invio HTML da {base_url} a Gemini (fast) per l'estrazione dei link agli articoli...")
     prompt = LINK_EXTRACTION_PROMPT.format(base_url=base_url)
+    model = models['fast']
+    raw_text = None
     
     try:
-        response = await models['fast'].generate_content_async([prompt, html_content])
-        cleaned_response = response.text.strip().replace("```json", "").replace("```", "")
-        
-        parsed_data = json.loads(cleaned_response)
+        cache_key, raw_text = _cache_lookup(model, prompt, html_content)
+        from_cache = raw_text is not None
+        if from_cache:
+            logger.info(f"Risposta per {base_url} recuperata dalla cache LLM.")
+        else:
+            response = await _generate(models, 'fast', [prompt, html_content], logger, 'link_articoli',
+                                       response_schema=llm_schemas.LINKS_SCHEMA)
+            raw_text = response.text
+
+        parsed_data = await _parse_json_response(models, raw_text, llm_schemas.LINKS_SCHEMA, 'link_articoli', logger)
         
         article_links = []
         if isinstance(parsed_data, dict):
             article_links = parsed_data.get("article_links", [])
         elif isinstance(parsed_data, list):
             article_links = parsed_data
+        article_links = [link for link in article_links if isinstance(link, str) and link.strip()]
+        if not from_cache:
+            llm_cache.put(cache_key, _model_name(model), json.dumps({"article_links": article_links}, ensure_ascii=False))
 
         if article_links:
             article_links = [urljoin(base_url, link) for link in article_links]
@@ -106,93 +328,365 @@ async def extract_page_links_with_gemini(models, html_content, base_url, logger)
         logger.info(f"Trovati {len(article_links)} link di articoli.")
         return article_links
     except json.JSONDecodeError:
-        logger.error(f"Errore di decodifica JSON: Gemini ha restituito una risposta non valida. Risposta: {response.text}")
+        logger.error(f"Errore di decodifica JSON: Gemini ha restituito una risposta non valida. Risposta: {raw_text}")
         return []
     except Exception as e:
         logger.error(f"Errore durante l'estrazione dei link con Gemini: {e}")
         return []
 
+class _UniversalAnalysisBatcher:
+    """
+    Raccoglie le pagine articolo piccole e le invia insieme in un'unica richiesta di analisi universale.
+    Un lotto parte quando raggiunge LLM_BATCH_MAX_TOKENS o LLM_BATCH_MAX_DOCS, oppure dopo LLM_BATCH_MAX_WAIT secondi.
+    Ogni pagina riceve il proprio risultato tramite l'id del documento; se il lotto fallisce riceve None.
+    """
+    def __init__(self):
+        self._loop = None
+        self._pending = []
+        self._pending_tokens = 0
+        self._timer = None
+        self._tasks = set()
+        self._next_id = 0
+        self.batches = 0
+        self.batched_docs = 0
+
+    async def submit(self, models, html_content, base_url, logger):
+        if cassette.is_replaying():
+            return cassette.replay_batch_result(html_content, base_url)
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            self._loop = loop
+            self._pending, self._pending_tokens, self._timer = [], 0, None
+            self._tasks = set()
+        self._next_id += 1
+        future = loop.create_future()
+        self._pending.append((f"doc{self._next_id}", html_content, base_url, future, llm_usage.current_context()))
+        self._pending_tokens += html_reducer.estimate_tokens(html_content)
+        if self._pending_tokens >= config.LLM_BATCH_MAX_TOKENS or len(self._pending) >= config.LLM_BATCH_MAX_DOCS:
+            self._flush(models, logger)
+        elif self._timer is None:
+            self._timer = loop.call_later(config.LLM_BATCH_MAX_WAIT, self._flush, models, logger)
+        return await future
+
+    def _flush(self, models, logger):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._pending, self._pending_tokens = self._pending, [], 0
+        if batch:
+            # Il riferimento al task evita che venga raccolto dal garbage collector prima della fine.
+            task = self._loop.create_task(self._run_batch(models, batch, logger))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def shutdown(self):
+        """Annulla il timer, le pagine in attesa e i lotti ancora in corso, e attende la fine dei loro task."""
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        for _, _, _, future, _ in self._pending:
+            future.cancel()
+        self._pending, self._pending_tokens = [], 0
+        tasks = list(self._tasks)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def _run_batch(self, models, batch, logger):
+        contents = [BATCH_UNIVERSAL_DATA_FINDER_PROMPT]
+        for doc_id, html_content, base_url, _, _ in batch:
+            contents.append(f"=== DOCUMENTO {doc_id} | URL di base: {base_url} ===\n{html_content}")
+        # La chiamata è attribuita alla provincia delle pagine solo se è la stessa per tutto il lotto.
+        provinces = {provincia for _, _, _, _, (_, provincia) in batch}
+        llm_usage.set_context(batch[0][4][0], provinces.pop() if len(provinces) == 1 else None)
+        results_by_id = {}
+        try:
+            logger.info(f"Invio di un lotto di {len(batch)} pagine a Gemini (fast) per l'analisi universale...")
+            response = await _generate(models, 'fast', contents, logger, 'analisi_universale_lotto',
+                                       response_schema=llm_schemas.BATCH_UNIVERSAL_SCHEMA)
+            parsed = await _parse_json_response(models, response.text, llm_schemas.BATCH_UNIVERSAL_SCHEMA, 'analisi_universale_lotto', logger)
+            results = parsed.get("results", []) if isinstance(parsed, dict) else []
+            for result in results:
+                if isinstance(result, dict) and result.get("id"):
+                    doc_id = str(result.pop("id"))
+                    try:
+                        results_by_id[doc_id] = await _validate_universal_result(models, result, 'analisi_universale_lotto', logger)
+                    except ValueError as e:
+                        logger.warning(f"Risultato del documento {doc_id} nel lotto non valido: {e}")
+            self.batches += 1
+            self.batched_docs += len(results_by_id)
+        except asyncio.CancelledError:
+            for _, _, _, future, _ in batch:
+                future.cancel()
+            raise
+        except Exception as e:
+            logger.error(f"Errore durante l'analisi universale a lotti con Gemini: {e}")
+        for doc_id, html_content, base_url, future, _ in batch:
+            cassette.record_batch_result(html_content, base_url, results_by_id.get(doc_id))
+            if not future.done():
+                future.set_result(results_by_id.get(doc_id))
+
+
+_analysis_batcher = _UniversalAnalysisBatcher()
+
+async def shutdown_batcher():
+    await _analysis_batcher.shutdown()
+
+def get_batch_stats():
+    return {'batches': _analysis_batcher.batches, 'batched_docs': _analysis_batcher.batched_docs}
+
+def _finalize_universal_result(data, base_url):
+    if data.get("extracted_data"):
+        data["extracted_data"] = _resolve_classi_di_concorso(data["extracted_data"])
+    for key in ["file_links", "gdrive_links", "portal_links"]:
+        if data.get(key):
+            data[key] = [urljoin(base_url, link) for link in data[key]]
+    return data
+
 async def analyze_article_page_and_get_data_or_links(models, html_content, base_url, logger):
-    logger.info(f"Invio HTML da {base_url} a Gemini (fast) per l'analisi universale...")
     prompt = UNIVERSAL_DATA_FINDER_PROMPT.format(base_url=base_url)
+    model = models['fast']
     
     try:
-        response = await models['fast'].generate_content_async([prompt, html_content])
-        logger.info(f"\n--- RISPOSTA RICEVUTA (ANALISI UNIVERSALE) ---\n{response.text}")
-        
-        raw_text = response.text
-        json_start = raw_text.find('{')
-        json_end = raw_text.rfind('}')
+        cache_key, raw_text = _cache_lookup(model, prompt, html_content)
+        from_cache = raw_text is not None
+        if from_cache:
+            logger.info(f"Risposta per {base_url} recuperata dalla cache LLM.")
+        elif config.LLM_BATCH_ENABLED and html_reducer.estimate_tokens(html_content) <= config.LLM_BATCH_SMALL_PAGE_TOKENS:
+            batch_result = await _analysis_batcher.submit(models, html_content, base_url, logger)
+            if batch_result is not None:
+                logger.info(f"Risultato per {base_url} ricevuto dall'analisi a lotti.")
+                # Il risultato del lotto è salvato in cache come se fosse la risposta della singola pagina.
+                llm_cache.put(cache_key, _model_name(model), json.dumps(batch_result, ensure_ascii=False))
+                return _finalize_universal_result(batch_result, base_url)
+            logger.info(f"Nessun risultato dal lotto per {base_url}: analisi singola.")
+        if raw_text is None:
+            logger.info(f"Invio HTML da {base_url} a Gemini (fast) per l'analisi universale...")
+            response = await _generate(models, 'fast', [prompt, html_content], logger, 'analisi_universale',
+                                       response_schema=llm_schemas.UNIVERSAL_SCHEMA)
+            raw_text = response.text
+        logger.info(f"\n--- RISPOSTA RICEVUTA (ANALISI UNIVERSALE) ---\n{raw_text}")
 
-        if json_start != -1 and json_end != -1:
-            json_str = raw_text[json_start:json_end+1]
-            data = json.loads(json_str)
-            
-            for key in ["file_links", "gdrive_links", "portal_links"]:
-                if data.get(key):
-                    data[key] = [urljoin(base_url, link) for link in data[key]]
-            
-            return data
-        else:
-            logger.warning(f"Nessun JSON valido trovato nella risposta di analisi universale. Risposta: {raw_text}")
-            return None
+        data = await _parse_json_response(models, raw_text, llm_schemas.UNIVERSAL_SCHEMA, 'analisi_universale', logger)
+        data = await _validate_universal_result(models, data, 'analisi_universale', logger)
+        if not from_cache:
+            # In cache va il risultato già validato, così le correzioni non vengono ripetute.
+            llm_cache.put(cache_key, _model_name(model), json.dumps(data, ensure_ascii=False))
+        return _finalize_universal_result(data, base_url)
 
     except Exception as e:
         logger.error(f"Errore durante l'analisi universale con Gemini: {e}")
         return None
 
-async def extract_data_from_html(models, html_content, logger):
-    logger.info("Invio HTML a Gemini (powerful) per l'estrazione dati diretta...")
+async def _parse_extraction(models, raw_text, prompt_name, logger):
+    """Decodifica e valida la risposta di un prompt di estrazione dati; restituisce la lista degli interpelli."""
+    data = await _parse_json_response(models, raw_text, llm_schemas.EXTRACTION_SCHEMA, prompt_name, logger)
+    return await _validate_interpelli(models, data, prompt_name, logger)
+
+async def _extract_from_text(models, model_key, text, source_label, logger):
+    """
+    Estrae i dati da un contenuto testuale (HTML di un portale o testo di un PDF) con il modello indicato.
+    Restituisce la lista degli interpelli, vuota se il contenuto non ne contiene, oppure None in caso di errore.
+    """
+    logger.info(f"Invio {source_label} a Gemini ({model_key}) per l'estrazione dati diretta...")
+    model = models[model_key]
+    prompt_name = f"estrazione_testo ({model_key})"
     try:
-        response = await models['powerful'].generate_content_async([DATA_EXTRACTION_PROMPT, html_content])
-        raw_text = response.text
-        json_start = raw_text.find('[') if raw_text.find('[') != -1 else raw_text.find('{')
-        json_end = raw_text.rfind(']') if raw_text.rfind(']') != -1 else raw_text.rfind('}')
-
-        if json_start != -1 and json_end != -1:
-            json_str = raw_text[json_start:json_end+1]
-            extracted_data = json.loads(json_str)
-            logger.info("Dati estratti con successo da HTML.")
-            return extracted_data
+        cache_key, raw_text = _cache_lookup(model, DATA_EXTRACTION_PROMPT, text)
+        from_cache = raw_text is not None
+        if from_cache:
+            logger.info(f"Risposta di estrazione da {source_label} recuperata dalla cache LLM.")
         else:
-            logger.warning(f"Nessun blocco JSON trovato nella risposta di estrazione da HTML. Risposta: {raw_text}")
-            return None
+            response = await _generate(models, model_key, [DATA_EXTRACTION_PROMPT, text], logger, 'estrazione_testo',
+                                       response_schema=llm_schemas.EXTRACTION_SCHEMA)
+            raw_text = response.text
+
+        extracted_data = await _parse_extraction(models, raw_text, prompt_name, logger)
+        # Anche una risposta senza interpelli va in cache: lo stesso contenuto non deve costare un'altra chiamata.
+        if not from_cache:
+            llm_cache.put(cache_key, _model_name(model), json.dumps(extracted_data, ensure_ascii=False))
+        if not extracted_data:
+            # Risposta valida ma senza interpelli (es. avviso o allegato): non è un errore.
+            logger.warning(f"Nessun interpello valido nella risposta di estrazione da {source_label}. Risposta: {raw_text}")
+            return []
+        logger.info(f"Dati estratti con successo da {source_label}.")
+        return _resolve_classi_di_concorso(extracted_data)
     except Exception as e:
-        logger.error(f"Errore durante l'estrazione dati da HTML con Gemini: {e}")
+        logger.error(f"Errore durante l'estrazione dati da {source_label} con Gemini: {e}")
         return None
 
-async def process_pdf_with_gemini(models, pdf_path, logger):
-    logger.info(f"Invio del file '{pdf_path}' a Gemini (powerful) per l'analisi dei dati...")
-    try:
-        uploaded_file = genai.upload_file(path=pdf_path, display_name=pdf_path)
-        logger.info(f"File caricato con successo: {uploaded_file.display_name}")
+# --- CASCATA DI ESTRAZIONE ---
 
-        while uploaded_file.state.name == "PROCESSING":
-            logger.info("In attesa che il file venga processato...")
-            await asyncio.sleep(5)
-            uploaded_file = genai.get_file(uploaded_file.name)
+_cascade_stats = {'documents': 0, 'accepted': 0, 'escalated': 0, 'fast_seconds': 0.0, 'powerful_seconds': 0.0}
 
-        if uploaded_file.state.name == "FAILED":
-             raise ValueError(f"Elaborazione del file fallita: {uploaded_file.state}")
+def _low_confidence_reasons(extracted_data):
+    """Controlli sul risultato del modello veloce; restituisce i motivi per cui non è affidabile (lista vuota se lo è)."""
+    if not extracted_data:
+        return ["nessun interpello estratto"]
+    min_hours, max_hours = config.EXTRACTION_PLAUSIBLE_HOURS
+    reasons = []
+    for item in extracted_data:
+        school = item.get('nome_scuola')
+        if not item.get('data_fine_incarico'):
+            reasons.append(f"{school}: data di fine incarico mancante")
+        if item.get('classe_di_concorso') not in cdc_resolver.KNOWN_CODES:
+            reasons.append(f"{school}: classe di concorso non riconosciuta ({item.get('classe_di_concorso')})")
+        hours = item.get('numero_di_ore')
+        if hours is None or not min_hours <= hours <= max_hours:
+            reasons.append(f"{school}: numero di ore non plausibile ({hours})")
+    return reasons
 
-        response = await models['powerful'].generate_content_async([DATA_EXTRACTION_PROMPT, uploaded_file])
-        
-        raw_text = response.text
-        json_start = raw_text.find('[') if raw_text.find('[') != -1 else raw_text.find('{')
-        json_end = raw_text.rfind(']') if raw_text.rfind(']') != -1 else raw_text.rfind('}')
-
-        if json_start != -1 and json_end != -1:
-            json_str = raw_text[json_start:json_end+1]
-            extracted_data = json.loads(json_str)
-            logger.info("Dati estratti con successo.")
-            return extracted_data
+async def _cascade_extract(fast_step, powerful_step, source_label, logger, fast_path=False):
+    """
+    Esegue `fast_step` e accetta il risultato se supera i controlli di affidabilità; altrimenti esegue `powerful_step`.
+    Se anche il modello potente non restituisce nulla si conserva il risultato del modello veloce.
+    Con la cascata disattivata si usa solo il modello potente, tranne per i percorsi veloci indipendenti dalla
+    cascata (`fast_path`, es. lo strato di testo di un PDF): lì il modello potente serve solo se `fast_step` fallisce.
+    """
+    if not config.EXTRACTION_CASCADE_ENABLED:
+        if fast_path:
+            fast_data = await fast_step()
+            if fast_data:
+                return fast_data
+            logger.info(f"Estrazione veloce da {source_label} senza risultati: passo al modello potente.")
+            powerful_data = await powerful_step()
+            return powerful_data if powerful_data is not None else fast_data
+        return await powerful_step()
+    _cascade_stats['documents'] += 1
+    start = time.monotonic()
+    fast_data = await fast_step()
+    _cascade_stats['fast_seconds'] += time.monotonic() - start
+    reasons = _low_confidence_reasons(fast_data)
+    if not reasons:
+        _cascade_stats['accepted'] += 1
+        return fast_data
+
+    logger.info(f"Estrazione veloce da {source_label} non affidabile ({'; '.join(reasons)}): passo al modello potente.")
+    _cascade_stats['escalated'] += 1
+    start = time.monotonic()
+    powerful_data = await powerful_step()
+    _cascade_stats['powerful_seconds'] += time.monotonic() - start
+    # Un risultato vuoto del modello potente prevale solo su un'estrazione veloce fallita o anch'essa vuota.
+    if powerful_data or (powerful_data is not None and not fast_data):
+        return powerful_data
+    return fast_data
+
+def get_cascade_stats():
+    """
+    Tasso di passaggio al modello potente e tempo risparmiato stimato: per i documenti accettati dal modello veloce
+    si conta la durata media delle estrazioni potenti della stessa esecuzione, meno tutto il tempo speso sul modello veloce.
+    """
+    stats = dict(_cascade_stats)
+    stats['escalation_rate'] = stats['escalated'] / stats['documents'] if stats['documents'] else 0.0
+    if stats['escalated']:
+        avg_powerful = stats['powerful_seconds'] / stats['escalated']
+        stats['seconds_saved'] = stats['accepted'] * avg_powerful - stats['fast_seconds']
+    else:
+        stats['seconds_saved'] = None
+    return stats
+
+async def extract_data_from_html(models, html_content, logger, source_label="HTML"):
+    """Estrae i dati da un contenuto testuale con la cascata modello veloce -> modello potente."""
+    return await _cascade_extract(
+        lambda: _extract_from_text(models, 'fast', html_content, source_label, logger),
+        lambda: _extract_from_text(models, 'powerful', html_content, source_label, logger),
+        source_label, logger)
+
+async def _pdf_part_or_upload(pdf_bytes, source_name, logger):
+    """
+    Prepara il PDF per Gemini. I documenti piccoli sono passati inline come byte, senza toccare il disco;
+    quelli che con il prompt superano INLINE_PDF_MAX_BYTES vengono scritti in un file temporaneo, caricati con la File API e cancellati.
+    Restituisce (parte_del_contenuto, file_caricato_o_None).
+    """
+    # In riproduzione da cassetta non c'è nulla da caricare: le risposte sono indicizzate per contenuto.
+    inline_size = len(pdf_bytes) + len(DATA_EXTRACTION_PROMPT.encode('utf-8'))
+    if inline_size <= INLINE_PDF_MAX_BYTES or cassette.is_replaying():
+        return {'mime_type': 'application/pdf', 'data': pdf_bytes}, None
+
+    logger.info(f"Documento {source_name} di {len(pdf_bytes)} byte: upload tramite File API.")
+    # La fase di upload comprende anche l'attesa dell'elaborazione del file da parte di Gemini.
+    with metrics.timer('upload'):
+        with tempfile.NamedTemporaryFile(suffix='.pdf', delete=False) as tmp:
+            tmp.write(pdf_bytes)
+            tmp_path = tmp.name
+        try:
+            uploaded_file = await gemini_files.upload_file(tmp_path, display_name=source_name[-512:])
+        finally:
+            os.remove(tmp_path)
+        logger.info(f"File caricato con successo: {uploaded_file.display_name}")
+        cassette.note_upload(uploaded_file, pdf_bytes)
+        try:
+            if uploaded_file.state.name == "PROCESSING":
+                logger.info(f"In attesa che il file {uploaded_file.display_name} venga processato...")
+                uploaded_file = await gemini_files.wait_until_processed(uploaded_file)
+            if uploaded_file.state.name == "FAILED":
+                 raise ValueError(f"Elaborazione del file fallita: {uploaded_file.state}")
+        except Exception:
+            await gemini_files.delete_file(uploaded_file, logger)
+            raise
+    return uploaded_file, uploaded_file
+
+async def _extract_from_pdf(models, model_key, pdf_bytes, get_pdf_part, source_name, logger):
+    """
+    Estrae i dati dal PDF completo con il modello indicato; `get_pdf_part` prepara (una sola volta) la parte da inviare.
+    Restituisce la lista degli interpelli, vuota se il documento non ne contiene, oppure None in caso di errore.
+    """
+    logger.info(f"Invio del documento '{source_name}' a Gemini ({model_key}) per l'analisi dei dati...")
+    model = models[model_key]
+    raw_text = None
+    try:
+        # La cache è controllata prima dell'upload: un documento già visto non viene ricaricato.
+        cache_key, raw_text = _cache_lookup(model, DATA_EXTRACTION_PROMPT, pdf_bytes)
+        from_cache = raw_text is not None
+        if from_cache:
+            logger.info(f"Risposta per '{source_name}' recuperata dalla cache LLM.")
         else:
-            logger.warning(f"Nessun blocco JSON trovato nella risposta di Gemini per {pdf_path}. Risposta completa: {raw_text}")
-            return None
+            pdf_part = await get_pdf_part()
+            response = await _generate(models, model_key, [DATA_EXTRACTION_PROMPT, pdf_part], logger, 'estrazione_pdf',
+                                       response_schema=llm_schemas.EXTRACTION_SCHEMA)
+            raw_text = response.text
+        
+        extracted_data = await _parse_extraction(models, raw_text, f"estrazione_pdf ({model_key})", logger)
+        if not from_cache:
+            llm_cache.put(cache_key, _model_name(model), json.dumps(extracted_data, ensure_ascii=False))
+        if not extracted_data:
+            logger.warning(f"Nessun interpello valido nella risposta di Gemini per {source_name}. Risposta completa: {raw_text}")
+            return []
+        logger.info("Dati estratti con successo.")
+        return _resolve_classi_di_concorso(extracted_data)
 
     except json.JSONDecodeError:
-        logger.error(f"Errore di decodifica JSON dal PDF: {pdf_path}. Risposta di Gemini non era un JSON valido. Risposta completa: {response.text}")
+        logger.error(f"Errore di decodifica JSON dal PDF: {source_name}. Risposta di Gemini non era un JSON valido. Risposta completa: {raw_text}")
         return None
     except Exception as e:
         logger.error(f"Errore durante l'elaborazione del PDF con Gemini: {e}")
-        return None
\ No newline at end of file
+        return None
+
+async def process_pdf_with_gemini(models, pdf_bytes, source_name, logger):
+    """
+    Estrae i dati da un PDF già in memoria; `source_name` (di solito l'URL) serve solo per log e upload.
+    Il primo tentativo usa il modello veloce: sullo strato di testo se il PDF ne ha uno utilizzabile,
+    altrimenti sul PDF completo. Il PDF completo passa al modello potente solo se il risultato non è affidabile.
+    """
+    prepared = {}
+
+    async def get_pdf_part():
+        # Il PDF viene preparato (ed eventualmente caricato) una sola volta, anche se lo usano entrambi i modelli.
+        if 'part' not in prepared:
+            prepared['part'], prepared['file'] = await _pdf_part_or_upload(pdf_bytes, source_name, logger)
+        return prepared['part']
+
+    text_layer = await asyncio.to_thread(pdf_text.extract_text_layer, pdf_bytes)
+    if text_layer:
+        logger.info(f"Strato di testo trovato in '{source_name}' (~{html_reducer.estimate_tokens(text_layer)} token): uso il modello veloce.")
+        fast_step = lambda: _extract_from_text(models, 'fast', text_layer, f"testo del PDF {source_name}", logger)
+    else:
+        fast_step = lambda: _extract_from_pdf(models, 'fast', pdf_bytes, get_pdf_part, source_name, logger)
+    try:
+        return await _cascade_extract(
+            fast_step,
+            lambda: _extract_from_pdf(models, 'powerful', pdf_bytes, get_pdf_part, source_name, logger),
+            f"'{source_name}'", logger, fast_path=bool(text_layer))
+    finally:
+        if prepared.get('file') is not None:
+            await gemini_files.delete_file(prepared['file'], logger)
@@ -0,0 +1,163 @@
+import re
+from datetime import date, datetime
+
+# --- SCHEMI JSON DELLE RISPOSTE ---
+# Passati a Gemini come `response_schema` (con response_mime_type JSON) e usati per la validazione locale.
+
+INTERPELLO_SCHEMA = {
+    'type': 'object',
+    'properties': {
+        'nome_scuola': {'type': 'string', 'nullable': True},
+        'indirizzo': {'type': 'string', 'nullable': True},
+        'citta': {'type': 'string', 'nullable': True},
+        'data_fine_incarico': {'type': 'string', 'nullable': True},
+        'materia': {'type': 'string', 'nullable': True},
+        'numero_di_ore': {'type': 'integer', 'nullable': True},
+        'tipo_cattedra': {'type': 'string', 'nullable': True},
+    },
+}
+
+EXTRACTION_SCHEMA = {'type': 'array', 'items': INTERPELLO_SCHEMA}
+
+LINKS_SCHEMA = {
+    'type': 'object',
+    'properties': {'article_links': {'type': 'array', 'items': {'type': 'string'}}},
+    'required': ['article_links'],
+}
+
+_UNIVERSAL_PROPERTIES = {
+    'file_links': {'type': 'array', 'items': {'type': 'string'}},
+    'gdrive_links': {'type': 'array', 'items': {'type': 'string'}},
+    'portal_links': {'type': 'array', 'items': {'type': 'string'}},
+    'extracted_data': dict(INTERPELLO_SCHEMA, nullable=True),
+}
+
+UNIVERSAL_SCHEMA = {
+    'type': 'object',
+    'properties': _UNIVERSAL_PROPERTIES,
+    'required': ['file_links', 'gdrive_links', 'portal_links'],
+}
+
+BATCH_UNIVERSAL_SCHEMA = {
+    'type': 'object',
+    'properties': {
+        'results': {
+            'type': 'array',
+            'items': {
+                'type': 'object',
+                'properties': dict(_UNIVERSAL_PROPERTIES, id={'type': 'string'}),
+                'required': ['id', 'file_links', 'gdrive_links', 'portal_links'],
+            },
+        },
+    },
+    'required': ['results'],
+}
+
+# Descrizione del formato atteso, usata nelle richieste di correzione di un singolo campo.
+FIELD_EXPECTATIONS = {
+    'numero_di_ore': "un numero intero di ore settimanali (es. 18)",
+    'data_fine_incarico': "una data nel formato DD/MM/YYYY",
+}
+
+FIELD_REPAIR_SCHEMAS = {
+    'numero_di_ore': {'type': 'object', 'properties': {'value': {'type': 'integer', 'nullable': True}}},
+    'data_fine_incarico': {'type': 'object', 'properties': {'value': {'type': 'string', 'nullable': True}}},
+}
+
+
+# --- VALIDAZIONE E CONVERSIONE DEI TIPI ---
+
+_ITALIAN_MONTHS = {
+    'gennaio': 1, 'febbraio': 2, 'marzo': 3, 'aprile': 4, 'maggio': 5, 'giugno': 6,
+    'luglio': 7, 'agosto': 8, 'settembre': 9, 'ottobre': 10, 'novembre': 11, 'dicembre': 12,
+}
+_DATE_FORMATS = ['%d/%m/%Y', '%d/%m/%y', '%d-%m-%Y', '%d.%m.%Y', '%Y-%m-%d']
+
+
+class InvalidValue(ValueError):
+    """Un valore non è convertibile nel tipo richiesto dallo schema."""
+
+
+def coerce_int(value):
+    if value is None or (isinstance(value, str) and not value.strip()):
+        return None
+    if isinstance(value, bool):
+        raise InvalidValue(value)
+    if isinstance(value, int):
+        return value
+    if isinstance(value, float) and value.is_integer():
+        return int(value)
+    if isinstance(value, str):
+        numbers = re.findall(r'\d+', value)
+        # "18 ore" -> 18; valori ambigui come "6+12" vengono segnalati per la correzione.
+        if len(numbers) == 1:
+            return int(numbers[0])
+    raise InvalidValue(value)
+
+
+def parse_date(value):
+    """Converte una data in formato italiano (o ISO) in un oggetto `date`."""
+    if isinstance(value, date):
+        return value
+    text = str(value).strip().lower()
+    for fmt in _DATE_FORMATS:
+        try:
+            return datetime.strptime(text, fmt).date()
+        except ValueError:
+            pass
+    match = re.fullmatch(r'(\d{1,2})\s+([a-z]+)\s+(\d{4})', text)
+    if match and match.group(2) in _ITALIAN_MONTHS:
+        try:
+            return date(int(match.group(3)), _ITALIAN_MONTHS[match.group(2)], int(match.group(1)))
+        except ValueError:
+            pass
+    raise InvalidValue(value)
+
+
+def coerce_date(value):
+    """Restituisce la data nel formato DD/MM/YYYY usato nel database."""
+    if value is None or (isinstance(value, str) and not value.strip()):
+        return None
+    return parse_date(value).strftime('%d/%m/%Y')
+
+
+def coerce_str(value):
+    if value is None:
+        return None
+    if isinstance(value, (dict, list)):
+        raise InvalidValue(value)
+    text = " ".join(str(value).split())
+    return text or None
+
+
+FIELD_COERCERS = {
+    'nome_scuola': coerce_str,
+    'indirizzo': coerce_str,
+    'citta': coerce_str,
+    'data_fine_incarico': coerce_date,
+    'materia': coerce_str,
+    'classe_di_concorso': coerce_str,
+    'numero_di_ore': coerce_int,
+    'tipo_cattedra': coerce_str,
+}
+
+
+def validate_interpello(item):
+    """
+    Converte i campi di un interpello nei tipi attesi.
+    Restituisce (interpello_pulito, campi_non_validi) dove i campi non validi sono {campo: valore_originale}
+    e nell'interpello pulito valgono None. Un elemento che non è un oggetto restituisce (None, {}).
+    """
+    if not isinstance(item, dict):
+        return None, {}
+    clean, invalid = {}, {}
+    for field, value in item.items():
+        coercer = FIELD_COERCERS.get(field)
+        if coercer is None:
+            continue
+        try:
+            clean[field] = coercer(value)
+        except InvalidValue:
+            clean[field] = None
+            invalid[field] = value
+    return clean, invalid
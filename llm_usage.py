@@ -0,0 +1,175 @@
+import contextvars
+import time
+from sqlite3 import Error
+import config
+import database
+
+# Contabilità delle chiamate a Gemini: ogni chiamata è registrata con modello, tipo di prompt, fase e provincia,
+# insieme ai token (dall'`usage_metadata` della risposta), alla latenza e al costo stimato.
+# Le righe vanno nella tabella locale `llm_calls`; i totali della scansione corrente restano anche in memoria
+# e servono per il riepilogo finale e per il budget.
+
+_phase = contextvars.ContextVar('llm_phase', default=None)
+_provincia = contextvars.ContextVar('llm_provincia', default=None)
+_refused = contextvars.ContextVar('llm_refused', default=False)
+
+# Le righe sono scritte a gruppi per non fare un commit per ogni chiamata.
+FLUSH_EVERY = 50
+
+_conn = None
+_pending_rows = []
+_run_id = None
+_totals = {}
+_budget_reached = False
+
+
+class BudgetExceeded(RuntimeError):
+    """Il budget di token o di costo della scansione è esaurito: non vengono avviate nuove chiamate."""
+
+
+def _get_connection():
+    global _conn
+    if _conn is None:
+        _conn = database.create_connection(check_same_thread=False)
+        if _conn is None:
+            return None
+        try:
+            _conn.execute("""
+                CREATE TABLE IF NOT EXISTS llm_calls (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    run_id INTEGER,
+                    called_at REAL NOT NULL,
+                    model TEXT NOT NULL,
+                    prompt_type TEXT NOT NULL,
+                    phase TEXT,
+                    provincia TEXT,
+                    input_tokens INTEGER NOT NULL,
+                    output_tokens INTEGER NOT NULL,
+                    latency_ms INTEGER NOT NULL,
+                    cost_usd REAL NOT NULL
+                )
+            """)
+            _conn.commit()
+        except Error as e:
+            print(f"Errore durante l'apertura della tabella delle chiamate LLM: {e}")
+            _conn = None
+    return _conn
+
+
+def set_context(phase, provincia=None):
+    """Imposta fase e provincia per le chiamate fatte dal task corrente (e dai task che avvia)."""
+    _phase.set(phase)
+    _provincia.set(provincia)
+
+
+def reset_refused():
+    """Inizia una nuova unità di lavoro (es. un articolo) per `calls_refused`."""
+    _refused.set(False)
+
+
+def calls_refused():
+    """True se nell'unità di lavoro corrente almeno una chiamata è stata rifiutata per budget esaurito."""
+    return _refused.get()
+
+
+def current_context():
+    return _phase.get(), _provincia.get()
+
+
+def start_run(run_id=None):
+    """Azzera i totali e il budget per una nuova scansione; `run_id` collega le righe alla scansione."""
+    global _run_id, _budget_reached
+    flush()
+    _run_id = run_id
+    _totals.clear()
+    _budget_reached = False
+
+
+def estimate_cost(model_key, input_tokens, output_tokens):
+    prices = config.GEMINI_PRICES_PER_MILLION.get(model_key)
+    if not prices:
+        return 0.0
+    return (input_tokens * prices['input'] + output_tokens * prices['output']) / 1_000_000
+
+
+def record_call(model_key, model_name, prompt_type, usage, latency):
+    """Registra una chiamata completata; `usage` è l'`usage_metadata` della risposta (può mancare)."""
+    input_tokens = getattr(usage, 'prompt_token_count', None) or 0
+    candidates_tokens = getattr(usage, 'candidates_token_count', None) or 0
+    # total_token_count include anche i token di "ragionamento" dei modelli 2.5, fatturati come output.
+    output_tokens = max((getattr(usage, 'total_token_count', None) or 0) - input_tokens, candidates_tokens)
+    cost = estimate_cost(model_key, input_tokens, output_tokens)
+    phase, provincia = current_context()
+    _pending_rows.append((_run_id, time.time(), model_name, prompt_type, phase, provincia,
+                          input_tokens, output_tokens, int(latency * 1000), cost))
+
+    for key in [('model', model_key), ('prompt', prompt_type), ('phase', phase), ('provincia', provincia), ('total', None)]:
+        entry = _totals.setdefault(key, {'calls': 0, 'input_tokens': 0, 'output_tokens': 0, 'cost_usd': 0.0, 'latency': 0.0})
+        entry['calls'] += 1
+        entry['input_tokens'] += input_tokens
+        entry['output_tokens'] += output_tokens
+        entry['cost_usd'] += cost
+        entry['latency'] += latency
+    if len(_pending_rows) >= FLUSH_EVERY:
+        flush()
+
+
+def flush():
+    """Scrive nel database le righe accumulate."""
+    if not _pending_rows:
+        return
+    conn = _get_connection()
+    if conn is None:
+        return
+    rows = list(_pending_rows)
+    try:
+        with conn:
+            conn.executemany("""INSERT INTO llm_calls(run_id, called_at, model, prompt_type, phase, provincia,
+                                                      input_tokens, output_tokens, latency_ms, cost_usd)
+                                VALUES(?,?,?,?,?,?,?,?,?,?)""", rows)
+        del _pending_rows[:len(rows)]
+    except Error as e:
+        print(f"Errore durante il salvataggio delle chiamate LLM: {e}")
+
+
+def budget_exhausted():
+    """True se i token o il costo della scansione hanno raggiunto i limiti di config (None = nessun limite)."""
+    global _budget_reached
+    if _budget_reached:
+        return True
+    total = _totals.get(('total', None))
+    if total is None:
+        return False
+    token_budget, cost_budget = config.LLM_TOKEN_BUDGET, config.LLM_COST_BUDGET_USD
+    if token_budget is not None and total['input_tokens'] + total['output_tokens'] >= token_budget:
+        _budget_reached = True
+    elif cost_budget is not None and total['cost_usd'] >= cost_budget:
+        _budget_reached = True
+    return _budget_reached
+
+
+def check_budget():
+    """Solleva BudgetExceeded se il budget è esaurito; va chiamata prima di avviare una nuova chiamata."""
+    if budget_exhausted():
+        _refused.set(True)
+        raise BudgetExceeded("Budget LLM della scansione esaurito")
+
+
+def get_summary():
+    """Totali della scansione corrente raggruppati per 'model', 'prompt', 'phase' e 'provincia', più il 'total'."""
+    summary = {'model': {}, 'prompt': {}, 'phase': {}, 'provincia': {}, 'total': None}
+    for (group, name), entry in _totals.items():
+        if group == 'total':
+            summary['total'] = dict(entry)
+        else:
+            summary[group][name] = dict(entry)
+    summary['budget_reached'] = _budget_reached
+    return summary
+
+
+def close():
+    global _conn
+    flush()
+    if _conn is not None:
+        _conn.close()
+        _conn = None
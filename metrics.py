@@ -0,0 +1,170 @@
+import asyncio
+import json
+import os
+import time
+import config
+
+# Strumentazione della pipeline: durata di ogni fase (con percentili e istogramma), tempi di attesa nelle code,
+# errori e profondità delle code. I dati sono esportati in JSON e nel formato testuale di Prometheus,
+# a fine scansione e periodicamente durante le scansioni lunghe.
+
+# Estremi superiori dei bucket degli istogrammi, in secondi.
+HISTOGRAM_BUCKETS = [0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120]
+PERCENTILES = [50, 90, 95, 99]
+
+_durations = {}
+_errors = {}
+_queue_waits = {}
+_enqueued_at = {}
+_queue_depths = {}
+_started_at = time.time()
+
+
+def reset():
+    """Azzera tutte le misure all'inizio di una scansione."""
+    global _started_at
+    for store in (_durations, _errors, _queue_waits, _enqueued_at, _queue_depths):
+        store.clear()
+    _started_at = time.time()
+
+
+def observe(stage, seconds, error=False):
+    _durations.setdefault(stage, []).append(seconds)
+    _errors.setdefault(stage, 0)
+    if error:
+        _errors[stage] += 1
+
+
+class _StageTimer:
+    def __init__(self, stage):
+        self.stage = stage
+        self.failed = False
+
+    def fail(self):
+        """Segna come errore una fase che non solleva eccezioni ma restituisce un risultato vuoto."""
+        self.failed = True
+
+    def __enter__(self):
+        self.start = time.monotonic()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        observe(self.stage, time.monotonic() - self.start, error=self.failed or exc_type is not None)
+        return False
+
+
+def timer(stage):
+    """Misura la durata del blocco `with` come un'esecuzione della fase `stage`; un'eccezione conta come errore."""
+    return _StageTimer(stage)
+
+
+def mark_enqueued(queue_name, key):
+    _enqueued_at[(queue_name, key)] = time.monotonic()
+
+
+def mark_dequeued(queue_name, key):
+    """Registra l'attesa in coda dell'elemento `key`, se ne è noto l'ingresso."""
+    start = _enqueued_at.pop((queue_name, key), None)
+    if start is not None:
+        _queue_waits.setdefault(queue_name, []).append(time.monotonic() - start)
+
+
+def set_queue_depth(queue_name, depth):
+    _queue_depths[queue_name] = depth
+
+
+def _percentile(sorted_values, percent):
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, max(0, round(percent / 100 * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+def _describe(values):
+    ordered = sorted(values)
+    description = {
+        'count': len(ordered),
+        'sum_seconds': sum(ordered),
+        'max_seconds': ordered[-1] if ordered else None,
+        'buckets': {str(bound): sum(1 for v in ordered if v <= bound) for bound in HISTOGRAM_BUCKETS},
+    }
+    for percent in PERCENTILES:
+        description[f'p{percent}_seconds'] = _percentile(ordered, percent)
+    return description
+
+
+def snapshot():
+    """Stato corrente di tutte le misure, come dizionario serializzabile in JSON."""
+    elapsed = time.time() - _started_at
+    stages = {}
+    for stage, values in _durations.items():
+        stages[stage] = _describe(values)
+        stages[stage]['errors'] = _errors.get(stage, 0)
+        stages[stage]['throughput_per_second'] = len(values) / elapsed if elapsed > 0 else None
+    return {
+        'started_at': _started_at,
+        'elapsed_seconds': elapsed,
+        'stages': stages,
+        'queue_waits': {name: _describe(values) for name, values in _queue_waits.items()},
+        'queue_depths': dict(_queue_depths),
+    }
+
+
+def _prometheus_histogram(lines, metric, label, name, description):
+    for bound in HISTOGRAM_BUCKETS:
+        lines.append(f'{metric}_bucket{{{label}="{name}",le="{bound}"}} {description["buckets"][str(bound)]}')
+    lines.append(f'{metric}_bucket{{{label}="{name}",le="+Inf"}} {description["count"]}')
+    lines.append(f'{metric}_sum{{{label}="{name}"}} {description["sum_seconds"]:.6f}')
+    lines.append(f'{metric}_count{{{label}="{name}"}} {description["count"]}')
+
+
+def to_prometheus(data=None):
+    """Misure nel formato di esposizione testuale di Prometheus."""
+    data = data or snapshot()
+    lines = ["# HELP ainterpelli_stage_duration_seconds Durata delle fasi della pipeline di scansione.",
+             "# TYPE ainterpelli_stage_duration_seconds histogram"]
+    for stage, description in sorted(data['stages'].items()):
+        _prometheus_histogram(lines, 'ainterpelli_stage_duration_seconds', 'stage', stage, description)
+    lines += ["# HELP ainterpelli_stage_errors_total Esecuzioni delle fasi terminate con un errore.",
+              "# TYPE ainterpelli_stage_errors_total counter"]
+    for stage, description in sorted(data['stages'].items()):
+        lines.append(f'ainterpelli_stage_errors_total{{stage="{stage}"}} {description["errors"]}')
+    lines += ["# HELP ainterpelli_queue_wait_seconds Tempo di attesa degli elementi nelle code della pipeline.",
+              "# TYPE ainterpelli_queue_wait_seconds histogram"]
+    for name, description in sorted(data['queue_waits'].items()):
+        _prometheus_histogram(lines, 'ainterpelli_queue_wait_seconds', 'queue', name, description)
+    lines += ["# HELP ainterpelli_queue_depth Elementi presenti nelle code al momento dell'esportazione.",
+              "# TYPE ainterpelli_queue_depth gauge"]
+    for name, depth in sorted(data['queue_depths'].items()):
+        lines.append(f'ainterpelli_queue_depth{{queue="{name}"}} {depth}')
+    return "\n".join(lines) + "\n"
+
+
+def export(directory=None, data=None):
+    """Scrive metrics.json e metrics.prom in `directory` (predefinita: config.METRICS_DIR). Restituisce i percorsi."""
+    directory = directory or config.METRICS_DIR
+    os.makedirs(directory, exist_ok=True)
+    data = data or snapshot()
+    json_path = os.path.join(directory, 'metrics.json')
+    prom_path = os.path.join(directory, 'metrics.prom')
+    # Scrittura su file temporaneo e rename: chi legge i file durante la scansione non vede mai un file a metà.
+    for path, content in [(json_path, json.dumps(data, indent=2)), (prom_path, to_prometheus(data))]:
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write(content)
+        os.replace(tmp_path, path)
+    return json_path, prom_path
+
+
+async def periodic_export(queues, logger, interval=None):
+    """Esporta le misure ogni `interval` secondi finché il task non viene annullato; `queues` è {nome: asyncio.Queue}."""
+    interval = interval or config.METRICS_EXPORT_INTERVAL
+    while True:
+        await asyncio.sleep(interval)
+        for name, queue in queues.items():
+            set_queue_depth(name, queue.qsize())
+        try:
+            # La fotografia è presa nell'event loop; solo la scrittura dei file avviene nel thread.
+            await asyncio.to_thread(export, None, snapshot())
+        except OSError as e:
+            logger.warning(f"Esportazione periodica delle metriche non riuscita: {e}")
@@ -0,0 +1,57 @@
+import io
+import re
+
+try:
+    from pypdf import PdfReader
+except ImportError:
+    # Senza pypdf tutti i PDF seguono il percorso completo (upload al modello potente).
+    PdfReader = None
+
+# Un PDF è considerato "nativo digitale" se ha in media almeno questi caratteri visibili per pagina
+MIN_CHARS_PER_PAGE = 80
+# ... e se la maggior parte dei caratteri è testo leggibile (i font senza mappatura producono sequenze "(cid:12)").
+MIN_READABLE_RATIO = 0.6
+# Oltre questo numero di pagine il documento passa comunque dal percorso completo.
+MAX_PAGES = 30
+
+
+def _page_text(page):
+    try:
+        return page.extract_text(extraction_mode="layout") or ""
+    except TypeError:
+        # Versioni di pypdf senza modalità layout
+        return page.extract_text() or ""
+
+
+def _compact_layout(text):
+    """Riduce gli spazi di allineamento della modalità layout mantenendo la separazione tra le colonne."""
+    lines = [re.sub(r' {4,}', '    ', line.rstrip()) for line in text.splitlines()]
+    return re.sub(r'\n{3,}', '\n\n', "\n".join(lines)).strip()
+
+
+def extract_text_layer(pdf_bytes):
+    """
+    Estrae localmente lo strato di testo del PDF, pagina per pagina e conservando l'impaginazione.
+    Restituisce il testo se è utilizzabile, altrimenti None (PDF scansionato, senza testo, cifrato o troppo lungo).
+    """
+    if PdfReader is None:
+        return None
+    try:
+        reader = PdfReader(io.BytesIO(pdf_bytes))
+        if reader.is_encrypted and not reader.decrypt(""):
+            return None
+        if len(reader.pages) == 0 or len(reader.pages) > MAX_PAGES:
+            return None
+        pages = [_compact_layout(_page_text(page)) for page in reader.pages]
+    except Exception:
+        return None
+
+    visible = "".join(re.sub(r'\s', '', page) for page in pages)
+    if len(visible) < MIN_CHARS_PER_PAGE * len(pages):
+        return None
+    readable = len(re.findall(r'[A-Za-zÀ-ÿ0-9.,:;/\-()]', visible))
+    unmapped = len(re.findall(r'\(cid:\d+\)', visible))
+    if readable / len(visible) < MIN_READABLE_RATIO or unmapped * 8 > len(visible) * (1 - MIN_READABLE_RATIO):
+        return None
+
+    return "\n\n".join(f"--- Pagina {i} ---\n{page}" for i, page in enumerate(pages, 1))
@@ -0,0 +1,94 @@
+import asyncio
+import random
+import time
+
+
+class TokenBucketLimiter:
+    """
+    Limitatore a doppio token bucket (richieste al minuto e token al minuto) per un singolo modello.
+    Le chiamate attendono finché entrambi i bucket hanno capacità sufficiente; dopo un errore di quota
+    il limitatore viene messo in pausa per tutti i chiamanti, così da non ripetere raffiche di 429.
+    """
+    def __init__(self, name, rpm, tpm):
+        self.name = name
+        self.rpm = rpm
+        self.tpm = tpm
+        self._requests = float(rpm)
+        self._tokens = float(tpm)
+        self._last_refill = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = None
+        self._lock_loop = None
+        self.waits = 0
+        self.wait_seconds = 0.0
+        self.quota_errors = 0
+        self.calls = 0
+        self.tokens_used = 0
+
+    def _refill(self):
+        now = time.monotonic()
+        elapsed = now - self._last_refill
+        self._last_refill = now
+        self._requests = min(self.rpm, self._requests + elapsed * self.rpm / 60)
+        self._tokens = min(self.tpm, self._tokens + elapsed * self.tpm / 60)
+
+    def _get_lock(self):
+        # Il lock è legato al loop in cui viene usato: se ne crea uno nuovo per ogni asyncio.run
+        # (es. scansione e poi ripresa nello stesso processo), mantenendo lo stato dei bucket.
+        loop = asyncio.get_running_loop()
+        if self._lock is None or self._lock_loop is not loop:
+            self._lock = asyncio.Lock()
+            self._lock_loop = loop
+        return self._lock
+
+    async def acquire(self, estimated_tokens):
+        """Attende finché sono disponibili una richiesta e `estimated_tokens` token, poi li consuma."""
+        estimated_tokens = min(estimated_tokens, self.tpm)
+        waited = False
+        async with self._get_lock():
+            while True:
+                self._refill()
+                now = time.monotonic()
+                wait = self._paused_until - now
+                if wait <= 0:
+                    missing_requests = 1 - self._requests
+                    missing_tokens = estimated_tokens - self._tokens
+                    wait = max(missing_requests * 60 / self.rpm, missing_tokens * 60 / self.tpm, 0)
+                    if wait <= 0:
+                        self._requests -= 1
+                        self._tokens -= estimated_tokens
+                        break
+                if not waited:
+                    self.waits += 1
+                    waited = True
+                self.wait_seconds += wait
+                await asyncio.sleep(wait)
+
+    def record_usage(self, estimated_tokens, actual_tokens):
+        """Corregge il bucket con i token realmente consumati (da `usage_metadata`)."""
+        self.calls += 1
+        used = actual_tokens if actual_tokens else estimated_tokens
+        self.tokens_used += used
+        self._tokens -= used - min(estimated_tokens, self.tpm)
+
+    def backoff_delay(self, attempt, base=2.0, cap=60.0):
+        """Ritardo esponenziale con jitter dopo un errore di quota; sospende il limitatore per tutti."""
+        self.quota_errors += 1
+        delay = min(cap, base * (2 ** attempt)) * random.uniform(0.5, 1.5)
+        self._paused_until = max(self._paused_until, time.monotonic() + delay)
+        return delay
+
+    def status(self):
+        """Uso corrente del budget: frazione di RPM e TPM consumata e contatori di attese ed errori di quota."""
+        self._refill()
+        return {
+            'rpm_limit': self.rpm,
+            'tpm_limit': self.tpm,
+            'rpm_in_use': 1 - max(self._requests, 0) / self.rpm,
+            'tpm_in_use': 1 - max(self._tokens, 0) / self.tpm,
+            'calls': self.calls,
+            'tokens_used': self.tokens_used,
+            'waits': self.waits,
+            'wait_seconds': self.wait_seconds,
+            'quota_errors': self.quota_errors,
+        }
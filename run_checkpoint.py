@@ -0,0 +1,214 @@
+import json
+import time
+from sqlite3 import Error
+import database
+
+# Checkpoint delle scansioni: durante l'esecuzione vengono salvate le pagine elenco già lette (con i link nuovi trovati),
+# gli articoli da analizzare e i risultati delle analisi non ancora scritti nel database. Se la scansione si interrompe
+# (Ctrl+C, crash, quota esaurita) può essere ripresa senza rileggere le pagine elenco né ripetere le analisi completate.
+
+STATUS_PENDING = 'pending'    # articolo accodato, analisi non ancora completata
+STATUS_ANALYSED = 'analysed'  # analisi completata, risultati salvati qui ma non ancora nel database
+STATUS_DONE = 'done'          # risultati scritti nella tabella interpelli
+STATUS_FAILED = 'failed'      # analisi fallita per MAX_ARTICLE_ATTEMPTS volte (es. 404): non più ritentata nelle riprese
+
+MAX_ARTICLE_ATTEMPTS = 3
+
+_conn = None
+
+
+def _get_connection():
+    global _conn
+    if _conn is None:
+        _conn = database.create_connection(check_same_thread=False)
+        if _conn is None:
+            return None
+        try:
+            _conn.execute("""
+                CREATE TABLE IF NOT EXISTS scan_runs (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    provinces TEXT NOT NULL,
+                    max_pages INTEGER NOT NULL,
+                    incremental INTEGER NOT NULL,
+                    started_at REAL NOT NULL,
+                    finished_at REAL,
+                    outcome TEXT
+                )
+            """)
+            _conn.execute("""
+                CREATE TABLE IF NOT EXISTS scan_run_pages (
+                    run_id INTEGER NOT NULL,
+                    provincia TEXT NOT NULL,
+                    page_num INTEGER NOT NULL,
+                    fresh_links TEXT NOT NULL,
+                    PRIMARY KEY (run_id, provincia, page_num)
+                )
+            """)
+            _conn.execute("""
+                CREATE TABLE IF NOT EXISTS scan_run_articles (
+                    run_id INTEGER NOT NULL,
+                    url TEXT NOT NULL,
+                    provincia TEXT NOT NULL,
+                    status TEXT NOT NULL,
+                    results_json TEXT,
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    PRIMARY KEY (run_id, url)
+                )
+            """)
+            # Checkpoint creati da versioni precedenti, senza il contatore dei tentativi.
+            columns = {row[1] for row in _conn.execute("PRAGMA table_info(scan_run_articles)")}
+            if 'attempts' not in columns:
+                _conn.execute("ALTER TABLE scan_run_articles ADD COLUMN attempts INTEGER NOT NULL DEFAULT 0")
+            _conn.commit()
+        except Error as e:
+            print(f"Errore durante l'apertura del checkpoint delle scansioni: {e}")
+            _conn = None
+    return _conn
+
+
+class RunCheckpoint:
+    """Stato persistente di una scansione. Senza connessione al database tutte le operazioni sono ignorate."""
+
+    def __init__(self, run_id, provinces, max_pages, incremental, started_at):
+        self.run_id = run_id
+        self.provinces = provinces
+        self.max_pages = max_pages
+        self.incremental = incremental
+        self.started_at = started_at
+        self._status = {}
+        self._attempts = {}
+        conn = _get_connection()
+        if conn is not None and run_id is not None:
+            rows = conn.execute("SELECT url, status, attempts FROM scan_run_articles WHERE run_id = ?", (run_id,)).fetchall()
+            self._status = {url: status for url, status, _ in rows}
+            self._attempts = {url: attempts for url, _, attempts in rows}
+
+    def _write(self, sql_statements):
+        conn = _get_connection()
+        if conn is None or self.run_id is None:
+            return
+        try:
+            with conn:
+                for sql, params in sql_statements:
+                    if isinstance(params, list):
+                        conn.executemany(sql, params)
+                    else:
+                        conn.execute(sql, params)
+        except Error as e:
+            print(f"Errore durante l'aggiornamento del checkpoint della scansione: {e}")
+
+    def get_page(self, provincia, page_num):
+        """Link nuovi trovati in una pagina elenco già letta in questa scansione, o None se la pagina non è stata letta."""
+        conn = _get_connection()
+        if conn is None or self.run_id is None:
+            return None
+        row = conn.execute("SELECT fresh_links FROM scan_run_pages WHERE run_id = ? AND provincia = ? AND page_num = ?",
+                           (self.run_id, provincia, page_num)).fetchone()
+        return [tuple(link) for link in json.loads(row[0])] if row else None
+
+    def record_page(self, provincia, page_num, fresh_links):
+        """Salva i link nuovi di una pagina elenco e registra i relativi articoli come da analizzare."""
+        for link, _ in fresh_links:
+            self._status.setdefault(link, STATUS_PENDING)
+        self._write([
+            ("INSERT OR REPLACE INTO scan_run_pages(run_id, provincia, page_num, fresh_links) VALUES(?,?,?,?)",
+             (self.run_id, provincia, page_num, json.dumps(fresh_links, ensure_ascii=False))),
+            ("INSERT OR IGNORE INTO scan_run_articles(run_id, url, provincia, status) VALUES(?,?,?,?)",
+             [(self.run_id, link, prov, STATUS_PENDING) for link, prov in fresh_links]),
+        ])
+
+    def is_done(self, url):
+        return self._status.get(url) == STATUS_DONE
+
+    def is_failed(self, url):
+        return self._status.get(url) == STATUS_FAILED
+
+    def get_result(self, url):
+        """Risultati di un articolo già analizzato ma non ancora salvato nel database, o None."""
+        conn = _get_connection()
+        if self._status.get(url) != STATUS_ANALYSED or conn is None:
+            return None
+        row = conn.execute("SELECT results_json FROM scan_run_articles WHERE run_id = ? AND url = ?", (self.run_id, url)).fetchone()
+        return json.loads(row[0]) if row and row[0] is not None else None
+
+    def record_result(self, article, results):
+        url, provincia = article
+        self._status[url] = STATUS_ANALYSED
+        self._write([("""INSERT INTO scan_run_articles(run_id, url, provincia, status, results_json) VALUES(?,?,?,?,?)
+                         ON CONFLICT(run_id, url) DO UPDATE SET status = excluded.status, results_json = excluded.results_json""",
+                      (self.run_id, url, provincia, STATUS_ANALYSED, json.dumps(results, ensure_ascii=False)))])
+
+    def mark_done(self, articles):
+        """Segna come completati gli articoli i cui risultati sono stati scritti nel database."""
+        for url, _ in articles:
+            self._status[url] = STATUS_DONE
+        self._write([("UPDATE scan_run_articles SET status = ?, results_json = NULL WHERE run_id = ? AND url = ?",
+                      [(STATUS_DONE, self.run_id, url) for url, _ in articles])])
+
+    def record_failure(self, article):
+        """
+        Conta un tentativo di analisi fallito. Dopo MAX_ARTICLE_ATTEMPTS tentativi l'articolo è segnato come fallito
+        e non tiene più aperta la scansione; resta fuori dal ledger e sarà ritentato dalle prossime scansioni.
+        """
+        url, provincia = article
+        attempts = self._attempts.get(url, 0) + 1
+        self._attempts[url] = attempts
+        status = STATUS_FAILED if attempts >= MAX_ARTICLE_ATTEMPTS else STATUS_PENDING
+        self._status[url] = status
+        self._write([("""INSERT INTO scan_run_articles(run_id, url, provincia, status, attempts) VALUES(?,?,?,?,?)
+                         ON CONFLICT(run_id, url) DO UPDATE SET status = excluded.status, attempts = excluded.attempts""",
+                      (self.run_id, url, provincia, status, attempts))])
+
+    def unfinished_count(self):
+        """Articoli ancora da completare; quelli falliti definitivamente non sono contati."""
+        return sum(1 for status in self._status.values() if status not in (STATUS_DONE, STATUS_FAILED))
+
+    def failed_count(self):
+        return sum(1 for status in self._status.values() if status == STATUS_FAILED)
+
+    def finish(self, outcome='completed'):
+        """Chiude la scansione ed elimina lo stato intermedio, che non serve più."""
+        self._write([
+            ("UPDATE scan_runs SET finished_at = ?, outcome = ? WHERE id = ?", (time.time(), outcome, self.run_id)),
+            ("DELETE FROM scan_run_pages WHERE run_id = ?", (self.run_id,)),
+            ("DELETE FROM scan_run_articles WHERE run_id = ?", (self.run_id,)),
+        ])
+
+
+def start_run(provinces, max_pages, incremental):
+    """Registra una nuova scansione. Eventuali scansioni interrotte rimaste aperte vengono abbandonate."""
+    interrupted = find_interrupted_run()
+    if interrupted is not None:
+        interrupted.finish(outcome='abandoned')
+    started_at = time.time()
+    conn = _get_connection()
+    run_id = None
+    if conn is not None:
+        try:
+            with conn:
+                cur = conn.execute("INSERT INTO scan_runs(provinces, max_pages, incremental, started_at) VALUES(?,?,?,?)",
+                                   (json.dumps(provinces, ensure_ascii=False), max_pages, int(incremental), started_at))
+                run_id = cur.lastrowid
+        except Error as e:
+            print(f"Errore durante la registrazione della scansione: {e}")
+    return RunCheckpoint(run_id, provinces, max_pages, incremental, started_at)
+
+
+def find_interrupted_run():
+    """Restituisce il checkpoint dell'ultima scansione non terminata, o None."""
+    conn = _get_connection()
+    if conn is None:
+        return None
+    row = conn.execute("""SELECT id, provinces, max_pages, incremental, started_at FROM scan_runs
+                          WHERE finished_at IS NULL ORDER BY id DESC LIMIT 1""").fetchone()
+    if row is None:
+        return None
+    run_id, provinces, max_pages, incremental, started_at = row
+    return RunCheckpoint(run_id, json.loads(provinces), max_pages, bool(incremental), started_at)
+
+
+def close():
+    global _conn
+    if _conn is not None:
+        _conn.close()
+        _conn = None
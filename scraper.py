@@ -1,90 +1,241 @@
 import aiohttp
-import os
 import time
 import re
+from collections import defaultdict
 from bs4 import BeautifulSoup
+import config
+import cassette
+import http_store
 
 HEADERS = {
     'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
 }
 
+_pool_stats = {}
+
+def _reset_pool_stats():
+    _pool_stats.clear()
+    _pool_stats.update({
+        'requests': 0, 'new_connections': 0, 'reused_connections': 0,
+        'dns_cache_hits': 0, 'dns_cache_misses': 0,
+        'per_host': defaultdict(lambda: {'requests': 0, 'new_connections': 0, 'reused_connections': 0}),
+    })
+
+async def _on_request_start(session, trace_ctx, params):
+    trace_ctx.host = params.url.host
+    _pool_stats['requests'] += 1
+    _pool_stats['per_host'][trace_ctx.host]['requests'] += 1
+
+async def _on_connection_create_end(session, trace_ctx, params):
+    _pool_stats['new_connections'] += 1
+    _pool_stats['per_host'][getattr(trace_ctx, 'host', None)]['new_connections'] += 1
+
+async def _on_connection_reuseconn(session, trace_ctx, params):
+    _pool_stats['reused_connections'] += 1
+    _pool_stats['per_host'][getattr(trace_ctx, 'host', None)]['reused_connections'] += 1
+
+async def _on_dns_cache_hit(session, trace_ctx, params):
+    _pool_stats['dns_cache_hits'] += 1
+
+async def _on_dns_cache_miss(session, trace_ctx, params):
+    _pool_stats['dns_cache_misses'] += 1
+
+def create_session():
+    """
+    Crea la sessione HTTP condivisa da tutta la scansione: pool con limite per host, cache DNS,
+    connessioni keep-alive riutilizzate e trasferimenti compressi. Azzera le statistiche del pool.
+    Con una cassetta attiva le risposte sono registrate o riprodotte (vedi cassette).
+    """
+    _reset_pool_stats()
+    return cassette.wrap_session(_create_aiohttp_session)
+
+def _create_aiohttp_session():
+    connector = aiohttp.TCPConnector(
+        limit=config.HTTP_MAX_CONNECTIONS,
+        limit_per_host=config.HTTP_MAX_CONNECTIONS_PER_HOST,
+        use_dns_cache=True,
+        ttl_dns_cache=config.HTTP_DNS_CACHE_TTL,
+        keepalive_timeout=config.HTTP_KEEPALIVE_TIMEOUT,
+    )
+    trace_config = aiohttp.TraceConfig()
+    trace_config.on_request_start.append(_on_request_start)
+    trace_config.on_connection_create_end.append(_on_connection_create_end)
+    trace_config.on_connection_reuseconn.append(_on_connection_reuseconn)
+    trace_config.on_dns_cache_hit.append(_on_dns_cache_hit)
+    trace_config.on_dns_cache_miss.append(_on_dns_cache_miss)
+    return aiohttp.ClientSession(
+        connector=connector,
+        headers={'Accept-Encoding': 'gzip, deflate'},
+        trace_configs=[trace_config],
+    )
+
+def get_pool_stats():
+    """Statistiche del pool della sessione corrente, con il tasso di riutilizzo delle connessioni."""
+    if not _pool_stats:
+        _reset_pool_stats()
+    connections = _pool_stats['new_connections'] + _pool_stats['reused_connections']
+    stats = {key: value for key, value in _pool_stats.items() if key != 'per_host'}
+    stats['reuse_rate'] = _pool_stats['reused_connections'] / connections if connections else 0.0
+    stats['per_host'] = {host: dict(counts) for host, counts in _pool_stats['per_host'].items()}
+    return stats
+
+def _response_encoding(response):
+    try:
+        return response.get_encoding()
+    except Exception:
+        return 'utf-8'
+
+# Dimensione massima di un documento tenuto in memoria: oltre questo limite il download viene interrotto.
+MAX_DOCUMENT_BYTES = 50 * 1024 * 1024
+READ_CHUNK_SIZE = 64 * 1024
+
+async def _read_bounded(response, max_bytes=None):
+    """Legge il corpo della risposta a blocchi in un buffer in memoria, rifiutando i contenuti oltre `max_bytes`."""
+    max_bytes = max_bytes or MAX_DOCUMENT_BYTES
+    declared_length = response.content_length
+    if declared_length and declared_length > max_bytes:
+        raise ValueError(f"Contenuto troppo grande ({declared_length} byte, limite {max_bytes})")
+    buffer = bytearray()
+    while True:
+        chunk = await response.content.read(READ_CHUNK_SIZE)
+        if not chunk:
+            break
+        buffer.extend(chunk)
+        if len(buffer) > max_bytes:
+            raise ValueError(f"Contenuto troppo grande (oltre {max_bytes} byte)")
+    return bytes(buffer)
+
+async def _read_and_store(response, store_key, store_body=True):
+    body = await _read_bounded(response)
+    encoding = _response_encoding(response)
+    # In riproduzione le risposte arrivano dalla cassetta: l'archivio locale resta quello della scansione precedente.
+    if cassette.is_replaying():
+        return body, encoding
+    http_store.save_response(store_key, body, response.headers.get('ETag'), response.headers.get('Last-Modified'),
+                             encoding, store_body=store_body)
+    return body, encoding
+
+async def _conditional_get(session, url, timeout, headers=None, store_key=None, store_body=True, known_hash=None):
+    """
+    GET condizionale: invia If-None-Match/If-Modified-Since se l'URL è già in archivio e serve le risposte 304 dal disco.
+    Restituisce (status_http, corpo_in_byte, encoding). Le risposte 404 restituiscono (404, None, None).
+    Con `store_body=False` il corpo non viene salvato su disco (solo i metadati). Con `known_hash` (hash di un
+    documento già elaborato) la richiesta è condizionale anche senza copia locale e un 304 restituisce (304, None, None).
+    """
+    store_key = store_key or url
+    request_headers = dict(headers or {})
+    # Con una cassetta attiva le risposte devono essere complete: niente richieste condizionali.
+    if not cassette.is_active():
+        request_headers.update(http_store.conditional_headers(store_key, known_hash))
+    async with session.get(url, headers=request_headers, timeout=timeout) as response:
+        if response.status == 404:
+            return 404, None, None
+        if response.status == 304 and known_hash is not None:
+            http_store.mark_not_modified(store_key)
+            return 304, None, None
+        if response.status == 304:
+            body, encoding = http_store.load_not_modified(store_key)
+            if body is not None:
+                print(f"Contenuto invariato (304), uso la copia locale di: {url}")
+                return 304, body, encoding
+        else:
+            response.raise_for_status()
+            body, encoding = await _read_and_store(response, store_key, store_body)
+            return response.status, body, encoding
+
+    # 304 ricevuto ma copia locale non disponibile: ripetiamo la richiesta senza header condizionali.
+    async with session.get(url, headers=headers, timeout=timeout) as response:
+        response.raise_for_status()
+        body, encoding = await _read_and_store(response, store_key, store_body)
+        return response.status, body, encoding
+
 async def get_page_html(session, url):
     print(f"Recupero HTML da: {url}")
     try:
-        async with session.get(url, headers=HEADERS, timeout=20) as response:
-            if response.status == 404:
-                return None
-            response.raise_for_status()
-            return await response.text()
+        status, body, encoding = await _conditional_get(session, url, 20, headers=HEADERS)
+        if status == 404:
+            return None
+        return body.decode(encoding or 'utf-8', errors='replace')
     except Exception as e:
         print(f"Errore durante il recupero dell'HTML da {url}: {e}")
         return None
 
-def _create_safe_filepath(url, folder):
-    if not os.path.exists(folder):
-        os.makedirs(folder)
-    safe_filename_base = re.sub(r'[^a-zA-Z0-9.]', '_', url.replace("https://", "").replace("http://", ""))
-    safe_filename = (safe_filename_base[:150] + '.pdf')
-    return os.path.join(folder, safe_filename)
+# Restituito dai download quando il server conferma (304) che il documento con hash `known_hash` non è cambiato.
+NOT_MODIFIED = object()
 
-async def download_direct_file(session, url, folder="downloads"):
-    final_filepath = _create_safe_filepath(url, folder)
+async def download_direct_file(session, url, known_hash=None):
+    """
+    Scarica un documento direttamente in memoria e ne restituisce i byte (None in caso di errore).
+    Con `known_hash` restituisce NOT_MODIFIED, senza scaricare nulla, se il documento è invariato.
+    """
     try:
         print(f"Tentativo di download diretto da: {url}")
-        async with session.get(url, headers=HEADERS, timeout=60) as response:
-            response.raise_for_status()
-            with open(final_filepath, 'wb') as f:
-                while True:
-                    chunk = await response.content.read(8192)
-                    if not chunk:
-                        break
-                    f.write(chunk)
-        print(f"File scaricato con successo in: {final_filepath}")
-        return final_filepath
+        status, content, _ = await _conditional_get(session, url, 60, headers=HEADERS, store_body=False, known_hash=known_hash)
+        if status == 404:
+            raise aiohttp.ClientError(f"404 Not Found: {url}")
+        if status == 304 and content is None:
+            print(f"Documento invariato (304), già elaborato: {url}")
+            return NOT_MODIFIED
+        print(f"File scaricato con successo ({len(content)} byte): {url}")
+        return content
     except Exception as e:
         print(f"Errore durante il download diretto di {url}: {e}")
         return None
 
-async def download_google_drive_file(session, url, folder="downloads"):
-    final_filepath = _create_safe_filepath(url, folder)
-    
+# URL di download diretto dei file pubblici di Google Drive (sostituibile, es. dal benchmark con un server locale).
+GOOGLE_DRIVE_DOWNLOAD_URL = 'https://drive.google.com/uc?export=download&id={file_id}'
+
+async def download_google_drive_file(session, url, known_hash=None):
+    """
+    Scarica un file pubblico di Google Drive in memoria e ne restituisce i byte (None in caso di errore).
+    Con `known_hash` restituisce NOT_MODIFIED, senza scaricare nulla, se il file è invariato.
+    """
     try:
         match = re.search(r'/file/d/([^/]+)', url)
         if not match:
             print(f"URL Google Drive non valido, ID non trovato: {url}")
             return None
-        
+
         file_id = match.group(1)
-        download_url = f'https://drive.google.com/uc?export=download&id={file_id}'
+        download_url = GOOGLE_DRIVE_DOWNLOAD_URL.format(file_id=file_id)
         print(f"Rilevato link Google Drive. URL di download impostato a: {download_url}")
 
-        async with session.get(download_url, timeout=60) as response:
-            response.raise_for_status()
-            
-            content_type = response.headers.get('Content-Type', '')
-            if "text/html" in content_type:
-                print("Rilevata pagina di conferma di Google Drive. Cerco il link di download finale...")
-                html = await response.text()
-                soup = BeautifulSoup(html, 'html.parser')
-                confirm_link_tag = soup.find('a', {'id': 'uc-download-link'})
-                if confirm_link_tag and confirm_link_tag.get('href'):
-                    confirm_url = confirm_link_tag.get('href')
-                    print(f"Trovato link di conferma. Eseguo il download finale da: {confirm_url}")
-                    async with session.get(confirm_url, timeout=60) as final_response:
-                        final_response.raise_for_status()
-                        content = await final_response.read()
+        # I metadati di cache sono associati all'URL originale del file, non agli URL di conferma (che cambiano).
+        content = None
+        conditional_headers = http_store.conditional_headers(url, known_hash) if not cassette.is_active() else {}
+        async with session.get(download_url, headers=conditional_headers, timeout=60) as response:
+            if response.status == 304 and known_hash is not None:
+                http_store.mark_not_modified(url)
+                print(f"File Google Drive invariato (304), già elaborato: {url}")
+                return NOT_MODIFIED
+            if response.status == 304:
+                content, _ = http_store.load_not_modified(url)
+                if content is not None:
+                    print(f"File Google Drive invariato (304), uso la copia locale di: {url}")
+            if content is None:
+                response.raise_for_status()
+
+                content_type = response.headers.get('Content-Type', '')
+                if "text/html" in content_type:
+                    print("Rilevata pagina di conferma di Google Drive. Cerco il link di download finale...")
+                    html = await response.text()
+                    soup = BeautifulSoup(html, 'html.parser')
+                    confirm_link_tag = soup.find('a', {'id': 'uc-download-link'})
+                    if confirm_link_tag and confirm_link_tag.get('href'):
+                        confirm_url = confirm_link_tag.get('href')
+                        print(f"Trovato link di conferma. Eseguo il download finale da: {confirm_url}")
+                        async with session.get(confirm_url, timeout=60) as final_response:
+                            final_response.raise_for_status()
+                            content, _ = await _read_and_store(final_response, url, store_body=False)
+                    else:
+                        print("ERRORE: Impossibile trovare il link di download di conferma.")
+                        return None
                 else:
-                    print("ERRORE: Impossibile trovare il link di download di conferma.")
-                    return None
-            else:
-                content = await response.read()
-
-        with open(final_filepath, 'wb') as f:
-            f.write(content)
-        
-        print(f"File Google Drive scaricato con successo in: {final_filepath}")
-        return final_filepath
-        
+                    content, _ = await _read_and_store(response, url, store_body=False)
+
+        print(f"File Google Drive scaricato con successo ({len(content)} byte): {url}")
+        return content
+
     except Exception as e:
         print(f"Errore durante il download da Google Drive {url}: {e}")
-        return None
\ No newline at end of file
+        return None
@@ -1,12 +1,13 @@
+import argparse
 import config
+import cassette
 import scraper
 import llm_processor
+import html_reducer
 import time
 import logging
-import os
 import json
 import asyncio
-import aiohttp
 
 def setup_logging():
     logging.basicConfig(
@@ -35,7 +36,7 @@ def select_province_for_test():
         except (ValueError, IndexError):
             print("Input non valido.")
 
-async def run_simple_diagnostics():
+async def run_simple_diagnostics(record_path=None, replay_path=None):
     setup_logging()
     logging.info("Avvio Diagnostica Semplice (Logica Universale)")
     print("Avvio diagnostica... L'output verrà salvato nel file 'simple_diagnostics.log'")
@@ -47,21 +48,29 @@ async def run_simple_diagnostics():
 
     base_url = config.SITES_CONFIG[provincia_test]["url"]
     
-    models = config.setup_gemini()
+    if replay_path:
+        cassette.configure(cassette.MODE_REPLAY, replay_path)
+    elif record_path:
+        cassette.configure(cassette.MODE_RECORD, record_path)
+    else:
+        cassette.configure_from_env()
+    models = cassette.wrap_models(config.setup_gemini)
     if not models:
         logging.error("Impossibile configurare Gemini. Test interrotto.")
+        cassette.close()
         return
 
     logging.info("="*40)
     logging.info(f"\n--- TEST: Provincia di {provincia_test.upper()} ---")
     
-    async with aiohttp.ClientSession() as session:
+    async with scraper.create_session() as session:
         try:
             logging.info("\n[FASE 1] Trovare i link agli articoli...")
             html_content_list = await scraper.get_page_html(session, base_url)
             if not html_content_list: 
                 logging.error(">>> RISULTATO FASE 1: FALLITO - Impossibile recuperare l'HTML della pagina elenco.")
                 return
+            html_content_list = html_reducer.reduce_for_llm(html_content_list, base_url, logging)
             
             article_links = await llm_processor.extract_page_links_with_gemini(models, html_content_list, base_url, logging)
             if not article_links:
@@ -76,6 +85,7 @@ async def run_simple_diagnostics():
             if not html_content_article: 
                 logging.error(f">>> RISULTATO FASE 2: FALLITO - Impossibile recuperare l'HTML dell'articolo: {first_article_url}")
                 return
+            html_content_article = html_reducer.reduce_for_llm(html_content_article, first_article_url, logging)
 
             analysis_result = await llm_processor.analyze_article_page_and_get_data_or_links(models, html_content_article, first_article_url, logging)
             if not analysis_result:
@@ -93,20 +103,18 @@ async def run_simple_diagnostics():
             if file_links:
                 doc_url = file_links[0]
                 logging.info(f"Azione: Scaricare il primo file diretto trovato: {doc_url}")
-                file_path = await scraper.download_direct_file(session, doc_url)
-                if file_path:
-                    extracted_data = await llm_processor.process_pdf_with_gemini(models, file_path, logging)
-                    os.remove(file_path)
+                pdf_bytes = await scraper.download_direct_file(session, doc_url)
+                if pdf_bytes:
+                    extracted_data = await llm_processor.process_pdf_with_gemini(models, pdf_bytes, doc_url, logging)
                     if extracted_data:
                         logging.info(f">>> RISULTATO FASE 3: SUCCESSO - Dati estratti dal file: {json.dumps(extracted_data, indent=2, ensure_ascii=False)}")
             
             elif gdrive_links:
                 doc_url = gdrive_links[0]
                 logging.info(f"Azione: Scaricare il primo file Google Drive trovato: {doc_url}")
-                file_path = await scraper.download_google_drive_file(session, doc_url)
-                if file_path:
-                    extracted_data = await llm_processor.process_pdf_with_gemini(models, file_path, logging)
-                    os.remove(file_path)
+                pdf_bytes = await scraper.download_google_drive_file(session, doc_url)
+                if pdf_bytes:
+                    extracted_data = await llm_processor.process_pdf_with_gemini(models, pdf_bytes, doc_url, logging)
                     if extracted_data:
                         logging.info(f">>> RISULTATO FASE 3: SUCCESSO - Dati estratti da Google Drive: {json.dumps(extracted_data, indent=2, ensure_ascii=False)}")
 
@@ -115,6 +123,7 @@ async def run_simple_diagnostics():
                 logging.info(f"Azione: Analizzare HTML del portale: {portal_url}")
                 portal_html = await scraper.get_page_html(session, portal_url)
                 if portal_html:
+                    portal_html = html_reducer.reduce_for_llm(portal_html, portal_url, logging)
                     extracted_data = await llm_processor.extract_data_from_html(models, portal_html, logging)
                     if extracted_data:
                         logging.info(f">>> RISULTATO FASE 3: SUCCESSO - Dati estratti dal portale: {json.dumps(extracted_data, indent=2, ensure_ascii=False)}")
@@ -127,12 +136,21 @@ async def run_simple_diagnostics():
 
         except Exception as e:
             logging.error(f">>> ERRORE IMPREVISTO: {e}", exc_info=True)
+        finally:
+            saved_path = cassette.close()
+            if saved_path:
+                logging.info(f"Cassetta salvata in {saved_path}")
 
     logging.info("\n" + "="*40)
     print("Diagnostica completata. Controllare il file 'simple_diagnostics.log'.")
 
 if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Diagnostica della pipeline su una singola provincia.")
+    cassette_group = parser.add_mutually_exclusive_group()
+    cassette_group.add_argument('--record', metavar='CASSETTA', help="registra le risposte HTTP e Gemini nella cassetta indicata")
+    cassette_group.add_argument('--replay', metavar='CASSETTA', help="riproduce la diagnostica dalla cassetta, senza rete né chiamate a Gemini")
+    args = parser.parse_args()
     try:
-        asyncio.run(run_simple_diagnostics())
+        asyncio.run(run_simple_diagnostics(record_path=args.record, replay_path=args.replay))
     except KeyboardInterrupt:
         print("\nDiagnostica interrotta dall'utente.")
\ No newline at end of file
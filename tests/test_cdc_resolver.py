@@ -0,0 +1,27 @@
+import pytest
+import cdc_resolver
+
+
+@pytest.mark.parametrize("text, expected", [
+    ("AB25 Lingua inglese", "AB25"),
+    ("Lingua inglese (AB24)", "AB24"),
+    ("AB22 inglese", "AB22"),
+    ("AZ99 Lingua inglese", "AZ99"),
+    ("A-22 Lingue straniere", "A-22"),
+    ("Lingua inglese", "AB22"),
+    ("Sostegno scuola secondaria I grado", "ADMM"),
+    ("Posto di sostegno - scuola secondaria di secondo grado", "ADSS"),
+    ("sost. II grado", "ADSS"),
+    ("Sostegno scuola media", "ADMM"),
+    ("Sostegno nella scuola primaria", "ADEE"),
+    ("Sostegno infanzia", "ADAA"),
+    ("Matematica e scienze", "A-28"),
+    ("Cattedra fino a 12 ore", None),
+])
+def test_resolve(text, expected):
+    assert cdc_resolver.resolve(text) == expected
+
+
+def test_new_codes_are_known():
+    for code in ["AA24", "AB24", "AC24", "AD24", "AA25", "AB25", "AC25", "AD25", "ADAA"]:
+        assert code in cdc_resolver.KNOWN_CODES
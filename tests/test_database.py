@@ -0,0 +1,112 @@
+import sqlite3
+from datetime import date
+import database
+
+
+def _make_db():
+    conn = sqlite3.connect(":memory:")
+    database.create_table(conn)
+    database.create_crawl_ledger_table(conn)
+    return conn
+
+
+def _row(i, **overrides):
+    row = {
+        'nome_scuola': f"Istituto {i}", 'indirizzo': "Via Roma 1", 'citta': "Bergamo", 'provincia': "Bergamo",
+        'data_fine_incarico': "30/06/2026", 'classe_di_concorso': "A022", 'numero_di_ore': 18,
+        'tipo_cattedra': "Cattedra interna", 'url_sorgente': f"https://example.org/{i}",
+    }
+    row.update(overrides)
+    return row
+
+
+def test_batch_counts_with_fts_triggers():
+    conn = _make_db()
+    assert database.has_fts_index(conn)
+
+    counts = database.insert_interpelli_batch(conn, [_row(i) for i in range(130)])
+    assert counts == {'inserted': 130, 'duplicates': 0, 'rejected': 0}
+
+    rows = [_row(i) for i in range(125, 135)]
+    counts = database.insert_interpelli_batch(conn, rows)
+    assert counts == {'inserted': 5, 'duplicates': 5, 'rejected': 0}
+
+    rows = [_row(0, numero_di_ore=9), _row(1), _row(200)]
+    counts = database.insert_interpelli_batch(conn, rows)
+    assert counts == {'inserted': 1, 'duplicates': 2, 'rejected': 0}
+    assert conn.execute("SELECT numero_di_ore FROM interpelli WHERE nome_scuola = 'Istituto 0'").fetchone()[0] == 18
+    assert len(list(database.InterpelliPager(conn, search_text="istituto").iter_rows())) == 136
+
+
+def test_batch_with_invalid_row_keeps_the_rest():
+    conn = _make_db()
+    rows = [_row(1), _row(2, url_sorgente=None), _row(3)]
+    articles = [("https://example.org/a", "Bergamo"), ("https://example.org/b", "Bergamo")]
+
+    counts = database.insert_interpelli_batch(conn, rows, articles)
+    assert counts == {'inserted': 2, 'duplicates': 0, 'rejected': 1}
+    assert conn.execute("SELECT COUNT(*) FROM interpelli").fetchone()[0] == 2
+    assert conn.execute("SELECT COUNT(*) FROM crawl_ledger").fetchone()[0] == 2
+
+
+def test_pager_walks_a_filtered_view_in_both_directions():
+    conn = _make_db()
+    rows = [_row(i, numero_di_ore=6 + i % 13) for i in range(40)]
+    rows += [_row(i, provincia="Milano", citta="Milano") for i in range(40, 55)]
+    database.insert_interpelli_batch(conn, rows)
+    expected = conn.execute(
+        "SELECT id FROM interpelli WHERE provincia = 'Bergamo' AND numero_di_ore >= 12 ORDER BY id").fetchall()
+
+    pager = database.InterpelliPager(conn, filters={'provincia': "bergamo", 'min_ore': 12}, page_size=7)
+    pages = [pager.first_page()]
+    assert not pager.has_previous
+    while pager.has_next:
+        pages.append(pager.next_page())
+    assert pager.next_page() is None
+    seen = [row[0] for page in pages for row in page]
+    assert sorted(seen) == [row[0] for row in expected]
+    assert len(seen) == len(set(seen))
+    assert all(row[4] == "Bergamo" and row[7] >= 12 for page in pages for row in page)
+    assert [row[0] for row in pager.iter_rows(chunk_size=3)] == seen
+
+    for page in reversed(pages[:-1]):
+        assert pager.previous_page() == page
+    assert pager.page_number == 1 and not pager.has_previous
+    assert pager.previous_page() is None
+
+
+def test_archive_moves_only_expired_rows():
+    conn = _make_db()
+    rows = [_row(1, data_fine_incarico="31/08/2025"), _row(2, data_fine_incarico="1 settembre 2025"),
+            _row(3, data_fine_incarico="da definire"), _row(4)]
+    database.insert_interpelli_batch(conn, rows)
+
+    assert database.archive_expired_interpelli(conn, today=date(2025, 9, 1)) == 1
+    remaining = [row[0] for row in conn.execute("SELECT nome_scuola FROM interpelli ORDER BY id")]
+    assert remaining == ["Istituto 2", "Istituto 3", "Istituto 4"]
+    archived = conn.execute("SELECT nome_scuola, data_fine_iso, url_sorgente FROM interpelli_archivio").fetchall()
+    assert archived == [("Istituto 1", "2025-08-31", "https://example.org/1")]
+    # L'indice di ricerca segue la tabella principale.
+    assert len(list(database.InterpelliPager(conn, search_text="istituto").iter_rows())) == 3
+    assert database.archive_expired_interpelli(conn, today=date(2025, 9, 1)) == 0
+
+
+def test_migration_fills_derived_columns_of_old_tables():
+    conn = sqlite3.connect(":memory:")
+    conn.execute("""CREATE TABLE interpelli (
+        id INTEGER PRIMARY KEY AUTOINCREMENT, nome_scuola TEXT NOT NULL, indirizzo TEXT, citta TEXT,
+        provincia TEXT NOT NULL, data_fine_incarico TEXT, classe_di_concorso TEXT, numero_di_ore INTEGER,
+        tipo_cattedra TEXT, url_sorgente TEXT NOT NULL, data_inserimento TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        UNIQUE (nome_scuola, classe_di_concorso, data_fine_incarico))""")
+    conn.executemany("INSERT INTO interpelli(nome_scuola, provincia, data_fine_incarico, classe_di_concorso, url_sorgente) "
+                     "VALUES(?, ?, ?, ?, ?)",
+                     [("Liceo Mascheroni", " Bergamo ", "30 giugno 2026", " a 022", "https://example.org/1"),
+                      ("IC Treviglio", "BERGAMO", "fine anno", None, "https://example.org/2")])
+    conn.commit()
+
+    database.create_table(conn)
+    rows = conn.execute("SELECT data_fine_iso, cdc_norm, provincia_norm FROM interpelli ORDER BY id").fetchall()
+    assert rows == [("2026-06-30", "A022", "bergamo"), (None, None, "bergamo")]
+    pager = database.InterpelliPager(conn, filters={'provincia': "Bergamo", 'classe_di_concorso': "A022"})
+    assert [row[1] for row in pager.first_page()] == ["Liceo Mascheroni"]
+    assert [row[1] for row in database.InterpelliPager(conn, search_text="mascheroni").first_page()] == ["Liceo Mascheroni"]
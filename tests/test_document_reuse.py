@@ -0,0 +1,63 @@
+import asyncio
+import logging
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+import database
+import document_ledger
+import http_store
+import scraper
+import worker
+
+PDF_BYTES = b"%PDF-1.4 interpello"
+EXTRACTED = [{'nome_scuola': "IC Treviglio", 'classe_di_concorso': "A-22"}]
+
+
+def test_unchanged_document_is_not_downloaded_again(tmp_path, monkeypatch):
+    monkeypatch.setattr(database, 'DB_FILE', str(tmp_path / "interpelli.sqlite"))
+    monkeypatch.setattr(http_store, 'STORE_FILE', str(tmp_path / "http_cache.sqlite"))
+    monkeypatch.setattr(http_store, 'BODY_FOLDER', str(tmp_path / "http_cache"))
+    document_ledger.close()
+    http_store.close()
+    requests = []
+
+    async def serve_pdf(request):
+        requests.append(request.headers.get('If-None-Match'))
+        if request.headers.get('If-None-Match') == '"v1"':
+            return web.Response(status=304)
+        return web.Response(body=PDF_BYTES, content_type='application/pdf', headers={'ETag': '"v1"'})
+
+    extractions = []
+
+    async def fake_extract(models, pdf_bytes, doc_url, logger):
+        extractions.append(doc_url)
+        return await document_ledger.get_or_extract(doc_url, pdf_bytes, lambda: _result(), logger)
+
+    async def _result():
+        return [dict(item) for item in EXTRACTED]
+
+    monkeypatch.setattr(worker, '_extract_document', fake_extract)
+
+    async def scenario():
+        app = web.Application()
+        app.router.add_get('/bando.pdf', serve_pdf)
+        server = TestServer(app)
+        await server.start_server()
+        url = str(server.make_url('/bando.pdf'))
+        logger = logging.getLogger(__name__)
+        try:
+            async with scraper.create_session() as session:
+                first = await worker._download_and_extract(None, session, scraper.download_direct_file, url, logger)
+                second = await worker._download_and_extract(None, session, scraper.download_direct_file, url, logger)
+        finally:
+            await server.close()
+        return first, second
+
+    try:
+        first, second = asyncio.run(scenario())
+        assert first == EXTRACTED and second == EXTRACTED
+        assert requests == [None, '"v1"']
+        assert len(extractions) == 1
+        assert document_ledger.get_stats()['not_modified'] == 1
+    finally:
+        document_ledger.close()
+        http_store.close()
@@ -0,0 +1,36 @@
+import csv
+import json
+import exporters
+import database
+from test_database import _make_db, _row
+
+
+def _pager(rows):
+    conn = _make_db()
+    database.insert_interpelli_batch(conn, rows)
+    return database.InterpelliPager(conn, filters={'provincia': "Bergamo"})
+
+
+def test_csv_and_jsonl_contain_every_row_of_the_view(monkeypatch, tmp_path):
+    monkeypatch.setattr(exporters, 'EXPORT_CHUNK_SIZE', 7)
+    rows = [_row(i) for i in range(30)] + [_row(i, provincia="Milano") for i in range(30, 35)]
+    pager = _pager(rows)
+
+    csv_file = exporters.export_view(pager, 'csv', str(tmp_path / "vista.csv"))
+    with open(csv_file, encoding='utf-8', newline='') as f:
+        lines = list(csv.reader(f))
+    assert lines[0] == exporters.COLUMNS
+    assert len(lines) == 31
+
+    jsonl_file = exporters.export_view(pager, 'jsonl', str(tmp_path / "vista.jsonl"))
+    with open(jsonl_file, encoding='utf-8') as f:
+        records = [json.loads(line) for line in f]
+    assert len(records) == 30
+    assert {record['provincia'] for record in records} == {"Bergamo"}
+    assert [record['id'] for record in records] == [int(line[0]) for line in lines[1:]]
+
+
+def test_empty_view_creates_no_file(tmp_path):
+    pager = _pager([_row(1, provincia="Milano")])
+    assert exporters.export_view(pager, 'csv', str(tmp_path / "vuoto.csv")) is None
+    assert not (tmp_path / "vuoto.csv").exists()
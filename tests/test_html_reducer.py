@@ -0,0 +1,60 @@
+from html_reducer import reduce_html
+
+LISTING_PAGE = """
+<html><head><title>Interpelli</title></head>
+<body class="archive category">
+<header id="masthead" class="site-header" role="banner">
+  <div class="site-branding"><a href="/" rel="home">Ufficio Scolastico Territoriale di Bergamo</a></div>
+</header>
+<main id="main" class="site-main">
+  <header class="page-header"><h1 class="page-title">Interpelli ricerca supplenti</h1></header>
+  <article id="post-123" class="post-123 post type-post status-publish">
+    <header class="entry-header">
+      <h2 class="entry-title"><a href="https://bergamo.istruzionelombardia.gov.it/interpello-ic-treviglio-a022/" rel="bookmark">Interpello IC Treviglio A022</a></h2>
+      <div class="entry-meta"><span class="posted-on"><time class="entry-date published" datetime="2025-09-15T10:00:00+02:00">15 Settembre 2025</time></span></div>
+    </header>
+    <div class="entry-summary"><p>Si pubblica l'interpello per una cattedra di lettere.</p></div>
+  </article>
+  <article id="post-124" class="post-124 post type-post status-publish">
+    <header class="entry-header">
+      <h2 class="entry-title"><a href="/interpello-liceo-mascheroni-a027/" rel="bookmark">Interpello Liceo Mascheroni A027</a></h2>
+    </header>
+    <div class="entry-summary"><p>Interpello per matematica e fisica.</p></div>
+  </article>
+</main>
+</body></html>
+"""
+
+
+def test_entry_header_links_are_kept():
+    reduced = reduce_html(LISTING_PAGE, "https://bergamo.istruzionelombardia.gov.it/argomento/interpelli-ricerca-supplenti/")
+    assert '<a href="https://bergamo.istruzionelombardia.gov.it/interpello-ic-treviglio-a022/">Interpello IC Treviglio A022</a>' in reduced
+    assert '<a href="https://bergamo.istruzionelombardia.gov.it/interpello-liceo-mascheroni-a027/">Interpello Liceo Mascheroni A027</a>' in reduced
+    assert "Interpelli ricerca supplenti" in reduced
+    assert "Ufficio Scolastico Territoriale" not in reduced
+
+
+ARTICLE_WITH_EMBEDS = """
+<html><body>
+<main id="main">
+  <article class="post">
+    <header class="entry-header"><h1 class="entry-title">Interpello IC Dalmine A022</h1></header>
+    <div class="entry-content">
+      <p>Si pubblica l'interpello in allegato.</p>
+      <iframe src="https://drive.google.com/file/d/1AbCdEfG/preview" width="640" height="480"></iframe>
+      <iframe src="/wp-content/uploads/2025/09/interpello.pdf" title="Interpello A022"></iframe>
+      <iframe src="https://www.youtube.com/embed/xyz" style="display:none" srcdoc=""></iframe>
+      <iframe></iframe>
+    </div>
+  </article>
+</main>
+</body></html>
+"""
+
+
+def test_iframe_sources_are_kept_as_links():
+    reduced = reduce_html(ARTICLE_WITH_EMBEDS, "https://bergamo.istruzionelombardia.gov.it/interpello-ic-dalmine/")
+    assert '<a href="https://drive.google.com/file/d/1AbCdEfG/preview">Documento incorporato</a>' in reduced
+    assert ('<a href="https://bergamo.istruzionelombardia.gov.it/wp-content/uploads/2025/09/interpello.pdf">'
+            'Interpello A022</a>') in reduced
+    assert "<iframe" not in reduced
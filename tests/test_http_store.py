@@ -0,0 +1,38 @@
+import os
+import time
+import http_store
+
+
+def _open_store(tmp_path, monkeypatch):
+    monkeypatch.setattr(http_store, 'STORE_FILE', str(tmp_path / "http_cache.sqlite"))
+    monkeypatch.setattr(http_store, 'BODY_FOLDER', str(tmp_path / "http_cache"))
+    http_store.close()
+    return http_store._get_connection()
+
+
+def test_evict_removes_old_entries_orphans_and_oversized_bodies(tmp_path, monkeypatch):
+    conn = _open_store(tmp_path, monkeypatch)
+    try:
+        http_store.save_response("https://example.org/old", b"old page")
+        http_store.save_response("https://example.org/a", b"a" * 600 * 1024)
+        http_store.save_response("https://example.org/b", b"b" * 600 * 1024)
+        http_store.save_response("https://example.org/doc.pdf", b"%PDF document", store_body=False)
+        conn.execute("UPDATE http_entries SET fetched_at = ? WHERE url = ?", (time.time() - 40 * 86400, "https://example.org/old"))
+        conn.execute("UPDATE http_entries SET fetched_at = fetched_at - 10 WHERE url = ?", ("https://example.org/a",))
+        conn.commit()
+        orphan = os.path.join(http_store.BODY_FOLDER, "zz", "zz-orphan")
+        os.makedirs(os.path.dirname(orphan))
+        with open(orphan, 'wb') as f:
+            f.write(b"pdf from an older version")
+
+        removed = http_store.evict(max_age_days=30, max_size_mb=1)
+
+        assert removed == 2
+        urls = {url for (url,) in conn.execute("SELECT url FROM http_entries")}
+        assert urls == {"https://example.org/b", "https://example.org/doc.pdf"}
+        files = [name for _, _, names in os.walk(http_store.BODY_FOLDER) for name in names]
+        assert len(files) == 1
+        assert http_store.conditional_headers("https://example.org/b") == {}
+        assert http_store.load_not_modified("https://example.org/b")[0] == b"b" * 600 * 1024
+    finally:
+        http_store.close()
@@ -0,0 +1,81 @@
+import asyncio
+import logging
+import time
+import llm_cache
+import llm_processor
+
+
+def _open_cache(tmp_path, monkeypatch):
+    monkeypatch.setattr(llm_cache, 'CACHE_FILE', str(tmp_path / "llm_cache.sqlite"))
+    monkeypatch.delenv(llm_cache.BYPASS_ENV_VAR, raising=False)
+    llm_cache.close()
+    llm_cache.reset_stats()
+    return llm_cache._get_connection()
+
+
+def test_put_and_get(tmp_path, monkeypatch):
+    _open_cache(tmp_path, monkeypatch)
+    try:
+        key = llm_cache.make_key('gemini-2.5-flash', "prompt", llm_cache.hash_content("<p>pagina</p>"))
+        assert llm_cache.get(key) is None
+        llm_cache.put(key, 'gemini-2.5-flash', '{"article_links": []}')
+        assert llm_cache.get(key) == '{"article_links": []}'
+        assert llm_cache.make_key('gemini-2.5-pro', "prompt", llm_cache.hash_content("<p>pagina</p>")) != key
+        stats = llm_cache.get_stats()
+        assert (stats['hits'], stats['misses'], stats['stores']) == (1, 1, 1)
+        llm_cache.reset_stats()
+        assert llm_cache.get_stats()['hits'] == 0
+    finally:
+        llm_cache.close()
+
+
+def test_evict_by_age_and_size(tmp_path, monkeypatch):
+    conn = _open_cache(tmp_path, monkeypatch)
+    try:
+        llm_cache.put('old', 'm', 'x')
+        llm_cache.put('least_used', 'm', 'a' * 600 * 1024)
+        llm_cache.put('recent', 'm', 'b' * 600 * 1024)
+        conn.execute("UPDATE responses SET created_at = ? WHERE cache_key = 'old'", (time.time() - 40 * 86400,))
+        conn.execute("UPDATE responses SET last_access = last_access - 10 WHERE cache_key = 'least_used'")
+        conn.commit()
+
+        assert llm_cache.evict(max_age_days=30, max_size_mb=1) == 2
+        assert [key for (key,) in conn.execute("SELECT cache_key FROM responses")] == ['recent']
+    finally:
+        llm_cache.close()
+
+
+def test_bypass_env_var(tmp_path, monkeypatch):
+    _open_cache(tmp_path, monkeypatch)
+    try:
+        llm_cache.put('key', 'm', 'risposta')
+        monkeypatch.setenv(llm_cache.BYPASS_ENV_VAR, '1')
+        assert llm_cache.get('key') is None
+        llm_cache.put('other', 'm', 'risposta')
+        monkeypatch.delenv(llm_cache.BYPASS_ENV_VAR)
+        assert llm_cache.get('key') == 'risposta'
+        assert llm_cache.get('other') is None
+    finally:
+        llm_cache.close()
+
+
+def test_empty_extraction_is_cached(tmp_path, monkeypatch):
+    _open_cache(tmp_path, monkeypatch)
+    calls = []
+
+    class Response:
+        text = "[]"
+
+    async def generate(*args, **kwargs):
+        calls.append(args)
+        return Response()
+
+    monkeypatch.setattr(llm_processor, '_generate', generate)
+    logger = logging.getLogger(__name__)
+    try:
+        for _ in range(2):
+            result = asyncio.run(llm_processor._extract_from_text({'fast': 'fast-model'}, 'fast', "Avviso", "test", logger))
+            assert result == []
+        assert len(calls) == 1
+    finally:
+        llm_cache.close()
@@ -0,0 +1,118 @@
+import asyncio
+import json
+import logging
+import re
+import config
+import llm_processor
+
+LOGGER = logging.getLogger(__name__)
+
+
+def _run_cascade(fast_result, fast_path, monkeypatch):
+    monkeypatch.setattr(config, 'EXTRACTION_CASCADE_ENABLED', False)
+    calls = []
+
+    async def fast_step():
+        calls.append('fast')
+        return fast_result
+
+    async def powerful_step():
+        calls.append('powerful')
+        return [{'nome_scuola': "Liceo"}]
+
+    result = asyncio.run(llm_processor._cascade_extract(fast_step, powerful_step, "test", LOGGER, fast_path=fast_path))
+    return result, calls
+
+
+def test_disabled_cascade_keeps_text_layer_fast_path(monkeypatch):
+    fast_data = [{'nome_scuola': "IC Treviglio", 'numero_di_ore': 40}]
+    result, calls = _run_cascade(fast_data, True, monkeypatch)
+    assert result == fast_data
+    assert calls == ['fast']
+
+
+def test_disabled_cascade_falls_back_when_fast_path_fails(monkeypatch):
+    result, calls = _run_cascade(None, True, monkeypatch)
+    assert calls == ['fast', 'powerful']
+    assert result == [{'nome_scuola': "Liceo"}]
+
+
+def test_disabled_cascade_uses_powerful_model_otherwise(monkeypatch):
+    _, calls = _run_cascade([{'nome_scuola': "IC"}], False, monkeypatch)
+    assert calls == ['powerful']
+
+
+def test_batcher_keeps_and_cancels_running_batches(monkeypatch):
+    monkeypatch.setattr(config, 'LLM_BATCH_MAX_DOCS', 1)
+    started = []
+
+    async def slow_generate(*args, **kwargs):
+        started.append(True)
+        await asyncio.sleep(60)
+
+    monkeypatch.setattr(llm_processor, '_generate', slow_generate)
+    batcher = llm_processor._UniversalAnalysisBatcher()
+
+    async def scenario():
+        submitted = asyncio.ensure_future(batcher.submit({}, "<p>interpello</p>", "https://example.org/", LOGGER))
+        while not started:
+            await asyncio.sleep(0)
+        assert len(batcher._tasks) == 1
+        await batcher.shutdown()
+        assert not batcher._tasks
+        result, = await asyncio.gather(submitted, return_exceptions=True)
+        assert isinstance(result, asyncio.CancelledError)
+
+    asyncio.run(scenario())
+
+
+def test_batcher_routes_results_back_by_document_id(monkeypatch):
+    monkeypatch.setattr(config, 'LLM_BATCH_MAX_DOCS', 3)
+    calls = []
+
+    async def generate(models, model_key, contents, *args, **kwargs):
+        calls.append(contents)
+        documents = [re.match(r"=== DOCUMENTO (\S+) \| URL di base: (\S+) ===", part).groups() for part in contents[1:]]
+        # Risultati in ordine inverso e senza il secondo documento: devono comunque tornare alla pagina giusta.
+        results = [{'id': doc_id, 'file_links': [base_url + "avviso.pdf"], 'gdrive_links': [], 'portal_links': []}
+                   for i, (doc_id, base_url) in enumerate(documents) if i != 1]
+        return _FakeResponse(json.dumps({'results': results[::-1]}))
+
+    monkeypatch.setattr(llm_processor, '_generate', generate)
+    batcher = llm_processor._UniversalAnalysisBatcher()
+    urls = [f"https://example.org/articolo-{i}/" for i in range(3)]
+
+    async def scenario():
+        return await asyncio.gather(*[batcher.submit({}, f"<p>interpello {i}</p>", url, LOGGER) for i, url in enumerate(urls)])
+
+    first, second, third = asyncio.run(scenario())
+    assert len(calls) == 1
+    assert first['file_links'] == [urls[0] + "avviso.pdf"]
+    assert second is None
+    assert third['file_links'] == [urls[2] + "avviso.pdf"]
+    assert batcher.batches == 1 and batcher.batched_docs == 2
+
+
+class _FakeResponse:
+    def __init__(self, text):
+        self.text = text
+
+
+def _extract_text_with(monkeypatch, generate):
+    monkeypatch.setenv('AINTERPELLI_NO_LLM_CACHE', '1')
+    monkeypatch.setattr(llm_processor, '_generate', generate)
+    return asyncio.run(llm_processor._extract_from_text({'fast': 'fast-model'}, 'fast', "Avviso", "test", LOGGER))
+
+
+def test_extraction_without_interpelli_is_an_empty_list(monkeypatch):
+    async def generate(*args, **kwargs):
+        return _FakeResponse("[]")
+
+    assert _extract_text_with(monkeypatch, generate) == []
+
+
+def test_extraction_error_is_none(monkeypatch):
+    async def generate(*args, **kwargs):
+        raise RuntimeError("503 Service Unavailable")
+
+    assert _extract_text_with(monkeypatch, generate) is None
@@ -0,0 +1,37 @@
+from datetime import date
+import pytest
+import llm_schemas
+
+
+@pytest.mark.parametrize("text", ["30/06/2026", "30/06/26", "30-06-2026", "30.06.2026", "2026-06-30", " 30 Giugno 2026 "])
+def test_parse_date_accepts_italian_and_iso_formats(text):
+    assert llm_schemas.parse_date(text) == date(2026, 6, 30)
+
+
+@pytest.mark.parametrize("text", ["31/02/2026", "fine anno scolastico", "30 juin 2026", "31 aprile 2026"])
+def test_parse_date_rejects_invalid_dates(text):
+    with pytest.raises(llm_schemas.InvalidValue):
+        llm_schemas.parse_date(text)
+
+
+def test_coercers():
+    assert llm_schemas.coerce_int("18 ore") == 18
+    assert llm_schemas.coerce_int(12.0) == 12
+    assert llm_schemas.coerce_int(" ") is None
+    for value in ("6+12", True, 7.5):
+        with pytest.raises(llm_schemas.InvalidValue):
+            llm_schemas.coerce_int(value)
+    assert llm_schemas.coerce_date("1 settembre 2025") == "01/09/2025"
+    assert llm_schemas.coerce_str("  Liceo \n Scientifico ") == "Liceo Scientifico"
+    assert llm_schemas.coerce_str("   ") is None
+
+
+def test_validate_interpello_reports_invalid_fields():
+    clean, invalid = llm_schemas.validate_interpello({
+        'nome_scuola': " IC Treviglio ", 'data_fine_incarico': "2026-06-30", 'numero_di_ore': "6+12",
+        'tipo_cattedra': {'tipo': "COE"}, 'note': "campo sconosciuto",
+    })
+    assert clean == {'nome_scuola': "IC Treviglio", 'data_fine_incarico': "30/06/2026", 'numero_di_ore': None,
+                     'tipo_cattedra': None}
+    assert invalid == {'numero_di_ore': "6+12", 'tipo_cattedra': {'tipo': "COE"}}
+    assert llm_schemas.validate_interpello("non un oggetto") == (None, {})
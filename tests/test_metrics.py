@@ -0,0 +1,49 @@
+import json
+import pytest
+import metrics
+
+
+def test_stage_timer_counts_failures_and_exceptions():
+    metrics.reset()
+    with metrics.timer('download'):
+        pass
+    with metrics.timer('download') as stage:
+        stage.fail()
+    with pytest.raises(RuntimeError):
+        with metrics.timer('download'):
+            raise RuntimeError("timeout")
+    stage = metrics.snapshot()['stages']['download']
+    assert stage['count'] == 3
+    assert stage['errors'] == 2
+
+
+def test_percentiles_and_queue_waits():
+    metrics.reset()
+    for i in range(1, 101):
+        metrics.observe('extraction', i / 100)
+    metrics.mark_enqueued('article_queue', "https://example.org/a")
+    metrics.mark_dequeued('article_queue', "https://example.org/a")
+    metrics.mark_dequeued('article_queue', "https://example.org/mai-entrato")
+    data = metrics.snapshot()
+    stage = data['stages']['extraction']
+    assert (stage['p50_seconds'], stage['p95_seconds'], stage['max_seconds']) == (0.5, 0.95, 1.0)
+    assert stage['buckets']['0.1'] == 10 and stage['buckets']['1'] == 100
+    assert data['queue_waits']['article_queue']['count'] == 1
+
+
+def test_export_writes_json_and_prometheus(tmp_path):
+    metrics.reset()
+    metrics.observe('db_write', 0.2)
+    metrics.observe('db_write', 3.0, error=True)
+    metrics.set_queue_depth('result_queue', 4)
+    json_path, prom_path = metrics.export(str(tmp_path))
+
+    with open(json_path, encoding='utf-8') as f:
+        assert json.load(f)['stages']['db_write']['errors'] == 1
+    with open(prom_path, encoding='utf-8') as f:
+        lines = f.read().splitlines()
+    assert 'ainterpelli_stage_duration_seconds_bucket{stage="db_write",le="0.25"} 1' in lines
+    assert 'ainterpelli_stage_duration_seconds_bucket{stage="db_write",le="+Inf"} 2' in lines
+    assert 'ainterpelli_stage_errors_total{stage="db_write"} 1' in lines
+    assert 'ainterpelli_queue_depth{queue="result_queue"} 4' in lines
+    assert not list(tmp_path.glob("*.tmp"))
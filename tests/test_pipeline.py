@@ -0,0 +1,124 @@
+import argparse
+import asyncio
+import os
+import socket
+import sqlite3
+import pytest
+import aiohttp.web
+import benchmark
+import cassette
+import config
+import database
+import document_ledger
+import http_store
+import llm_cache
+import llm_usage
+import run_checkpoint
+import scraper
+import ui
+
+BENCHMARK_ARGS = dict(
+    analysis_concurrency=5, link_concurrency=2, provinces=1, articles=20, pdf_ratio=0.5, drive_ratio=0.2,
+    scanned_ratio=0.2, shared_pdf_ratio=0.1, fast_latency=0.01, powerful_latency=0.02, error_rate=0.0,
+    quota_error_rate=0.0, keep_rate_limits=False, seed=1,
+)
+
+
+@pytest.fixture
+def offline_run(monkeypatch, tmp_path):
+    """Prepara una scansione del sito sintetico di benchmark.py in tmp_path, ripristinando config e ui alla fine."""
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setenv('AINTERPELLI_NO_LLM_CACHE', '1')
+    for module, names in (
+        (config, ('SITES_CONFIG', 'LINK_COLLECTION_CONCURRENCY', 'ARTICLE_ANALYSIS_CONCURRENCY', 'METRICS_DIR',
+                  'GEMINI_RATE_LIMITS', 'setup_gemini')),
+        (ui, ('get_provinces_to_scan', 'get_max_pages_to_scan', 'ask_yes_no')),
+        (scraper, ('GOOGLE_DRIVE_DOWNLOAD_URL',)),
+    ):
+        for name in names:
+            monkeypatch.setattr(module, name, getattr(module, name))
+    opened = []
+    create_connection = database.create_connection
+
+    def tracking_create_connection(*args, **kwargs):
+        conn = create_connection(*args, **kwargs)
+        opened.append(conn)
+        return conn
+
+    monkeypatch.setattr(database, 'create_connection', tracking_create_connection)
+
+    def run(workdir=tmp_path):
+        os.makedirs(workdir, exist_ok=True)
+        monkeypatch.chdir(workdir)
+        _close_stores()
+        args = argparse.Namespace(**BENCHMARK_ARGS)
+        return asyncio.run(asyncio.wait_for(benchmark._run_once(args, str(workdir)), timeout=60))
+
+    yield run, opened
+    _close_stores()
+
+
+def _close_stores():
+    for module in (document_ledger, http_store, llm_cache, llm_usage, run_checkpoint):
+        module.close()
+
+
+def test_writer_failure_stops_the_run_and_closes_the_connection(monkeypatch, offline_run):
+    run, opened = offline_run
+
+    def broken_insert(conn, rows, seen_articles=()):
+        raise sqlite3.OperationalError("disk I/O error")
+
+    monkeypatch.setattr(database, 'insert_interpelli_batch', broken_insert)
+    with pytest.raises(sqlite3.OperationalError):
+        run()
+    # La connessione della scansione (check_same_thread=False) deve essere stata chiusa.
+    scan_connections = [conn for conn in opened if conn is not None]
+    assert scan_connections
+    with pytest.raises(sqlite3.ProgrammingError):
+        scan_connections[0].execute("SELECT 1")
+
+
+def _interpelli(workdir):
+    conn = sqlite3.connect(str(workdir / database.DB_FILE))
+    try:
+        return sorted(conn.execute(f"SELECT {', '.join(database.INTERPELLO_COLUMNS)} FROM interpelli").fetchall(), key=repr)
+    finally:
+        conn.close()
+
+
+def test_recorded_run_replays_without_network_or_store_writes(monkeypatch, tmp_path, offline_run):
+    run, _ = offline_run
+    # La cassetta è indicizzata per URL: le due scansioni devono usare lo stesso indirizzo del sito sintetico.
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        port = sock.getsockname()[1]
+    tcp_site = aiohttp.web.TCPSite
+    monkeypatch.setattr(aiohttp.web, 'TCPSite', lambda runner, host, _port: tcp_site(runner, host, port))
+    cassette_path = str(tmp_path / "scansione.zip")
+
+    monkeypatch.setenv(cassette.RECORD_ENV_VAR, cassette_path)
+    recorded = run(tmp_path / "record")
+    assert recorded['articles'] == 20 and recorded['article_errors'] == 0
+
+    monkeypatch.delenv(cassette.RECORD_ENV_VAR)
+    monkeypatch.setenv(cassette.REPLAY_ENV_VAR, cassette_path)
+    # In riproduzione il sito non deve essere contattato: ogni richiesta riceverebbe un 500.
+    monkeypatch.setattr(benchmark, 'build_app', lambda site: aiohttp.web.Application(
+        middlewares=[aiohttp.web.middleware(lambda request, handler: _unexpected_request(request))]))
+    replayed = run(tmp_path / "replay")
+    monkeypatch.delenv(cassette.REPLAY_ENV_VAR)
+
+    assert replayed['articles'] == 20 and replayed['article_errors'] == 0
+    recorded_rows = _interpelli(tmp_path / "record")
+    assert recorded_rows and _interpelli(tmp_path / "replay") == recorded_rows
+    assert not (tmp_path / "replay" / http_store.BODY_FOLDER).exists()
+    store_file = tmp_path / "replay" / http_store.STORE_FILE
+    if store_file.exists():
+        conn = sqlite3.connect(str(store_file))
+        assert conn.execute("SELECT COUNT(*) FROM http_entries").fetchone()[0] == 0
+        conn.close()
+
+
+async def _unexpected_request(request):
+    raise aiohttp.web.HTTPInternalServerError(text=f"Richiesta inattesa in riproduzione: {request.path}")
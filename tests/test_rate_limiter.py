@@ -0,0 +1,16 @@
+import asyncio
+from rate_limiter import TokenBucketLimiter
+
+
+def test_limiter_survives_multiple_event_loops():
+    # 1000 token al secondo: svuotato il bucket, le chiamate successive attendono e si contendono il lock.
+    limiter = TokenBucketLimiter('fast', rpm=1000, tpm=60000)
+
+    async def use_limiter():
+        limiter._refill()
+        await limiter.acquire(int(limiter._tokens))
+        await asyncio.gather(*(limiter.acquire(20) for _ in range(3)))
+
+    asyncio.run(use_limiter())
+    asyncio.run(use_limiter())
+    assert limiter.status()['waits'] >= 4
@@ -0,0 +1,25 @@
+import database
+import run_checkpoint
+
+
+def test_permanently_failing_article_does_not_keep_the_run_open(tmp_path, monkeypatch):
+    monkeypatch.setattr(database, 'DB_FILE', str(tmp_path / "interpelli.sqlite"))
+    run_checkpoint.close()
+    try:
+        checkpoint = run_checkpoint.start_run(["Bergamo"], 2, True)
+        ok, broken = ("https://example.org/ok", "Bergamo"), ("https://example.org/404", "Bergamo")
+        checkpoint.record_page("Bergamo", 1, [ok, broken])
+        checkpoint.record_result(ok, [])
+        checkpoint.mark_done([ok])
+
+        for attempt in range(1, run_checkpoint.MAX_ARTICLE_ATTEMPTS + 1):
+            assert checkpoint.unfinished_count() == 1
+            resumed = run_checkpoint.find_interrupted_run()
+            resumed.record_failure(broken)
+            checkpoint = resumed
+
+        assert checkpoint.unfinished_count() == 0
+        assert checkpoint.failed_count() == 1
+        assert run_checkpoint.find_interrupted_run().is_failed(broken[0])
+    finally:
+        run_checkpoint.close()
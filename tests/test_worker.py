@@ -0,0 +1,46 @@
+import asyncio
+import logging
+import document_ledger
+import database
+import llm_processor
+import scraper
+import worker
+
+LOGGER = logging.getLogger(__name__)
+ARTICLE_URL = "https://bergamo.istruzionelombardia.gov.it/avviso-graduatorie/"
+DOC_URL = "https://bergamo.istruzionelombardia.gov.it/wp-content/uploads/avviso.pdf"
+
+
+def _run_article(monkeypatch, tmp_path, pdf_result):
+    monkeypatch.setattr(database, 'DB_FILE', str(tmp_path / "interpelli.sqlite"))
+    document_ledger.close()
+
+    async def get_page_html(session, url):
+        return "<main><p>Avviso</p></main>"
+
+    async def analyze(models, html_content, base_url, logger):
+        return {'file_links': [DOC_URL], 'gdrive_links': [], 'portal_links': [], 'extracted_data': None}
+
+    async def download(session, url, known_hash=None):
+        return b"%PDF-1.4 avviso senza interpelli"
+
+    async def process_pdf(models, pdf_bytes, source_name, logger):
+        return pdf_result
+
+    monkeypatch.setattr(scraper, 'get_page_html', get_page_html)
+    monkeypatch.setattr(scraper, 'download_direct_file', download)
+    monkeypatch.setattr(llm_processor, 'analyze_article_page_and_get_data_or_links', analyze)
+    monkeypatch.setattr(llm_processor, 'process_pdf_with_gemini', process_pdf)
+    try:
+        return asyncio.run(worker.process_single_article_worker(
+            asyncio.Semaphore(1), None, {}, ARTICLE_URL, "Bergamo", LOGGER))
+    finally:
+        document_ledger.close()
+
+
+def test_document_without_interpelli_completes_the_article(monkeypatch, tmp_path):
+    assert _run_article(monkeypatch, tmp_path, []) == []
+
+
+def test_failed_extraction_leaves_the_article_incomplete(monkeypatch, tmp_path):
+    assert _run_article(monkeypatch, tmp_path, None) is None
@@ -1,13 +1,9 @@
 import sys
 import time
 import asyncio
-from collections import defaultdict
+from itertools import groupby
 from rich.console import Console
 from rich.table import Table
-from reportlab.platypus import SimpleDocTemplate, Table as PdfTable, TableStyle, Paragraph, Spacer
-from reportlab.lib.styles import getSampleStyleSheet
-from reportlab.lib.pagesizes import landscape, letter
-from reportlab.lib import colors
 import config
 
 class SharedCounter:
@@ -28,18 +24,10 @@ class SharedCounter:
         async with self._lock:
             return self._value
 
-def print_results(rows):
-    if not rows:
-        print("\nNessun risultato trovato per i criteri selezionati.")
-        return
-
-    console = Console()
-    data_by_province = defaultdict(list)
-    for row in rows:
-        provincia = row[4]
-        data_by_province[provincia].append(row)
-
-    for provincia, province_rows in sorted(data_by_province.items()):
+def _print_page(console, rows):
+    # Le righe arrivano già ordinate: si raggruppano le righe consecutive della stessa provincia,
+    # così l'ordine della vista (es. la pertinenza nella ricerca testuale) resta invariato.
+    for provincia, province_rows in groupby(rows, key=lambda row: row[4]):
         table = Table(title=f"\n--- PROVINCIA: {provincia.upper()} ---", show_header=True, header_style="bold magenta", show_lines=True)
         table.add_column("ID", style="dim", width=5)
         table.add_column("Scuola", style="cyan", no_wrap=False, width=40)
@@ -57,53 +45,60 @@ def print_results(rows):
             )
         console.print(table)
 
-def export_to_pdf(rows):
+def print_results(pager):
+    """
+    Mostra i risultati di un database.InterpelliPager una pagina alla volta: solo la pagina corrente viene letta
+    dal database e disegnata, con navigazione avanti e indietro.
+    """
+    rows = pager.first_page()
     if not rows:
-        print("Nessun dato da esportare.")
+        print("\nNessun risultato trovato per i criteri selezionati.")
         return
 
-    timestamp = time.strftime("%Y%m%d-%H%M%S")
-    filename = f"report_interpelli_{timestamp}.pdf"
-    
-    doc = SimpleDocTemplate(filename, pagesize=landscape(letter))
-    elements = []
-    styles = getSampleStyleSheet()
-    
-    title = Paragraph("Report Interpelli", styles['h1'])
-    elements.append(title)
-    
-    data_by_province = defaultdict(list)
-    for row in rows:
-        provincia = row[4]
-        data_by_province[provincia].append(row)
-
-    for provincia, province_rows in sorted(data_by_province.items()):
-        elements.append(Spacer(1, 24))
-        prov_title = Paragraph(f"Provincia: {provincia.upper()}", styles['h2'])
-        elements.append(prov_title)
-        elements.append(Spacer(1, 12))
-
-        data = [["ID", "Scuola", "Città", "Fine Incarico", "CDC", "Ore", "Cattedra"]]
-        
-        for row in province_rows:
-            (id_interpello, nome_scuola, _, citta, _, data_fine, cdc, ore, cattedra, _, _) = row
-            data.append([
-                str(id_interpello), str(nome_scuola or 'N/D'), str(citta or 'N/D'),
-                str(data_fine or 'N/D'), str(cdc or 'N/D'), str(ore or 'N/D'), str(cattedra or 'N/D')
-            ])
-
-        pdf_table = PdfTable(data)
-        style = TableStyle([
-            ('BACKGROUND', (0,0), (-1,0), colors.grey), ('TEXTCOLOR',(0,0),(-1,0),colors.whitesmoke),
-            ('ALIGN', (0,0), (-1,-1), 'CENTER'), ('FONTNAME', (0,0), (-1,0), 'Helvetica-Bold'),
-            ('BOTTOMPADDING', (0,0), (-1,0), 12), ('BACKGROUND', (0,1), (-1,-1), colors.beige),
-            ('GRID', (0,0), (-1,-1), 1, colors.black)
-        ])
-        pdf_table.setStyle(style)
-        elements.append(pdf_table)
-    
-    doc.build(elements)
-    print(f"\nTabella esportata con successo nel file: {filename}")
+    console = Console()
+    render = True
+    while True:
+        if render:
+            _print_page(console, rows)
+        render = False
+        if not pager.has_next and not pager.has_previous:
+            return
+        commands = []
+        if pager.has_next:
+            commands.append("[Invio] pagina successiva")
+        if pager.has_previous:
+            commands.append("[p] precedente")
+        commands.append("[q] torna al menu")
+        answer = input(f"\nPagina {pager.page_number} - {', '.join(commands)}: ").strip().lower()
+        if answer == 'q':
+            return
+        if answer == 'p':
+            new_rows = pager.previous_page()
+        elif answer == '':
+            new_rows = pager.next_page()
+        else:
+            print("Comando non valido.")
+            continue
+        if new_rows is None:
+            print("Non ci sono altre pagine in questa direzione.")
+            continue
+        rows, render = new_rows, True
+
+def ask_export_format():
+    """Chiede il formato di esportazione; restituisce 'pdf', 'csv', 'jsonl' o None per annullare."""
+    formats = {'1': 'pdf', '2': 'csv', '3': 'jsonl'}
+    while True:
+        print("\n--- Formato di Esportazione ---")
+        print(" 1: PDF")
+        print(" 2: CSV")
+        print(" 3: JSONL (un oggetto JSON per riga)")
+        print(" 0: Annulla")
+        choice = input("Scegli un formato: ").strip()
+        if choice == '0':
+            return None
+        if choice in formats:
+            return formats[choice]
+        print("Scelta non valida.")
 
 async def display_progress(active_tasks_counter, semaphore_limit, phase_name, all_tasks_future):
     spinner_chars = ['|', '/', '-', '\\']
@@ -195,4 +190,16 @@ def get_max_pages_to_scan():
             else:
                 print("Per favore, inserisci un numero maggiore di zero.")
         except ValueError:
-            print("Input non valido.")
\ No newline at end of file
+            print("Input non valido.")
+
+def ask_yes_no(question, default=True):
+    suffix = "[S/n]" if default else "[s/N]"
+    while True:
+        answer = input(f"\n{question} {suffix}: ").strip().lower()
+        if not answer:
+            return default
+        if answer in ('s', 'si', 'sì', 'y', 'yes'):
+            return True
+        if answer in ('n', 'no'):
+            return False
+        print("Risposta non valida. Inserisci 's' o 'n'.")
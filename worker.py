@@ -1,16 +1,29 @@
+import config
+import database
 import scraper
 import llm_processor
-import os
+import html_reducer
+import document_ledger
+import llm_usage
+import metrics
 import asyncio
 
+# Numero massimo di articoli i cui risultati vengono scritti in un'unica transazione.
+WRITE_BATCH_ARTICLES = 50
+
 async def fetch_and_extract_links_worker(semaphore, session, models, url, provincia, logger):
     """Worker per la Fase 1: recupera HTML di una pagina elenco e restituisce (link, provincia)."""
     async with semaphore:
+        llm_usage.set_context('raccolta_link', provincia)
         try:
-            html_content = await scraper.get_page_html(session, url)
-            if not html_content:
-                return []
-            article_links = await llm_processor.extract_page_links_with_gemini(models, html_content, url, logger)
+            with metrics.timer('listing_fetch') as stage:
+                html_content = await scraper.get_page_html(session, url)
+                if not html_content:
+                    stage.fail()
+                    return []
+            html_content = html_reducer.reduce_for_llm(html_content, url, logger)
+            with metrics.timer('llm_link_extraction'):
+                article_links = await llm_processor.extract_page_links_with_gemini(models, html_content, url, logger)
             # Associa immediatamente la provincia corretta a ogni link trovato
             return [(link, provincia) for link in article_links]
         except Exception as e:
@@ -18,65 +31,243 @@ async def fetch_and_extract_links_worker(semaphore, session, models, url, provin
             return []
 
 
+async def crawl_province_worker(semaphore, session, models, provincia, max_pages, known_urls, scheduled_urls, article_queue, logger, checkpoint=None):
+    """
+    Produttore della pipeline: scorre in ordine le pagine elenco di una provincia e mette in `article_queue`
+    ogni (link, provincia) nuovo appena scoperto. La paginazione si interrompe alla prima pagina vuota
+    o che contiene solo articoli già presenti in `known_urls`. Restituisce il numero di articoli accodati.
+    Con un `checkpoint`, le pagine già lette nella scansione ripresa non vengono riscaricate
+    e gli articoli già salvati non vengono riaccodati.
+    """
+    base_url = config.SITES_CONFIG[provincia]['url']
+    queued = 0
+    for page_num in range(1, max_pages + 1):
+        fresh_links = checkpoint.get_page(provincia, page_num) if checkpoint else None
+        if fresh_links is None and llm_usage.budget_exhausted():
+            logger.warning(f"Budget LLM esaurito: interrompo la raccolta dei link per {provincia} a pagina {page_num}.")
+            break
+        if fresh_links is not None:
+            logger.info(f"Pagina {page_num} di {provincia} già letta nella scansione interrotta: {len(fresh_links)} articoli nuovi.")
+        else:
+            current_url = f"{base_url.rstrip('/')}/page/{page_num}/" if page_num > 1 else base_url
+            page_links = await fetch_and_extract_links_worker(semaphore, session, models, current_url, provincia, logger)
+            if not page_links:
+                # Le pagine vuote (o non lette per un errore) non vanno nel checkpoint: una ripresa le riprova.
+                logger.info(f"Nessun articolo trovato a pagina {page_num} per {provincia}: fine della paginazione.")
+                break
+            fresh_links = [(link, prov) for link, prov in page_links if link not in known_urls]
+            if checkpoint:
+                checkpoint.record_page(provincia, page_num, fresh_links)
+        for link, prov in fresh_links:
+            if checkpoint and (checkpoint.is_done(link) or checkpoint.is_failed(link)):
+                continue
+            # `scheduled_urls` è condiviso tra le province: evita di accodare due volte lo stesso articolo.
+            if link not in scheduled_urls:
+                scheduled_urls.add(link)
+                metrics.mark_enqueued('article_queue', link)
+                await article_queue.put((link, prov))
+                queued += 1
+        if not fresh_links:
+            logger.info(f"La pagina {page_num} di {provincia} contiene solo articoli già noti: interrompo la paginazione.")
+            break
+    return queued
+
+
+async def article_analysis_consumer(semaphore, session, models, article_queue, result_queue, logger, checkpoint=None):
+    """
+    Consumatore della pipeline: analizza gli articoli dalla coda e inoltra (articolo, risultati) al writer.
+    I risultati sono salvati nel `checkpoint` prima di essere inoltrati; un articolo già analizzato
+    in una scansione interrotta viene inoltrato senza ripetere l'analisi.
+    """
+    while True:
+        article = await article_queue.get()
+        try:
+            if article is None:
+                return
+            url, prov = article
+            metrics.mark_dequeued('article_queue', url)
+            results = checkpoint.get_result(url) if checkpoint else None
+            if results is not None:
+                logger.info(f"Articolo {url} già analizzato nella scansione interrotta: riuso i risultati salvati.")
+            elif llm_usage.budget_exhausted():
+                # L'articolo resta in sospeso nel checkpoint e potrà essere ripreso.
+                logger.info(f"Budget LLM esaurito: analisi di {url} rimandata.")
+            else:
+                with metrics.timer('article') as stage:
+                    results = await process_single_article_worker(semaphore, session, models, url, prov, logger)
+                    if results is None:
+                        stage.fail()
+                if checkpoint and results is not None:
+                    checkpoint.record_result(article, results)
+                elif checkpoint and not llm_usage.budget_exhausted():
+                    # Con il budget esaurito l'articolo è solo rimandato: non conta come tentativo fallito.
+                    checkpoint.record_failure(article)
+            metrics.mark_enqueued('result_queue', url)
+            await result_queue.put((article, results))
+        finally:
+            article_queue.task_done()
+
+
+async def database_writer_consumer(db_conn, result_queue, logger, checkpoint=None):
+    """
+    Ultimo stadio della pipeline: raccoglie i risultati disponibili in coda (fino a WRITE_BATCH_ARTICLES articoli)
+    e li scrive in un'unica transazione, fuori dall'event loop, insieme alle voci del ledger.
+    Gli articoli salvati vengono segnati come completati nel `checkpoint`.
+    Restituisce i conteggi totali {'inserted', 'duplicates', 'rejected'}.
+    """
+    totals = {'inserted': 0, 'duplicates': 0, 'rejected': 0}
+    done = False
+    while not done:
+        items = [await result_queue.get()]
+        while len(items) < WRITE_BATCH_ARTICLES and not result_queue.empty():
+            items.append(result_queue.get_nowait())
+        try:
+            rows, analysed_articles = [], []
+            for item in items:
+                if item is None:
+                    done = True
+                    continue
+                article, results = item
+                metrics.mark_dequeued('result_queue', article[0])
+                if results is None:
+                    # Analisi fallita: l'articolo non entra nel ledger e verrà ritentato alla prossima scansione.
+                    continue
+                rows.extend(results)
+                analysed_articles.append(article)
+            if analysed_articles:
+                with metrics.timer('db_write') as stage:
+                    counts = await asyncio.to_thread(database.insert_interpelli_batch, db_conn, rows, analysed_articles)
+                    if not counts:
+                        stage.fail()
+                if counts:
+                    if checkpoint:
+                        checkpoint.mark_done(analysed_articles)
+                    for key in totals:
+                        totals[key] += counts[key]
+                    logger.info(f"Lotto salvato ({len(analysed_articles)} articoli): {counts['inserted']} inseriti, "
+                                f"{counts['duplicates']} duplicati, {counts['rejected']} scartati.")
+        finally:
+            for _ in items:
+                result_queue.task_done()
+    return totals
+
+
+async def _download_and_extract(models, session, download, doc_url, logger):
+    """
+    Scarica ed estrae un documento con la funzione `download` dello scraper. Se l'URL è già stato elaborato la
+    richiesta è condizionale: con un 304 si riusano i dati salvati senza scaricare il file. Restituisce la lista dei
+    dati (vuota se il documento non contiene interpelli) o None se il download o l'estrazione falliscono.
+    """
+    known = document_ledger.lookup_url(doc_url)
+    with metrics.timer('download') as stage:
+        pdf_bytes = await download(session, doc_url, known_hash=known[0] if known else None)
+        if not pdf_bytes:
+            stage.fail()
+    if pdf_bytes is scraper.NOT_MODIFIED:
+        logger.info(f"Documento {doc_url} invariato dall'ultima elaborazione: riuso i dati salvati.")
+        document_ledger.note_not_modified(doc_url, known[0])
+        return known[1]
+    if not pdf_bytes:
+        return None
+    return await _extract_document(models, pdf_bytes, doc_url, logger)
+
+
+async def _extract_document(models, pdf_bytes, doc_url, logger):
+    """Estrae i dati da un documento scaricato, riusando il risultato se lo stesso contenuto è già stato elaborato."""
+    with metrics.timer('extraction') as stage:
+        extracted_data = await document_ledger.get_or_extract(
+            doc_url, pdf_bytes,
+            lambda: llm_processor.process_pdf_with_gemini(models, pdf_bytes, doc_url, logger),
+            logger
+        )
+        if extracted_data is None:
+            stage.fail()
+    return extracted_data
+
+
 async def process_single_article_worker(semaphore, session, models, article_url, provincia, logger):
-    """Worker per la Fase 2: analizza un singolo articolo."""
+    """
+    Worker per la Fase 2: analizza un singolo articolo.
+    Restituisce la lista dei dati estratti, oppure None se la pagina non è stata recuperata o analizzata
+    o se anche un solo documento collegato non è stato scaricato o estratto: l'articolo resta così fuori dal
+    ledger e viene ritentato alla scansione successiva.
+    """
     async with semaphore:
         try:
             logger.info(f"Task per {article_url} avviato.")
+            llm_usage.set_context('analisi_articolo', provincia)
+            llm_usage.reset_refused()
             all_extracted_data = []
+            failed_links = []
 
-            html_content_article = await scraper.get_page_html(session, article_url)
-            if not html_content_article:
-                logger.warning(f"Impossibile recuperare l'HTML dell'articolo: {article_url}")
-                return all_extracted_data
+            with metrics.timer('article_fetch') as stage:
+                html_content_article = await scraper.get_page_html(session, article_url)
+                if not html_content_article:
+                    stage.fail()
+                    logger.warning(f"Impossibile recuperare l'HTML dell'articolo: {article_url}")
+                    return None
+            html_content_article = html_reducer.reduce_for_llm(html_content_article, article_url, logger)
 
-            analysis_result = await llm_processor.analyze_article_page_and_get_data_or_links(models, html_content_article, article_url, logger)
-            if not analysis_result:
-                logger.error(f"Analisi della pagina fallita per {article_url}")
-                return all_extracted_data
+            with metrics.timer('universal_analysis') as stage:
+                analysis_result = await llm_processor.analyze_article_page_and_get_data_or_links(models, html_content_article, article_url, logger)
+                if not analysis_result:
+                    stage.fail()
+                    logger.error(f"Analisi della pagina fallita per {article_url}")
+                    return None
 
             file_links = analysis_result.get("file_links", [])
             gdrive_links = analysis_result.get("gdrive_links", [])
             portal_links = analysis_result.get("portal_links", [])
             extracted_data_from_html = analysis_result.get("extracted_data")
 
+            llm_usage.set_context('estrazione_documento', provincia)
             if file_links:
                 for doc_url in file_links:
-                    file_path = await scraper.download_direct_file(session, doc_url)
-                    if file_path:
-                        extracted_data = await llm_processor.process_pdf_with_gemini(models, file_path, logger)
-                        if extracted_data:
-                            items = extracted_data if isinstance(extracted_data, list) else [extracted_data]
-                            for item in items:
-                                item['provincia'] = provincia
-                                item['url_sorgente'] = doc_url
-                                all_extracted_data.append(item)
-                        os.remove(file_path)
+                    extracted_data = await _download_and_extract(models, session, scraper.download_direct_file, doc_url, logger)
+                    if extracted_data is None:
+                        failed_links.append(doc_url)
+                        continue
+                    items = extracted_data if isinstance(extracted_data, list) else [extracted_data]
+                    for item in items:
+                        item['provincia'] = provincia
+                        item['url_sorgente'] = doc_url
+                        all_extracted_data.append(item)
             
             if gdrive_links:
                 for doc_url in gdrive_links:
-                    file_path = await scraper.download_google_drive_file(session, doc_url)
-                    if file_path:
-                        extracted_data = await llm_processor.process_pdf_with_gemini(models, file_path, logger)
-                        if extracted_data:
-                            items = extracted_data if isinstance(extracted_data, list) else [extracted_data]
-                            for item in items:
-                                item['provincia'] = provincia
-                                item['url_sorgente'] = doc_url
-                                all_extracted_data.append(item)
-                        os.remove(file_path)
+                    extracted_data = await _download_and_extract(models, session, scraper.download_google_drive_file, doc_url, logger)
+                    if extracted_data is None:
+                        failed_links.append(doc_url)
+                        continue
+                    items = extracted_data if isinstance(extracted_data, list) else [extracted_data]
+                    for item in items:
+                        item['provincia'] = provincia
+                        item['url_sorgente'] = doc_url
+                        all_extracted_data.append(item)
 
+            llm_usage.set_context('estrazione_portale', provincia)
             if portal_links:
                 for portal_url in portal_links:
-                    portal_html = await scraper.get_page_html(session, portal_url)
-                    if portal_html:
+                    with metrics.timer('portal_fetch') as stage:
+                        portal_html = await scraper.get_page_html(session, portal_url)
+                        if not portal_html:
+                            stage.fail()
+                    if not portal_html:
+                        failed_links.append(portal_url)
+                        continue
+                    portal_html = html_reducer.reduce_for_llm(portal_html, portal_url, logger)
+                    with metrics.timer('extraction') as stage:
                         extracted_data = await llm_processor.extract_data_from_html(models, portal_html, logger)
-                        if extracted_data:
-                            items = extracted_data if isinstance(extracted_data, list) else [extracted_data]
-                            for item in items:
-                                item['provincia'] = provincia
-                                item['url_sorgente'] = portal_url
-                                all_extracted_data.append(item)
+                        if extracted_data is None:
+                            stage.fail()
+                    if extracted_data is None:
+                        failed_links.append(portal_url)
+                        continue
+                    items = extracted_data if isinstance(extracted_data, list) else [extracted_data]
+                    for item in items:
+                        item['provincia'] = provincia
+                        item['url_sorgente'] = portal_url
+                        all_extracted_data.append(item)
             
             if extracted_data_from_html:
                 items = extracted_data_from_html if isinstance(extracted_data_from_html, list) else [extracted_data_from_html]
@@ -84,8 +275,17 @@ async def process_single_article_worker(semaphore, session, models, article_url,
                     item['provincia'] = provincia
                     item['url_sorgente'] = article_url
                     all_extracted_data.append(item)
-            
+
+            if failed_links:
+                # Risultato parziale: non si salva nulla, così l'articolo non entra nel ledger e verrà ritentato.
+                logger.warning(f"Articolo {article_url} incompleto, {len(failed_links)} documenti non elaborati "
+                               f"({', '.join(failed_links)}): verrà ritentato alla prossima scansione.")
+                return None
+            if llm_usage.calls_refused():
+                # Alcune estrazioni sono state saltate: l'articolo non viene salvato come completo.
+                logger.warning(f"Budget LLM esaurito durante l'analisi di {article_url}: risultati non salvati.")
+                return None
             return all_extracted_data
         except Exception as e:
             logger.error(f"Errore imprevisto nel worker di analisi articolo per {article_url}: {e}")
-            return []
\ No newline at end of file
+            return None
\ No newline at end of file